@@ -0,0 +1,49 @@
+# Title : Batch Parity Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that get_matches gives every citation the result it gets when matched on its own, whatever
+#else is in the batch. The benchmark fixture's citations are matched together with copies that give
+#the author fields in another order, |first= before |last=, shuffled into one batch, with and without
+#the direct lookup.
+#Run from the repository root: python benchmarks/batch_parity.py
+
+import logging
+import os
+import random
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+from store_check import same
+
+from wiki2ia import get_matches
+
+_NAME = re.compile(r'\|\s*(first|last)(\d?)\s*=[^|}]*')
+
+
+def reordered(cite_string):
+    '''Output : (str) cite_string with its first and last name fields in reverse order, None when it has fewer than two'''
+    names = [match.group() for match in _NAME.finditer(cite_string)]
+    if len(names) < 2:
+        return None
+    rest = _NAME.sub('', cite_string).rstrip().rstrip('}')
+    return rest + ' ' + ' '.join(name.strip() for name in reversed(names)) + '}}'
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    citations = list(fixture['citations'])
+    citations += [variant for variant in map(reordered, fixture['citations']) if variant is not None]
+    random.Random(0).shuffle(citations)
+
+    for direct_lookup in [True, False]:
+        for all_results in [False, True]:
+            alone = [get_matches({}, [cite_string], log_level = 'error', session = FakeSession(fixture), direct_lookup = direct_lookup, all_results = all_results)[0] for cite_string in citations]
+            batch = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), direct_lookup = direct_lookup, all_results = all_results)
+            differ = [cite_string for cite_string, a, b in zip(citations, alone, batch) if not same(a, b)]
+            assert not differ, f'direct_lookup={direct_lookup} all_results={all_results}: {len(differ)} of {len(citations)} citations differ in a batch, first: {differ[0][:70]}'
+            print(f'direct_lookup={direct_lookup!s:<5} all_results={all_results!s:<5} same results for {len(citations)} citations alone and in one batch')
@@ -0,0 +1,119 @@
+# Title : Candidate Blocking Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks blocking.Blocker on the benchmark fixture's large searches, the ones with between 200 and 650
+#candidates. For each, the cited book has to survive the pruning, searches with cap results or more
+#have to be paged through, stopping right after the max_candidates-th hit with the citation's title, and
+#get_matches with the blocker has to predict the cited book a match, as it does without the blocker when
+#the search is listed. Run with the default cap, where only the largest search is paged, and with a low
+#cap, where all of them are, and with and without a year window.
+#Run from the repository root: python benchmarks/blocking_check.py
+
+import logging
+import os
+import re
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import LARGE_QUERIES, FakeSearch, FakeSession, load_fixture
+
+from blocking import Blocker
+from normalize import clean_title
+from utils import search_hits
+from wiki2ia import get_matches, parse_citation
+
+
+class CountingSearch(FakeSearch):
+    '''FakeSearch that counts the hits read from it'''
+
+    def __init__(self, hits, num_found):
+        super().__init__(hits, num_found)
+        self.read = 0
+
+    def iter_as_results(self):
+        for hit in self._hits:
+            self.read += 1
+            yield hit
+
+
+class PagingSession(FakeSession):
+    '''FakeSession that keeps the searches it answered, to count the hits read from each'''
+
+    def __init__(self, fixture):
+        super().__init__(fixture)
+        self.answered = []
+
+    def search_items(self, query, fields = None, **kwargs):
+        search = super().search_items(query, fields = fields, **kwargs)
+        search = CountingSearch(search._hits, search.num_found)
+        self.answered.append(search)
+        return search
+
+
+def cited_book(fixture, cite_book_dict):
+    '''Output : (str) identifier of the book the citation cites, the one item of its title search the fixture did not add as a look alike'''
+    title = clean_title(cite_book_dict['title_wiki'])
+    key = re.sub(r'[^a-z0-9]', '', title)[:16]
+    identifiers, _ = FakeSession(fixture).find(f'collection:internetarchivebooks AND title:{title}')
+    books = [identifier for identifier in identifiers if not re.fullmatch(key + r'[0-9]{8}', identifier)]
+    assert len(books) == 1, f'{title}: {books}'
+    return books[0]
+
+
+def stop(blocker, cite_book_dict, hits):
+    '''Output : (int) hits paging has to read, up to the max_candidates-th that no later hit can outrank'''
+    key = blocker.citation_key(cite_book_dict)
+    best = [i for i, hit in enumerate(hits[:blocker.max_scan]) if blocker.score(key, hit) == (1.0, 1.0)]
+    return best[blocker.max_candidates - 1] + 1 if len(best) >= blocker.max_candidates else min(len(hits), blocker.max_scan)
+
+
+def matched(result):
+    '''Output : (set) identifiers of the candidates of a get_matches result with all_results that were predicted a match'''
+    if not isinstance(result, dict):
+        return set()
+    return set(candidate['url_ia'].rsplit('/', 1)[-1] for candidate in result.values() if candidate['match'])
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    large = []
+    for cite_string in fixture['citations']:
+        cite_book_dict = parse_citation(cite_string)
+        if isinstance(cite_book_dict.get('title_wiki'), str) and clean_title(cite_book_dict['title_wiki']) in LARGE_QUERIES:
+            large.append((cite_string, cite_book_dict))
+    assert len(large) == len(LARGE_QUERIES), 'a large query has no citation'
+
+    for cap in [500, 100]:
+        for blocker in [Blocker(), Blocker(year_window = 5)]:
+            paged = early = 0
+            for cite_string, cite_book_dict in large:
+                title = clean_title(cite_book_dict['title_wiki'])
+                book = cited_book(fixture, cite_book_dict)
+                session = PagingSession(fixture)
+                hits, num_found = search_hits(session, f'collection:internetarchivebooks AND title:{title}', cite_book_dict, cap, blocker = blocker)
+                assert num_found == LARGE_QUERIES[title]
+                assert hits is not None and len(hits) <= blocker.max_candidates, f'{title}: {None if hits is None else len(hits)} hits kept'
+                assert book in [hit['identifier'] for hit in hits], f'{title}: the cited book {book} was pruned'
+                if num_found >= cap:
+                    #the first search only counts, the second is the listing paged through
+                    assert len(session.answered) == 2, f'{title}: {len(session.answered)} searches'
+                    read = session.answered[-1].read
+                    assert read == stop(blocker, cite_book_dict, session.answered[-1]._hits), f'{title}: {read} of {num_found} hits read'
+                    paged += 1
+                    early += read < num_found
+                    print(f'cap {cap:<4} year_window {str(blocker.year_window):<5} {title:<35} {num_found} found, paged, {read} read, {len(hits)} kept')
+                else:
+                    print(f'cap {cap:<4} year_window {str(blocker.year_window):<5} {title:<35} {num_found} found, listed, {len(hits)} kept')
+            assert paged == sum(n >= cap for n in LARGE_QUERIES.values()) and early > 0, f'{paged} searches paged, {early} stopped early'
+
+            cite_strings = [cite_string for cite_string, _ in large]
+            expected = get_matches({}, cite_strings, cap = cap, log_level = 'error', session = FakeSession(fixture), all_results = True, refine = False, direct_lookup = False)
+            results = get_matches({}, cite_strings, cap = cap, log_level = 'error', session = FakeSession(fixture), all_results = True, refine = False, direct_lookup = False, blocker = blocker)
+            for (cite_string, cite_book_dict), without, blocked in zip(large, expected, results):
+                book = cited_book(fixture, cite_book_dict)
+                assert book in matched(blocked), f'{cite_string[:70]}: the cited book {book} is not matched with the blocker'
+                assert book in matched(without) or not isinstance(without, dict), f'{cite_string[:70]}: the cited book {book} is not matched without the blocker'
+            print(f'cap {cap:<4} year_window {str(blocker.year_window):<5} get_matches matches the cited book of all {len(large)} citations with the blocker, {sum(not isinstance(r, dict) for r in expected)} over cap without it')
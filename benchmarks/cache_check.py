@@ -0,0 +1,99 @@
+# Title : Metadata Cache Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks cache.DiskCache: entries expire after ttl, max_entries holds after every put with the oldest
+#entries evicted first, a get writes nothing, and two processes writing and reading one file at the
+#same time see each other's entries with the bound still held. Then times gets and puts.
+#Run from the repository root: python benchmarks/cache_check.py
+
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache import DiskCache
+
+
+def fill(path, worker, n, max_entries):
+    '''puts n entries of its own and reads back the other worker's, run in a process of its own'''
+    cache = DiskCache(path, max_entries = max_entries)
+    for i in range(n):
+        cache.put(f'{worker}-{i}', {'worker' : worker, 'i' : i})
+        cache.get(f'{1 - worker}-{i}')
+        assert max_entries is None or len(cache) <= max_entries
+    cache.close()
+
+
+def shared(path, n, max_entries):
+    '''Output : (DiskCache) the cache two processes filled at the same time'''
+    processes = [multiprocessing.Process(target = fill, args = (path, worker, n, max_entries)) for worker in [0, 1]]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0, 'a worker failed'
+    return DiskCache(path, max_entries = max_entries)
+
+
+if __name__ == '__main__':
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = DiskCache(os.path.join(tmp, 'ttl.sqlite'), ttl = 0.2)
+        cache.put('a', {'title' : 'A'})
+        assert cache.get('a') == {'title' : 'A'}
+        time.sleep(0.3)
+        assert cache.get('a') is None
+        cache.evict()
+        assert len(cache) == 0
+        print('ttl          entries expire and evict() drops them')
+
+        cache = DiskCache(os.path.join(tmp, 'bound.sqlite'), max_entries = 10)
+        for i in range(250):
+            cache.put(str(i), i)
+            assert len(cache) <= 10, f'{len(cache)} entries after {i + 1} puts'
+        assert [cache.get(str(i)) for i in range(240, 250)] == list(range(240, 250)) and cache.get('239') is None
+        cache.put('245', 'again')
+        assert len(cache) == 10 and cache.get('245') == 'again'
+        count = sqlite3.connect(cache.path).execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        assert count == len(cache), f'{count} rows, size table says {len(cache)}'
+        print('max_entries  10 entries after every one of 250 puts, the 10 newest kept')
+
+        before = os.path.getmtime(cache.path + '-wal')
+        time.sleep(0.05)
+        for i in range(1000):
+            cache.get(str(240 + i % 10))
+        assert os.path.getmtime(cache.path + '-wal') == before, 'a get wrote to the database'
+        print('get          reads only')
+
+        path = os.path.join(tmp, 'earlier.sqlite')
+        conn = sqlite3.connect(path, isolation_level = None)
+        conn.execute('CREATE TABLE metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored REAL NOT NULL, accessed REAL NOT NULL)')
+        conn.executemany('INSERT INTO metadata VALUES (?, ?, ?, ?)', [(str(i), str(i), i, i) for i in range(20)])
+        conn.close()
+        cache = DiskCache(path, max_entries = 15)
+        assert len(cache) == 20 and cache.get('19') == 19
+        cache.put('new', 0)
+        assert len(cache) == 15 and cache.get('5') is None and cache.get('6') == 6
+        print('earlier file without a size table is counted and bounded on the next put')
+
+        cache = shared(os.path.join(tmp, 'shared.sqlite'), 300, None)
+        assert len(cache) == 600 and all(cache.get(f'{worker}-{i}') == {'worker' : worker, 'i' : i} for worker in [0, 1] for i in range(300))
+        cache = shared(os.path.join(tmp, 'shared_bound.sqlite'), 300, 50)
+        count = sqlite3.connect(cache.path).execute('SELECT COUNT(*) FROM metadata').fetchone()[0]
+        assert len(cache) == count == 50, f'{count} rows, size table says {len(cache)}'
+        print('processes    two processes share one file, 600 entries unbounded and 50 of 600 bounded')
+
+        cache = DiskCache(os.path.join(tmp, 'time.sqlite'), max_entries = 5000)
+        start = time.perf_counter()
+        for i in range(10000):
+            cache.put(str(i), {'title' : f'title {i}', 'creator' : 'Smith, John'})
+        put_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for i in range(10000):
+            cache.get(str(i))
+        get_time = time.perf_counter() - start
+        print(f'timing       put {put_time / 10000 * 1e6:.0f} us, get {get_time / 10000 * 1e6:.0f} us, {cache.stats()}')
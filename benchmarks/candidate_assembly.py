@@ -0,0 +1,60 @@
+# Title : Candidate Assembly Micro-benchmark
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Compares the columnar utils.assemble_candidates with the old concat-per-row loop, and checks that
+#clean_data gives the same frame for both, combining the author fields of the old frame itself.
+#Run from the repository root: python benchmarks/candidate_assembly.py
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import legacy
+from utils import assemble_candidates, clean_data
+
+
+def make_records(n):
+    return [
+        {
+            'title' : f'the eighth land volume {i}',
+            'creator' : ['Barthel, Thomas S.', 'Other, A.'] if i % 3 == 0 else 'Barthel, Thomas S.',
+            'publisher' : 'Honolulu : University Press of Hawaii',
+            'date' : str(1900 + i % 100),
+            'year' : str(1900 + i % 100),
+            'identifier-access' : f'http://archive.org/details/eighthland{i:04d}'
+        }
+        for i in range(n)
+    ]
+
+
+cite_book_dict = {
+    'last_wiki' : 'Barthel',
+    'first_wiki' : 'Thomas S.',
+    'title_wiki' : 'The Eighth Land: The Polynesian Settlement of Easter Island',
+    'publisher_wiki' : ' [[University of Hawaii]]',
+    'date_wiki' : np.nan
+}
+
+search_query = 'collection:internetarchivebooks AND title:the eighth land the polynesian settlement of easter island'
+
+if __name__ == '__main__':
+    print(f"{'candidates':>10} {'concat ms':>10} {'columnar ms':>12} {'speedup':>8}")
+    for n in [50, 200, 500]:
+        records = make_records(n)
+
+        old = legacy.assemble_candidates(search_query, records, cite_book_dict)
+        new = assemble_candidates(search_query, records, cite_book_dict)
+        #the old loop left combining the authors to clean_data
+        pd.testing.assert_frame_equal(old.reset_index(drop = True), new.drop(columns = 'author_wiki'))
+        pd.testing.assert_frame_equal(clean_data(old.reset_index(drop = True)), clean_data(new.copy()), check_like = True)
+
+        repeat = 3 if n > 200 else 10
+        old_time = min(timeit.repeat(lambda: legacy.assemble_candidates(search_query, records, cite_book_dict), number = 1, repeat = repeat))
+        new_time = min(timeit.repeat(lambda: assemble_candidates(search_query, records, cite_book_dict), number = 1, repeat = repeat))
+        print(f'{n:>10} {old_time * 1000:>10.1f} {new_time * 1000:>12.2f} {old_time / new_time:>7.0f}x')
@@ -0,0 +1,88 @@
+# Title : Match Core Parity Check and Benchmark
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that core.feature_matrix gives the feature values of features.create_features for random
+#citations and candidates, and that get_match returns what get_matches returns for every citation of
+#the benchmark fixture, values and types, also when it scores the candidates chunk by chunk with a
+#stop_threshold no candidate reaches. For that, some items get dates clean_year cannot read, so a chunk
+#can have no year when the column of all the candidates has some. Then times both and counts the requests iter_matches saves when
+#it stops at a confident match.
+#Run from the repository root: python benchmarks/core_parity.py
+
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from feature_parity import creators, dates, publishers, titles, wiki_dates, wiki_names, wiki_publishers, wiki_titles
+from replay import FakeSession, load_fixture
+from store_check import same
+
+from core import CitationFields, build_candidates, feature_matrix, iter_matches, match_citation
+from features import create_features
+from utils import assemble_candidates, clean_data
+from wiki2ia import MODEL_FEATURES, get_match, get_matches
+
+
+def check_features(seed, candidates = 50):
+    '''Compares the features of one random citation and its candidates, NaN equal to NaN'''
+    rng = random.Random(seed)
+    cite_book_dict = {'title_wiki' : rng.choice(wiki_titles), 'date_wiki' : rng.choice(wiki_dates), 'publisher_wiki' : rng.choice(wiki_publishers), **rng.choice(wiki_names)}
+    records = []
+    for i in range(rng.randint(1, candidates)):
+        record = {'title' : rng.choice(titles), 'creator' : rng.choice(creators), 'publisher' : rng.choice(publishers), 'date' : rng.choice(dates), 'identifier-access' : f'http://archive.org/details/item{i}'}
+        records.append(dict((k, v) for k, v in record.items() if v is not None))
+
+    expected = create_features(clean_data(assemble_candidates('query', records, cite_book_dict)))[MODEL_FEATURES].to_numpy(dtype = float)
+    X = feature_matrix(CitationFields(cite_book_dict), build_candidates('query', records))
+    np.testing.assert_array_equal(expected, X, err_msg = f'seed {seed}')
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    for seed in range(200):
+        check_features(seed)
+    print('features: 200 citations of up to 50 candidates identical')
+
+    fixture = load_fixture()
+    citations = fixture['citations']
+    #'²' is a digit to isdigit but not to int, so clean_year gives None
+    unread = dict(fixture, items = dict((identifier, dict(metadata, date = '19²') if n % 3 == 0 else metadata) for n, (identifier, metadata) in enumerate(fixture['items'].items())))
+    for all_results in [False, True]:
+        start = time.perf_counter()
+        expected = [get_matches({}, [cite_string], log_level = 'error', session = FakeSession(fixture), all_results = all_results)[0] for cite_string in citations]
+        batch_time = time.perf_counter() - start
+        start = time.perf_counter()
+        results = [get_match({}, cite_string, log_level = 'error', session = FakeSession(fixture), all_results = all_results) for cite_string in citations]
+        core_time = time.perf_counter() - start
+        differ = [cite_string for cite_string, a, b in zip(citations, expected, results) if not same(a, b)]
+        assert not differ, f'all_results={all_results}: {len(differ)} citations differ, first: {differ[0][:70]}'
+        print(f'all_results={all_results!s:<5} same results for {len(citations)} citations, get_matches {batch_time:.2f} s, core {core_time:.2f} s')
+
+        #a probability is never over 1, so every chunk is scored
+        expected = [get_matches({}, [cite_string], log_level = 'error', session = FakeSession(unread), all_results = all_results)[0] for cite_string in citations]
+        for chunk_size in [1, 3, 10]:
+            results = [match_citation({}, cite_string, all_results, session = FakeSession(unread), stop_threshold = 1.0, chunk_size = chunk_size) for cite_string in citations]
+            differ = [cite_string for cite_string, a, b in zip(citations, expected, results) if not same(a, b)]
+            assert not differ, f'all_results={all_results}, chunk_size={chunk_size}: {len(differ)} citations differ, first: {differ[0][:70]}'
+        print(f'all_results={all_results!s:<5} same results scored in chunks of 1, 3 and 10 candidates')
+
+    #the outputs hold no probabilities, so compare those of every candidate, scored in one go and in chunks
+    def probabilities(cite_string, **kwargs):
+        return [(candidate.url, candidate.probability) for candidate in list(iter_matches({}, cite_string, all_results = True, session = FakeSession(unread), **kwargs))]
+    for chunk_size in [1, 3, 10]:
+        differ = [cite_string for cite_string in citations if probabilities(cite_string) != probabilities(cite_string, stop_threshold = 1.0, chunk_size = chunk_size)]
+        assert not differ, f'chunk_size={chunk_size}: {len(differ)} citations have other probabilities, first: {differ[0][:70]}'
+    print('probabilities of every candidate the same scored in chunks of 1, 3 and 10 candidates')
+
+    for stop_threshold in [None, 0.9, 0.5]:
+        session = FakeSession(fixture)
+        start = time.perf_counter()
+        found = sum(next(iter_matches({}, cite_string, session = session, stop_threshold = stop_threshold), None) is not None for cite_string in citations)
+        print(f'first match, stop_threshold={stop_threshold!s:<4} {found} citations matched, {session.calls:4d} requests, {time.perf_counter() - start:.2f} s')
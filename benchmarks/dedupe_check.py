@@ -0,0 +1,100 @@
+# Title : Citation Deduplication Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Matches the benchmark fixture's citations together with variants of them that differ the way
+#citations of one book differ across Wikipedia: spacing, |last1= for |last=, pages, access-date and
+#archive-url, and with variants that do change the features: an upper case title and the name fields in
+#another order. Checks that get_matches with a canonical.Deduplicator, over several batches, finds the
+#same matches for every citation as looking each one up, and reports the requests and time saved.
+#Then fails a search in every batch of pipeline.match_batch, so each batch is retried one citation at
+#a time, and checks the duplication counts are those of a run without failures.
+#Run from the repository root: python benchmarks/dedupe_check.py
+
+import logging
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_parity import reordered
+from replay import FakeSession, load_fixture
+
+from canonical import Deduplicator
+from pipeline import match_batch
+from wiki2ia import get_matches
+
+
+class FailingSession(FakeSession):
+    '''FakeSession whose first search after fail_next is set raises'''
+
+    def __init__(self, fixture):
+        super().__init__(fixture)
+        self.fail_next = False
+
+    def search_items(self, query, fields = None, **kwargs):
+        if self.fail_next:
+            self.fail_next = False
+            raise ConnectionError('dropped')
+        return super().search_items(query, fields = fields, **kwargs)
+
+
+def variants(cite_string):
+    '''
+    Output : (list) cite_string written three other ways that do not change what it cites, then with an
+        upper case title and with its name fields reordered, which change the features and so the key
+    '''
+    body = cite_string.rstrip().rstrip('}')
+    exp = [
+        re.sub(r'\s*\|\s*', ' | ', body) + '}}',
+        re.sub(r'\|\s*(last|first)=', r'|\g<1>1=', body) + '}}',
+        body + ' |page=12 |access-date=1 May 2020 |archive-url=https://web.archive.org/web/2020/https://example.org}}',
+        re.sub(r'(\|\s*title\s*=)([^|}]*)', lambda match: match.group(1) + match.group(2).upper(), body) + '}}',
+    ]
+    if reordered(cite_string) is not None:
+        exp.append(reordered(cite_string))
+    return exp
+
+
+def urls(result):
+    return sorted(match['url_ia'] for match in result.values()) if result else []
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    citations = list(fixture['citations'])
+    for cite_string in fixture['citations']:
+        citations += variants(cite_string)
+    random.Random(0).shuffle(citations)
+    batches = [citations[i : i + 25] for i in range(0, len(citations), 25)]
+
+    runs = {}
+    for name, dedupe in [('every citation', None), ('deduplicated', Deduplicator())]:
+        session = FakeSession(fixture)
+        start = time.perf_counter()
+        results = []
+        for batch in batches:
+            results += get_matches({}, batch, log_level = 'error', session = session, dedupe = dedupe)
+        runs[name] = (results, session.calls, time.perf_counter() - start)
+        print(f'{name:<15} {session.calls:5d} requests, {runs[name][2]:6.2f} s')
+
+    (plain, plain_calls, _), (deduped, deduped_calls, _) = runs['every citation'], runs['deduplicated']
+    assert all(result is None or all(match['input_citation'] == cite_string for match in result.values()) for cite_string, result in zip(citations, deduped))
+    differ = [cite_string for cite_string, a, b in zip(citations, plain, deduped) if urls(a) != urls(b)]
+    assert not differ, f'{len(differ)} citations matched differently, first: {differ[0][:70]}'
+    print(f'same matches for all {len(citations)} citations, {dedupe.report(deduped_calls)}, {plain_calls - deduped_calls} requests saved')
+
+    counts = {}
+    for name, fail in [('without failures', False), ('retried', True)]:
+        session = FailingSession(fixture)
+        dedupe = Deduplicator()
+        for batch in batches:
+            session.fail_next = fail
+            match_batch({}, batch, dict(session = session, log_level = 'error', dedupe = dedupe))
+        counts[name] = dedupe.report()
+    assert counts['retried'] == counts['without failures'], f'{counts["retried"]} with retried batches, {counts["without failures"]} without'
+    print(f'failed batches retried one citation at a time count each citation once: {counts["retried"]}')
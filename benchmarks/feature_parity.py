@@ -0,0 +1,78 @@
+# Title : Feature Engine Parity Check and Benchmark
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that features.create_features gives the same feature columns and the same
+#finalized_model.sav predictions as the original row by row implementation, then times both.
+#Run from the repository root: python benchmarks/feature_parity.py
+
+import io
+import os
+import sys
+import contextlib
+import random
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import legacy
+import features
+from utils import assemble_candidates, clean_data
+from wiki2ia import MODEL_FEATURES, load_model
+
+titles = ['The eighth land : the Polynesian discovery and settlement of Easter Island', 'Easter Island : island of enigmas',
+    'Island at the center of the world', 'Aphrodite\'s island', 'The enigmas of Easter Island', 'Poems', 'History of England, vol. 2', '']
+creators = ['Barthel, Thomas S.', 'Dos Passos, John, 1896-1970', ['Flenley, John', 'Bahn, Paul G.'], 'Fischer, Steven Roger (editor)',
+    'Salmond, Anne (A.)', 'author', '', None]
+publishers = ['Honolulu : University Press of Hawaii', '[Oxford University Press]', 'Doubleday', 'Reaktion Books', '', None]
+dates = ['1978', '1974-05-01', 'c1901', '19--', '2003.5', 'a.5b', '.5', '0', '', None]
+
+wiki_titles = ['The Eighth Land: The Polynesian Settlement of Easter Island', 'Easter Island: Island of Enigmas', 'Poems', "Aphrodite's Island"]
+wiki_names = [{}, {'last_wiki' : 'Barthel', 'first_wiki' : 'Thomas S.'}, {'last1_wiki' : 'Flenley', 'first1_wiki' : 'John', 'last2_wiki' : 'Bahn', 'first2_wiki' : 'Paul G.'}, {'last_wiki' : 'Dos Passos, John'}]
+wiki_dates = ['1974', '2003', 'May 2010', np.nan, '19 March 2019']
+wiki_publishers = [' [[University of Hawaii]]', 'Oxford University Press', np.nan, '']
+
+
+def make_frame(seed, citations = 20, candidates = 50):
+    rng = random.Random(seed)
+    frames = []
+    for c in range(citations):
+        cite_book_dict = {'title_wiki' : rng.choice(wiki_titles), 'date_wiki' : rng.choice(wiki_dates), 'publisher_wiki' : rng.choice(wiki_publishers), **rng.choice(wiki_names)}
+        records = []
+        for i in range(rng.randint(1, candidates)):
+            record = {'title' : rng.choice(titles), 'creator' : rng.choice(creators), 'publisher' : rng.choice(publishers), 'date' : rng.choice(dates), 'identifier-access' : f'http://archive.org/details/item{c}_{i}'}
+            records.append(dict((k, v) for k, v in record.items() if v is not None))
+        frames.append(assemble_candidates('query', records, cite_book_dict))
+    data = pd.concat(frames, ignore_index = True)
+    return clean_data(data)
+
+
+def check(seed):
+    data = make_frame(seed)
+    #the legacy clean prints values it cannot parse, like 'a.5b'
+    with contextlib.redirect_stdout(io.StringIO()):
+        old = legacy.create_features(data.copy())
+    new = features.create_features(data.copy())
+
+    for column in MODEL_FEATURES + ['year_wiki', 'date_ia']:
+        np.testing.assert_array_equal(old[column].to_numpy(dtype = float), new[column].to_numpy(dtype = float), err_msg = column)
+    for column in ['author_ia', 'author_wiki']:
+        pd.testing.assert_series_equal(old[column], new[column])
+
+    model = load_model()
+    np.testing.assert_array_equal(model.predict(old[MODEL_FEATURES]), model.predict(new[MODEL_FEATURES]))
+    return data
+
+
+if __name__ == '__main__':
+    for seed in range(20):
+        data = check(seed)
+    print(f'parity: 20 batches of up to 1000 candidates identical')
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        old_time = min(timeit.repeat(lambda: legacy.create_features(data.copy()), number = 1, repeat = 3))
+    new_time = min(timeit.repeat(lambda: features.create_features(data.copy()), number = 1, repeat = 3))
+    print(f'{data.shape[0]} candidates: row by row {old_time * 1000:.1f} ms, feature engine {new_time * 1000:.1f} ms, {old_time / new_time:.1f}x')
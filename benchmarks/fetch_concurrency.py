@@ -0,0 +1,64 @@
+# Title : Concurrent Fetch Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks the thread pool of utils.fetch_items against a FakeSession whose metadata requests take
+#longer the earlier the item comes, so later items finish first. The items have to come back in
+#input order, and with a worker per item the wall time has to be close to the slowest request, not
+#the sum of all of them. Then checks that get_matches finds the same for the fixture's citations
+#with workers=8 as with workers=1.
+#Run from the repository root: python benchmarks/fetch_concurrency.py
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+from store_check import same
+
+from utils import fetch_items
+from wiki2ia import get_matches
+
+
+class SlowSession(FakeSession):
+    '''FakeSession where get_item of identifier sleeps delays[identifier] seconds'''
+
+    def __init__(self, fixture, delays):
+        super().__init__(fixture)
+        self.delays = delays
+
+    def get_item(self, identifier, **kwargs):
+        time.sleep(self.delays.get(identifier, 0))
+        return super().get_item(identifier, **kwargs)
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    ia_ids = sorted(fixture['items'])[:16]
+    delays = dict((ia_id, 0.02 + 0.01 * (len(ia_ids) - i)) for i, ia_id in enumerate(ia_ids))
+    slowest, total = max(delays.values()), sum(delays.values())
+
+    for workers in [1, 4, len(ia_ids)]:
+        session = SlowSession(fixture, delays)
+        start = time.perf_counter()
+        items = fetch_items(session, ia_ids, workers = workers)
+        seconds = time.perf_counter() - start
+        assert [item.identifier for item in items] == ia_ids, f'workers={workers}: items out of input order'
+        print(f'workers={workers:<3} {len(ia_ids)} items in input order, {seconds:.3f} s, slowest request {slowest:.3f} s, all requests {total:.3f} s')
+        if workers == 1:
+            assert seconds >= total
+        elif workers == len(ia_ids):
+            assert seconds < slowest * 1.5, f'workers={workers}: {seconds:.3f} s is not close to the slowest request'
+        else:
+            assert seconds < total / 2, f'workers={workers}: {seconds:.3f} s is not faster than one at a time'
+
+    citations = fixture['citations']
+    expected = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = True)
+    results = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = True, workers = 8)
+    differ = [cite_string for cite_string, a, b in zip(citations, expected, results) if not same(a, b)]
+    assert not differ, f'workers=8: {len(differ)} citations differ, first: {differ[0][:70]}'
+    print(f'workers=8   same results as workers=1 for {len(citations)} citations')
@@ -0,0 +1,64 @@
+# Title : Import Time Benchmark
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Times, in fresh interpreters, how long short lived uses of the package take to start, and checks
+#that parsing citations loads none of the networking, dataframe or model libraries. The same
+#scenarios can be timed on another revision with --tree, e.g. a git worktree of an older commit.
+#Run from the repository root: python benchmarks/import_time.py
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+#libraries a scenario is not allowed to load when listed in its third entry
+HEAVY = ['pandas', 'numpy', 'requests', 'internetarchive', 'thefuzz', 'sklearn', 'dotenv']
+
+CITATION = '{{cite book|last=Barthel |first=Thomas S. |title=The Eighth Land |publisher=University of Hawaii |year=1974}}'
+
+SCENARIOS = [
+    ('import wiki2ia', 'import wiki2ia', HEAVY),
+    ('parse a citation', f'from wiki2ia import parse_citation; parse_citation({CITATION!r})', HEAVY),
+    ('parse_cite_book', f'from utils import parse_cite_book; parse_cite_book({CITATION!r}, ["title"])', HEAVY),
+    ('import dump', 'import dump', HEAVY),
+    ('import pipeline', 'import pipeline', ['pandas', 'thefuzz', 'sklearn', 'dotenv']),
+    ('load the model', 'from wiki2ia import load_model; load_model()', []),
+]
+
+#prints the heavy libraries the statement loaded, as JSON on the last line
+PROBE = 'import sys, json\n{}\nprint(json.dumps([m for m in {} if m in sys.modules]))'
+
+
+def run(tree, statement):
+    '''Output : (tuple) seconds the interpreter took to run statement and exit, and the heavy libraries it loaded'''
+    start = time.perf_counter()
+    done = subprocess.run([sys.executable, '-c', PROBE.format(statement, HEAVY)], cwd = tree, capture_output = True, text = True, check = True)
+    return time.perf_counter() - start, json.loads(done.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Start up time of short lived uses of wiki2ia.')
+    parser.add_argument('--runs', type = int, default = 7)
+    parser.add_argument('--tree', default = REPO_DIR, help = 'checkout to time, this one by default')
+    args = parser.parse_args()
+
+    bare = statistics.median(run(args.tree, 'pass')[0] for _ in range(args.runs))
+    print(f'{"interpreter alone":<20} {bare * 1000:8.1f} ms')
+
+    failed = []
+    for name, statement, forbidden in SCENARIOS:
+        times = []
+        for _ in range(args.runs):
+            seconds, loaded = run(args.tree, statement)
+            times.append(seconds)
+        print(f'{name:<20} {statistics.median(times) * 1000:8.1f} ms  +{(statistics.median(times) - bare) * 1000:7.1f} ms  loads {", ".join(loaded) or "none of " + ", ".join(HEAVY)}')
+        if set(loaded) & set(forbidden):
+            failed.append(f'{name} loads {", ".join(sorted(set(loaded) & set(forbidden)))}')
+
+    assert not failed, '; '.join(failed)
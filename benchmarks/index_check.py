@@ -0,0 +1,108 @@
+# Title : Local Index Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Builds an index.LocalIndex from the items of the benchmark fixture and checks it against the replayed
+#API of replay.FakeSession. Every search the matcher sends for the fixture's citations, with and
+#without direct lookup and refinement, every refinement step and every ISBN and identifier lookup
+#finds the same items in the same order, and get_item returns the same metadata. A pickled and loaded
+#index answers the same, and get_matches finds the same matches on the index as on the replayed API.
+#Then times the searches.
+#Run from the repository root: python benchmarks/index_check.py
+
+import json
+import logging
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+from store_check import same
+
+from index import LocalIndex, build_index
+from normalize import clean_title
+from utils import isbn_variants, pull_metadata, refinement_clauses
+from wiki2ia import get_matches, parse_citation
+
+
+class QueryLog(FakeSession):
+    '''FakeSession that keeps every search query it answers'''
+
+    def __init__(self, fixture):
+        super().__init__(fixture)
+        self.queries = []
+
+    def search_items(self, query, fields = None, **kwargs):
+        self.queries.append(query)
+        return super().search_items(query, fields = fields, **kwargs)
+
+
+def listing(session, query):
+    '''Output : (tuple) identifiers and num_found of a search'''
+    search = session.search_items(query)
+    return [hit['identifier'] for hit in search.iter_as_results()], search.num_found
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    citations = fixture['citations']
+
+    replayed = QueryLog(fixture)
+    for direct_lookup in [True, False]:
+        for refine in [True, False]:
+            get_matches({}, citations, log_level = 'error', session = replayed, all_results = True, direct_lookup = direct_lookup, refine = refine)
+    queries = list(dict.fromkeys(replayed.queries))
+    #every refinement step of every citation, the matcher only sends those of over-cap searches
+    for cite_book_dict in map(parse_citation, citations):
+        if isinstance(cite_book_dict.get('title_wiki'), str):
+            query = f'collection:internetarchivebooks AND title:{clean_title(cite_book_dict["title_wiki"])}'
+            for clause in refinement_clauses(cite_book_dict):
+                query += f' AND {clause}'
+                queries.append(query)
+        if isbn_variants(cite_book_dict.get('isbn_wiki')):
+            queries.append(f'isbn:({" OR ".join(isbn_variants(cite_book_dict["isbn_wiki"]))})')
+    queries += [f'identifier:{identifier}' for identifier in list(fixture['items'])[::100]]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        export_path = os.path.join(tmp, 'items.jsonl')
+        with open(export_path, 'w', encoding = 'utf-8') as f:
+            for identifier, metadata in fixture['items'].items():
+                f.write(json.dumps(dict(metadata, identifier = identifier)) + '\n')
+        start = time.perf_counter()
+        items = build_index(export_path, os.path.join(tmp, 'index'))
+        print(f'build        {items} items indexed in {time.perf_counter() - start:.2f} s')
+
+        index = LocalIndex(os.path.join(tmp, 'index'))
+        assert len(index) == len(fixture['items'])
+        for query in queries:
+            assert listing(index, query) == listing(replayed, query), f'{query}: index {listing(index, query)[1]}, replayed {listing(replayed, query)[1]}'
+        print(f'search       {len(queries)} queries, {sum(query.startswith("isbn:") for query in queries)} ISBN lookups and {sum(" AND " in query.split("title:")[-1] for query in queries)} refined, same items in the same order')
+
+        for identifier in fixture['items']:
+            assert pull_metadata(index.get_item(identifier).item_metadata['metadata']) == pull_metadata(replayed.get_item(identifier).item_metadata['metadata']), identifier
+        assert index.get_item('notanitem00').item_metadata == {}
+        print(f'get_item     {len(fixture["items"])} items with the same metadata, none for an unknown identifier')
+
+        loaded = pickle.loads(pickle.dumps(index))
+        assert len(pickle.dumps(index)) < 1000, 'the pickle holds more than the directory'
+        assert all(listing(loaded, query) == listing(index, query) for query in queries)
+        print('pickle       a loaded copy maps the files again and answers the same')
+
+        for direct_lookup in [True, False]:
+            expected = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = True, direct_lookup = direct_lookup)
+            results = get_matches({}, citations, log_level = 'error', session = loaded, all_results = True, direct_lookup = direct_lookup)
+            differ = [cite_string for cite_string, a, b in zip(citations, expected, results) if not same(a, b)]
+            assert not differ, f'direct_lookup={direct_lookup}: {len(differ)} citations differ, first: {differ[0][:70]}'
+        print(f'get_matches  same results on the index as on the replayed API for {len(citations)} citations')
+
+        start = time.perf_counter()
+        for query in queries:
+            listing(index, query)
+        print(f'timing       {(time.perf_counter() - start) / len(queries) * 1000:.2f} ms per search')
+        index.close()
+        loaded.close()
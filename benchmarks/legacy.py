@@ -0,0 +1,220 @@
+# Title : Legacy Implementations
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Earlier versions of functions that were rewritten for speed, kept so benchmarks and
+#parity checks can compare the current code against them.
+
+import re
+import numpy as np
+import pandas as pd
+from thefuzz import fuzz
+
+from utils import try_to_pull
+
+
+def assemble_candidates(search_query, records, cite_book_dict):
+    '''get_results candidate assembly before the columnar rewrite: one DataFrame and one concat per row'''
+    for i, big_json in enumerate(records):
+
+        ia_link = try_to_pull(big_json, 'identifier-access')
+
+        res_dict = {
+            'search_query_ia' : search_query,
+            'title_ia' : try_to_pull(big_json, 'title'),
+            'author_ia' : try_to_pull(big_json, 'creator'),
+            'publisher_ia' : try_to_pull(big_json, 'publisher'),
+            'date_ia' :  try_to_pull(big_json, 'date'),
+            'year_ia' : try_to_pull(big_json, 'year'),
+            'url_ia' : ia_link
+        }
+
+        res_dict = {**res_dict, **cite_book_dict}
+
+        tmp = pd.DataFrame(res_dict, index = [0])
+
+        if not 'df' in locals():
+            df = tmp
+        else:
+            df = pd.concat([df, tmp])
+
+    return df
+
+
+def clean_title(title):
+    if isinstance(title, float):
+        return title
+    title = title.replace(":", "")
+    title = title.replace(",", "")
+    title = title.replace(";", "")
+    title = title.replace("'", "")
+    title = title.replace('"', "")
+    title = title.replace('.', "")
+    title = title.replace('[', "")
+    title = title.replace(']', "")
+    title = title.replace('!', "")
+    title = title.replace('/', "")
+    title = title.replace('\\', "")
+    title = title.replace('@', "")
+    title = title.replace('*', "")
+    title = title.replace('#', "")
+    title = title.replace('?', "")
+    title = title.replace('%', "")
+    title = title.lower()
+    title = title.strip()
+    return title
+
+def clean_ia_author(author):
+    try:
+        author.find("(")
+    except AttributeError:
+        #object is NA
+        return author
+    if author.find("(") != -1 and author.find(")") != -1:
+        author = re.subn(r'[A-Z]\.',"", author)[0]
+    author = author.lower()
+    author = author.split(',')
+    if isinstance(author, list) and len(author) == 1:
+        author = author[0]
+    elif isinstance(author, list) and len(author) > 1:
+        author.reverse()
+        author = ' '.join(author)
+    author = author.replace(":", "")
+    author = author.replace("-", "")
+    author = author.replace("[", "")
+    author = author.replace("]", "")
+    author = author.replace("(", "")
+    author = author.replace(")", "")
+    author = author.replace("  ", " ")
+    author = author.replace("author", "")
+    author = author.replace("editor in chief", "")
+    author = author.replace("compiler", "")
+    author = author.replace("editor", "")
+    author = re.subn(r'[0-9]+',"", author)[0]
+    author = author.strip()
+    if len(list(set(author.split(" ")))) < len(list(author.split(" "))):
+        author = list(set(author.split(" ")))
+        author = " ".join(author)
+        author = author.strip()
+    return author
+
+def clean_wiki_publisher(var):
+    if isinstance(var, float):
+        return var
+    try:
+        var.find("(")
+    except AttributeError:
+        #object is NA
+        return var
+    var = var.replace("[", "")
+    var = var.replace("]", "")
+    return var
+
+def clean_author_wiki(var):
+    if isinstance(var, float):
+        return var
+    var = var.replace(":", "")
+    var = var.replace("-", "")
+    var = var.replace("[", "")
+    var = var.replace("]", "")
+    var = var.replace("(", "")
+    var = var.replace(")", "")
+    var = var.replace(".", "")
+    var = var.lower()
+    var = var.strip()
+    return var
+
+def get_lev_distance_or_NA(data, columns, partial = False, sort = False):
+    assert isinstance(data, pd.DataFrame)
+    assert isinstance(columns, list)
+    assert len(columns) == 2
+    #If partial is True, First column will be fully matched, Second column partially matched
+    assert isinstance(columns[0], str)
+    assert isinstance(columns[1], str)
+    
+    out = []
+    for i in range(data.shape[0]):
+        val1 = data[columns[0]].iloc[i]
+        val2 = data[columns[1]].iloc[i]
+        if pd.isna(val1) or val1 == "" or pd.isna(val2) or val2 == "":
+            out.append(np.nan)
+        else:
+            if partial and sort:
+                out.append(fuzz.partial_token_sort_ratio(val1, val2))
+            elif partial:
+                out.append(fuzz.partial_ratio(val1, val2))
+            elif sort:
+                out.append(fuzz.token_sort_ratio(val1, val2))
+            else:
+                out.append(fuzz.ratio(val1, val2))
+    return out
+
+def create_features(data):
+    '''create_features before the bulk feature engine in features.py'''
+    assert isinstance(data, pd.DataFrame)
+    assert not data.empty
+    
+    #lev distance for title
+    data['title_match'] = get_lev_distance_or_NA(data, ['title_ia', 'title_wiki'])
+
+    # using partial matching because title_ia is usually more descriptive
+    data['title_match_partial'] = get_lev_distance_or_NA(data, ['title_wiki', 'title_ia'], partial = True, sort = True)
+
+    #for author
+    data.author_ia = data.author_ia.astype('str')
+    data.author_wiki = data.author_wiki.astype('str')
+
+    for var in ['author_ia', 'author_wiki']:
+        data[var] = data[var].replace({'nan': np.nan})
+
+    data['author_match'] = get_lev_distance_or_NA(data, ['author_ia', 'author_wiki'])
+
+    data['author_sort'] = get_lev_distance_or_NA(data, ['author_ia', 'author_wiki'], sort = True)
+
+    #for publisher
+    data['publisher_match'] = get_lev_distance_or_NA(data, ['publisher_ia', 'publisher_wiki'])
+
+    # using partial matching because publisher_ia is usually more descriptive
+    data['publisher_match_partial'] = get_lev_distance_or_NA(data, ['publisher_wiki', 'publisher_ia'], partial = True)
+
+    #year
+    def clean(string):
+        if pd.isna(string):
+            return np.nan
+        string = str(string)
+        if any(char.isdigit() for char in string) == False:
+            return np.nan
+        string = re.subn(r'\.[0-9]+',"",string)[0]
+        string = re.subn(r'\.',"",string)[0]
+        if string:
+            try:
+                return int(''.join(filter(str.isdigit, string)))
+            except:
+                print(string)
+        else:
+            return np.nan
+
+    data['year_wiki'] = data.date_wiki.apply(clean)
+    data.date_ia = data.date_ia.apply(clean)
+
+    year_res = []
+    for i in range(data.shape[0]):
+        val1 = data.date_ia.iloc[i]
+        val2 = data.year_wiki.iloc[i]
+        if val1 and val2:
+            year_res.append(float(val1) == float(val2))
+        else:
+            year_res.append(np.nan)
+
+    data['year_match'] = year_res
+
+    #year NA
+    data['year_NA'] = [np.where(pd.isna(data.year_wiki.iloc[i]) or pd.isna(data.date_ia.iloc[i]), 1, 0) for i in range(data.shape[0])]
+
+    #Author NA
+    data['author_NA'] = [np.where(pd.isna(data.author_ia.iloc[i]) or pd.isna(data.author_wiki.iloc[i]), 1, 0) for i in range(data.shape[0])]
+
+    #Publisher NA
+    data['publisher_NA'] = [np.where(pd.isna(data.publisher_ia.iloc[i]) or pd.isna(data.publisher_wiki.iloc[i]), 1, 0) for i in range(data.shape[0])]
+    
+    return data
@@ -0,0 +1,59 @@
+# Title : Search Refinement Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that a refined title search pulls the metadata of at most refine_target items. Matches every
+#citation of the benchmark fixture on its own with a few refine targets, with and without a blocker,
+#and counts the items fetched, including for the citations whose search stays at or above the target
+#after every clause. The default target, cap, has to give the same results as before refinement had one.
+#Run from the repository root: python benchmarks/refine_check.py
+
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+from store_check import same
+
+from blocking import Blocker
+from wiki2ia import get_matches
+
+
+class FetchCount(FakeSession):
+    '''FakeSession that counts the items fetched'''
+
+    def __init__(self, fixture):
+        super().__init__(fixture)
+        self.fetched = 0
+
+    def get_item(self, identifier, **kwargs):
+        self.fetched += 1
+        return super().get_item(identifier, **kwargs)
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    citations = fixture['citations']
+
+    for blocker in [None, Blocker()]:
+        for refine_target in [5, 10, 50, None]:
+            fetched = []
+            above = 0
+            for cite_string in citations:
+                session = FetchCount(fixture)
+                result = get_matches({}, [cite_string], log_level = 'error', session = session, all_results = True, direct_lookup = False, blocker = blocker, refine_target = refine_target)[0]
+                fetched.append(session.fetched)
+                target = refine_target or 500
+                assert session.fetched <= target, f'refine_target={refine_target}: {session.fetched} items fetched for {cite_string[:70]}'
+                if isinstance(result, dict):
+                    steps = next(iter(result.values())).get('search_steps_ia')
+                    above += bool(steps) and steps[-1]['num_found'] >= target
+            print(f'blocker {blocker is not None!s:<5} refine_target {str(refine_target):<4} at most {max(fetched)} items fetched per citation, {sum(fetched)} in all, {above} searches still at or above the target')
+
+    expected = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = True, refine_target = None)
+    results = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = True, refine_target = 500)
+    assert all(same(a, b) for a, b in zip(expected, results)), 'refine_target=cap differs from the default'
+    print(f'refine_target=cap gives the default results for {len(citations)} citations')
@@ -0,0 +1,320 @@
+# Title : Recorded Internet Archive Responses
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Fixtures of Internet Archive search and metadata responses, and FakeSession, which replays them
+#through the two session calls the matcher makes, search_items and get_item, so a matching run needs
+#no network and gives the same answers every time. A fixture is gzipped JSON:
+#
+#    {'items' : {identifier : metadata}, 'searches' : {query : {'num_found' : n, 'identifiers' : [...]}},
+#     'citations' : [cite book strings], 'source' : how it was made}
+#
+#Queries found in 'searches' are answered as recorded. Any other query, e.g. one a different revision
+#of the matcher sends, is answered from 'items' the way the title search behaves: every title word of
+#the query has to be in the item's title, and creator, publisher, year, isbn and identifier clauses
+#are checked against the item's metadata.
+#
+#    python benchmarks/replay.py record --env .env      records the citations of fixtures/citations.txt
+#    python benchmarks/replay.py synthesize             writes a generated fixture, no network needed
+#
+#The shipped fixture is synthesized, with the candidate counts of LARGE_QUERIES for a few titles.
+
+import argparse
+import gzip
+import json
+import os
+import random
+import re
+import sys
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARKS_DIR)
+CITATIONS = os.path.join(BENCHMARKS_DIR, 'fixtures', 'citations.txt')
+FIXTURE = os.path.join(BENCHMARKS_DIR, 'fixtures', 'ia_responses.json.gz')
+
+#title words of a citation and the number of candidates its search finds in a synthesized fixture,
+#the last one over the default cap of 500 so refinement and paging are exercised too
+LARGE_QUERIES = {'leaves of grass' : 200, 'the hobbit or there and back again' : 350, 'nineteen eighty-four' : 480, 'poems' : 650}
+
+_CLAUSE = re.compile(r'\b(title|creator|publisher|year|isbn|identifier):(\([^)]*\)|.*?)(?= AND [a-z-]+:|$)')
+#the punctuation normalize.clean_title drops, and the brackets of a clause
+_PUNCTUATION = re.compile(r'[:,;\'".\[\]!/\\@*#?%()]')
+
+
+def words(value):
+    '''Output : (list) lower case words of a metadata value or query, split the way clean_title leaves them'''
+    if isinstance(value, list):
+        value = ' '.join(str(v) for v in value)
+    if not isinstance(value, str):
+        return []
+    return _PUNCTUATION.sub('', value).lower().split()
+
+
+def load_fixture(path = FIXTURE):
+    with gzip.open(path, 'rt', encoding = 'utf-8') as f:
+        return json.load(f)
+
+
+def save_fixture(fixture, path = FIXTURE):
+    #no timestamp in the gzip header, so the same fixture gives the same bytes
+    with open(path, 'wb') as raw, gzip.GzipFile(fileobj = raw, mode = 'wb', mtime = 0) as f:
+        f.write(json.dumps(fixture, sort_keys = True, ensure_ascii = False).encode('utf-8'))
+
+
+class FakeResponse:
+    '''What a requests response hook reads of a response'''
+
+    def __init__(self, content):
+        self.content = content
+        self.headers = {'Content-Length' : str(len(content))}
+
+
+class FakeSearch:
+    '''The part of internetarchive's Search the matcher uses'''
+
+    def __init__(self, hits, num_found):
+        self._hits = hits
+        self.num_found = num_found
+
+    def iter_as_results(self):
+        return iter(self._hits)
+
+
+class FakeItem:
+    '''The part of internetarchive's Item the matcher uses'''
+
+    def __init__(self, identifier, metadata):
+        self.identifier = identifier
+        self.item_metadata = {'metadata' : metadata} if metadata is not None else {}
+
+
+class FakeSession:
+    '''
+    Replays a fixture in place of an internetarchive session.
+
+    Input :
+        fixture : (dict) see load_fixture
+        latency : (float) seconds every call sleeps, to stand in for the network
+
+    Response hooks in self.hooks are called with a FakeResponse, so stats.MatchStats counts calls and
+    bytes as it would against the real service. self.calls counts the calls.
+    '''
+
+    protocol = 'https:'
+    host = 'archive.org'
+
+    def __init__(self, fixture, latency = 0.0):
+        self.items = fixture['items']
+        self.searches = fixture.get('searches', {})
+        self.latency = latency
+        self.calls = 0
+        self.hooks = {'response' : []}
+        self._title_words = dict((identifier, set(words(metadata.get('title')))) for identifier, metadata in self.items.items())
+
+    def mount(self, *args, **kwargs):
+        pass
+
+    def _respond(self, body):
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        response = FakeResponse(json.dumps(body).encode('utf-8'))
+        for hook in self.hooks.get('response', []):
+            hook(response)
+
+    def matches(self, identifier, clauses):
+        '''Output : (bool) whether the item passes every (field, value) clause of a query'''
+        metadata = self.items[identifier]
+        for field, value in clauses:
+            wanted = [word for word in words(value) if word not in ('and', 'or')]
+            if field == 'title':
+                if not set(wanted) <= self._title_words[identifier]:
+                    return False
+            elif field == 'identifier':
+                if identifier != value.strip():
+                    return False
+            elif field == 'isbn':
+                isbns = metadata.get('isbn') or []
+                isbns = [isbns] if isinstance(isbns, str) else isbns
+                if not set(wanted) & set(re.sub(r'[^0-9xX]', '', isbn).lower() for isbn in isbns):
+                    return False
+            elif field == 'year':
+                if not set(wanted) & set(re.findall(r'[0-9]{4}', str(metadata.get('year') or metadata.get('date') or ''))):
+                    return False
+            elif not set(wanted) <= set(words(metadata.get(field))):
+                return False
+        return True
+
+    def find(self, query):
+        '''Output : (tuple) identifiers answering query in fixture order, and num_found'''
+        if query in self.searches:
+            recorded = self.searches[query]
+            return recorded['identifiers'], recorded['num_found']
+        clauses = _CLAUSE.findall(query)
+        if not clauses:
+            return [], 0
+        found = [identifier for identifier in self.items if self.matches(identifier, clauses)]
+        return found, len(found)
+
+    def search_items(self, query, fields = None, **kwargs):
+        identifiers, num_found = self.find(query)
+        fields = fields or ['identifier']
+        hits = []
+        for identifier in identifiers:
+            metadata = dict(self.items.get(identifier, {}), identifier = identifier)
+            hits.append(dict((field, metadata[field]) for field in fields if field in metadata))
+        self._respond(hits)
+        return FakeSearch(hits, num_found)
+
+    def get_item(self, identifier, **kwargs):
+        metadata = self.items.get(identifier)
+        if metadata is not None:
+            metadata = dict(metadata, identifier = identifier)
+        self._respond({'metadata' : metadata} if metadata is not None else {})
+        return FakeItem(identifier, metadata)
+
+
+class RecordingSession:
+    '''
+    Wraps a live internetarchive session and keeps every search and item it answers in self.fixture.
+    The identifiers of a search are kept when it found at most limit items, the matcher does not read
+    the hits of larger ones.
+    '''
+
+    def __init__(self, session, limit = 1000):
+        self.session = session
+        self.limit = limit
+        self.fixture = {'items' : {}, 'searches' : {}, 'citations' : [], 'source' : 'recorded ' + time.strftime('%Y-%m-%d')}
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+    def search_items(self, query, fields = None, **kwargs):
+        response = self.session.search_items(query, fields = fields, **kwargs) if fields else self.session.search_items(query, **kwargs)
+        num_found = response.num_found
+        hits = list(response.iter_as_results()) if isinstance(num_found, int) and num_found <= self.limit else []
+        self.fixture['searches'][query] = {'num_found' : num_found, 'identifiers' : [hit['identifier'] for hit in hits]}
+        for hit in hits:
+            stored = self.fixture['items'].setdefault(hit['identifier'], {})
+            for field, value in hit.items():
+                if field != 'identifier':
+                    stored.setdefault(field, value)
+        return FakeSearch(hits, num_found)
+
+    def get_item(self, identifier, **kwargs):
+        item = self.session.get_item(identifier, **kwargs)
+        metadata = item.item_metadata.get('metadata')
+        if metadata is not None:
+            self.fixture['items'][identifier] = dict((field, value) for field, value in metadata.items() if field != 'identifier')
+        return item
+
+
+def record(citations, config):
+    '''
+    Input :
+        citations : (list) cite book strings
+        config : (dict) internetarchive configuration
+
+    Output : (dict) fixture of every response get_matches needed for the citations, with direct
+        lookup and without, so every revision's title searches are in it
+    '''
+    sys.path.insert(0, REPO_DIR)
+    from session import get_session
+    from wiki2ia import get_matches
+
+    recorder = RecordingSession(get_session(config))
+    get_matches(config, citations, log_level = 'error', all_results = True, session = recorder)
+    get_matches(config, citations, log_level = 'error', all_results = True, session = recorder, direct_lookup = False, refine = False)
+    recorder.fixture['citations'] = citations
+    return recorder.fixture
+
+
+def synthesize(citations, large_queries = LARGE_QUERIES, seed = 0):
+    '''
+    Input :
+        citations : (list) cite book strings
+        large_queries : (dict) cleaned title of a citation and how many candidates its search finds
+        seed : (int) seed of the generator, the same seed gives the same fixture
+
+    Output : (dict) fixture with, for every citation, the book it cites, look alike editions and
+        unrelated books sharing its title words, between 3 and 40 candidates unless listed in large_queries
+    '''
+    sys.path.insert(0, REPO_DIR)
+    from normalize import clean_title
+    from utils import archive_identifier
+    from wiki2ia import parse_citation
+
+    rng = random.Random(seed)
+    names = ['Smith, John', 'Brown, Mary (ed.)', 'Anonymous', 'Taylor, A. J. P.', 'Müller, Hans', 'Wright, Orville, 1871-1948']
+    publishers = ['London : Macmillan', 'New York : Harper & Brothers', '[Boston] : Houghton Mifflin', 'Penguin Books', 'Oxford : Clarendon Press']
+    filler = 'new revised complete illustrated selected collected history notes essays second volume letters studies'.split()
+
+    items = {}
+    for n, cite in enumerate(citations):
+        cite_book_dict = parse_citation(cite)
+        title = cite_book_dict.get('title_wiki')
+        if not isinstance(title, str):
+            continue
+        cleaned = clean_title(title)
+        key = re.sub(r'[^a-z0-9]', '', cleaned)[:16] or f'book{n}'
+
+        last = cite_book_dict.get('last_wiki', cite_book_dict.get('last1_wiki'))
+        first = cite_book_dict.get('first_wiki', cite_book_dict.get('first1_wiki'))
+        author = re.search(r'\|\s*author\s*=\s*([^|}]+)', cite)
+        creator = f'{last}, {first}' if last and first else last or (author.group(1).strip() if author else rng.choice(names))
+        publisher = cite_book_dict.get('publisher_wiki')
+        publisher = re.sub(r'[\[\]]|[^|\]]*\|', '', publisher).strip() if isinstance(publisher, str) else None
+        year = re.search(r'[0-9]{4}', str(cite_book_dict.get('date_wiki')))
+        year = year.group(0) if year else None
+
+        book = {'title' : title.replace(': ', ' : ').strip('"'), 'creator' : creator, 'date' : year, 'year' : year, 'publisher' : publisher}
+        isbns = re.sub(r'[^0-9Xx]', '', str(cite_book_dict.get('isbn_wiki', '')))
+        if isbns:
+            book['isbn'] = [isbns]
+        identifier = archive_identifier(cite_book_dict.get('url_wiki')) or f'{key}00{creator[:4].lower()}'
+        items[identifier] = book
+
+        #the same book in other editions and other books with the same words in the title
+        count = large_queries.get(cleaned, rng.randint(3, 40))
+        for i in range(count - 1):
+            same_author = rng.random() < 0.3
+            candidate = {
+                'title' : ' '.join([title] + rng.sample(filler, rng.randint(0, 3))),
+                'creator' : creator if same_author else rng.choice(names + [[rng.choice(names), rng.choice(names)]]),
+                'date' : rng.choice([year, str(rng.randint(1700, 2020)), f'{rng.randint(17, 20)}--', 'c' + str(rng.randint(1700, 2020)), None]),
+                'publisher' : rng.choice([publisher, rng.choice(publishers), None]),
+            }
+            if rng.random() < 0.5:
+                candidate['year'] = candidate['date']
+            items[f'{key}{i:04d}{rng.randint(0, 9999):04d}'] = candidate
+
+    for identifier, metadata in items.items():
+        metadata['identifier-access'] = f'http://archive.org/details/{identifier}'
+        for field in [field for field, value in metadata.items() if value is None]:
+            del metadata[field]
+
+    return {'items' : items, 'searches' : {}, 'citations' : citations, 'source' : f'synthesized, seed {seed}'}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Record or synthesize a fixture of Internet Archive responses.')
+    parser.add_argument('mode', choices = ['record', 'synthesize'])
+    parser.add_argument('--citations', default = CITATIONS, help = 'cite book strings, one per line')
+    parser.add_argument('--output', default = FIXTURE)
+    parser.add_argument('--env', help = 'file with the access and secret keys, for record')
+    parser.add_argument('--seed', type = int, default = 0)
+    args = parser.parse_args()
+
+    with open(args.citations, encoding = 'utf-8') as f:
+        citations = [line.strip() for line in f if line.strip()]
+
+    if args.mode == 'record':
+        from dotenv import get_key
+        config = {'s3' : {'access' : get_key(args.env, 'access'), 'secret' : get_key(args.env, 'secret')}} if args.env else {}
+        fixture = record(citations, config)
+    else:
+        fixture = synthesize(citations, seed = args.seed)
+
+    save_fixture(fixture, args.output)
+    print(f'{len(fixture["items"])} items, {len(fixture["searches"])} recorded searches, {len(citations)} citations written to {args.output}')
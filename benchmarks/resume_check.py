@@ -0,0 +1,100 @@
+# Title : Pipeline Resume Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that pipeline.run resumes from its checkpoint without duplicate or missing lines. Runs the
+#benchmark fixture's citations, three times over, through pipeline.run in a child process against a
+#slowed down FakeSession. Kills the child with SIGKILL at a random point after it finished a batch,
+#often in the middle of the next, and at times leaves lines past the checkpoint with the last one
+#torn, as a crash while a batch is written would. Resumes until the run finishes and compares the
+#output with one uninterrupted run, line for line.
+#Run from the repository root: python benchmarks/resume_check.py
+
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+
+from canonical import Deduplicator
+from pipeline import run
+
+
+def match_all(input_path, output_path, latency = 0.0):
+    '''pipeline.run over input_path with the fixture replayed, run in a process of its own'''
+    logging.disable(logging.CRITICAL)
+    logging.getLogger('pipeline').disabled = True
+    run(input_path, output_path, {}, batch_size = 7, session = FakeSession(load_fixture(), latency = latency), log_level = 'error', dedupe = Deduplicator())
+
+
+def checkpoint_rows(output_path):
+    '''Output : (int) rows the checkpoint of output_path has finished'''
+    try:
+        with open(output_path + '.checkpoint') as f:
+            return json.load(f)['rows']
+    except (FileNotFoundError, ValueError):
+        return 0
+
+
+def read_lines(path):
+    with open(path, encoding = 'utf-8') as f:
+        return f.read().splitlines()
+
+
+if __name__ == '__main__':
+    rng = random.Random(0)
+    citations = load_fixture()['citations'] * 3
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'citations.jsonl')
+        with open(input_path, 'w', encoding = 'utf-8') as f:
+            for i, cite_string in enumerate(citations):
+                f.write(json.dumps({'page_id' : i, 'template' : cite_string}) + '\n')
+
+        expected_path = os.path.join(tmp, 'expected.jsonl')
+        match_all(input_path, expected_path)
+        expected = read_lines(expected_path)
+        assert len(expected) == len(citations)
+
+        output_path = os.path.join(tmp, 'resumed.jsonl')
+        kills = 0
+        unsaved_writes = 0
+        while True:
+            done = checkpoint_rows(output_path)
+            process = multiprocessing.Process(target = match_all, args = (input_path, output_path, 0.001))
+            process.start()
+            #once a batch is written, the kill lands anywhere in the next one or two
+            while process.is_alive() and checkpoint_rows(output_path) == done:
+                time.sleep(0.01)
+            process.join(rng.uniform(0, 0.5))
+            if not process.is_alive():
+                assert process.exitcode == 0, 'the run failed'
+                break
+            process.kill()
+            process.join()
+            kills += 1
+            if rng.random() < 0.5 and os.path.exists(output_path):
+                #lines written after the last checkpoint, the last cut short, as a crash in the middle of a batch's writes leaves them
+                with open(expected_path, 'rb') as f:
+                    unsaved = b''.join(f.readlines()[checkpoint_rows(output_path):][:3])
+                with open(output_path, 'ab') as f:
+                    f.write(unsaved[:-20])
+                unsaved_writes += 1
+
+        lines = read_lines(output_path)
+        assert all(line.endswith('}') for line in lines), 'a torn line was kept'
+        rows = [json.loads(line)['row'] for line in lines]
+        assert len(rows) == len(set(rows)), f'{len(rows) - len(set(rows))} duplicate rows'
+        assert rows == list(range(len(citations))), f'missing rows: {sorted(set(range(len(citations))) - set(rows))[:10]}'
+        assert lines == expected, 'resumed output differs from an uninterrupted run'
+        with open(output_path + '.checkpoint') as f:
+            state = json.load(f)
+        assert state['rows'] == len(citations) and state['output_bytes'] == os.path.getsize(output_path)
+        assert kills > 0, 'no run was interrupted, the runs are too fast for this check'
+        print(f'{len(citations)} rows after {kills} kills, {unsaved_writes} leaving lines past the checkpoint: no duplicate or missing lines, output equal to an uninterrupted run')
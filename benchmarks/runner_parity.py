@@ -0,0 +1,95 @@
+# Title : Sharded Runner Parity Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that runner.run writes exactly what pipeline.run writes on one process. The benchmark
+#fixture's citations, twice over so duplicates meet in one worker, are matched on one process, on
+#four worker processes with small batches, so workers take batches from each other's queues, and as
+#three machines' shards of two processes each. The sharded output files have to hold every row once
+#and, merged, equal the one process output line for line. The workers run with another hash seed than
+#this process, so output that depends on the seed, e.g. on the order of a set, shows up as a difference.
+#Run from the repository root: python benchmarks/runner_parity.py
+
+import json
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+
+import pipeline
+import runner
+from canonical import Deduplicator, citation_key
+from wiki2ia import parse_citation
+
+
+class WorkerLog(logging.Handler):
+    '''keeps the progress messages of a run, for the batches each worker ran'''
+
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def read_lines(path):
+    with open(path, encoding = 'utf-8') as f:
+        return f.read().splitlines()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level = logging.ERROR)
+    log = WorkerLog()
+    pipeline.progress.addHandler(log)
+    pipeline.progress.propagate = False
+
+    fixture = load_fixture()
+    citations = fixture['citations'] * 2
+    #spawned workers inherit the environment, so they hash strings differently from this process
+    os.environ['PYTHONHASHSEED'] = str(int(os.environ.get('PYTHONHASHSEED', '0')) + 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, 'citations.jsonl')
+        with open(input_path, 'w', encoding = 'utf-8') as f:
+            for i, cite_string in enumerate(citations):
+                f.write(json.dumps({'page_id' : i, 'template' : cite_string}) + '\n')
+
+        def match_kwargs():
+            return dict(session = FakeSession(fixture), log_level = 'error', all_results = True, dedupe = Deduplicator())
+
+        start = time.perf_counter()
+        pipeline.run(input_path, os.path.join(tmp, 'one.jsonl'), {}, batch_size = 10, **match_kwargs())
+        expected = read_lines(os.path.join(tmp, 'one.jsonl'))
+        print(f'1 process          {len(expected)} rows, {time.perf_counter() - start:.2f} s')
+
+        start = time.perf_counter()
+        runner.run(input_path, os.path.join(tmp, 'four.jsonl'), {}, 4, batch_size = 2, search_cache_size = 0, **match_kwargs())
+        lines = read_lines(os.path.join(tmp, 'four.jsonl'))
+        assert lines == expected, f'4 processes: {sum(a != b for a, b in zip(lines, expected))} lines differ from one process, {len(lines)} lines'
+        ran = json.loads([message for message in log.messages if message.startswith('Finished')][-1].rsplit('batches per worker ', 1)[-1].rstrip('.'))
+        #batches of each worker's own queue, as assigned by the hash of the canonical key
+        queued = [0] * 4
+        for cite_string in citations:
+            queued[runner.assign_shard(citation_key(parse_citation(cite_string), True), 4)[1]] += 1
+        own = [math.ceil(n / 2) for n in queued]
+        assert sum(ran) == sum(own), f'{sum(ran)} batches run, {sum(own)} queued'
+        print(f'4 processes        same {len(lines)} rows, batches queued per worker {own}, run per worker {ran}, {time.perf_counter() - start:.2f} s')
+
+        machines = 3
+        shards = []
+        for machine in range(machines):
+            path = os.path.join(tmp, f'shard_{machine}.jsonl')
+            runner.run(input_path, path, {}, 2, shard = (machine, machines), batch_size = 3, search_cache_size = 0, **match_kwargs())
+            shards.append(read_lines(path))
+        rows = [json.loads(line)['row'] for lines in shards for line in lines]
+        assert sorted(rows) == list(range(len(citations))), 'the shards miss rows or share rows'
+        merged = [line for _, line in sorted((json.loads(line)['row'], line) for lines in shards for line in lines)]
+        assert merged == expected, f'--shard k/{machines}: {sum(a != b for a, b in zip(merged, expected))} lines differ from one process'
+        print(f'--shard k/{machines}        {"+".join(str(len(lines)) for lines in shards)} rows, every row once, merged equal to one process')
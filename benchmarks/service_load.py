@@ -0,0 +1,142 @@
+# Title : Matching Service Load Test
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Load tests service.py on one machine. The service runs in this process on a free port, with
+#replay.FakeSession answering its searches and metadata requests from the benchmark fixture, and
+#client threads post the fixture's citations to /match. Reports requests per second, p50 and p95
+#latency, the requests refused with 503 and how many requests each predict pass served, and checks
+#every answer against get_matches on the same citations. Then floods a service with a small
+#--max-in-flight to check that it refuses the excess rather than queueing it.
+#Run from the repository root: python benchmarks/service_load.py --clients 16
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FIXTURE, FakeSession, load_fixture
+from suite import percentiles
+
+from service import MatchService, serve
+from wiki2ia import get_matches
+
+
+def post(url, body):
+    '''Output : (tuple) status and decoded JSON body of a POST'''
+    request = urllib.request.Request(url, data = json.dumps(body).encode('utf-8'), headers = {'Content-Type' : 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout = 120) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def urls(matches):
+    '''Output : (list) sorted urls of matches, a get_match result or the list /match answers with'''
+    if isinstance(matches, dict):
+        matches = list(matches.values())
+    return sorted(match['url_ia'] for match in matches) if matches else []
+
+
+def load(url, citations, clients, retry = True):
+    '''
+    Input :
+        url : (str) address of the service
+        citations : (list) posted once each, by clients threads taking the next one in turn
+        clients : (int) concurrent client threads
+        retry : (bool) post a citation refused with 503 again after a short wait
+
+    Output : (dict) seconds taken, latencies of the answered requests, 503 count and the answer to every citation
+    '''
+    answers = [None] * len(citations)
+    latencies = []
+    refused = [0]
+    lock = threading.Lock()
+    position = iter(range(len(citations)))
+
+    def client():
+        while True:
+            with lock:
+                i = next(position, None)
+            if i is None:
+                return
+            while True:
+                start = time.perf_counter()
+                status, body = post(url + '/match', {'citation' : citations[i]})
+                seconds = time.perf_counter() - start
+                with lock:
+                    if status == 503:
+                        refused[0] += 1
+                    else:
+                        latencies.append(seconds)
+                if status != 503 or not retry:
+                    break
+                time.sleep(0.005)
+            answers[i] = (status, body)
+
+    threads = [threading.Thread(target = client) for _ in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return {'seconds' : time.perf_counter() - start, 'latencies' : latencies, 'refused' : refused[0], 'answers' : answers}
+
+
+def run_service(fixture, latency, **kwargs):
+    '''Output : (tuple) the MatchService over a FakeSession, its server and its url, answering in a background thread'''
+    service = MatchService({}, session = FakeSession(fixture, latency), log_level = 'error', **kwargs)
+    server = serve(service, port = 0)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return service, server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def stop(service, server):
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Load test service.py against replayed Internet Archive responses.')
+    parser.add_argument('--fixture', default = FIXTURE)
+    parser.add_argument('--clients', type = int, default = 16, help = 'concurrent client threads')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'times every citation of the fixture is posted')
+    parser.add_argument('--latency', type = float, default = 0.02, help = 'seconds every fake Internet Archive request sleeps')
+    parser.add_argument('--window-ms', type = float, default = 10)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture(args.fixture)
+    citations = fixture['citations'] * args.repeat
+    expected = [urls(result) for result in get_matches({}, fixture['citations'], log_level = 'error', session = FakeSession(fixture))] * args.repeat
+
+    for clients, window in [(1, 0), (args.clients, args.window_ms / 1000)]:
+        service, server, url = run_service(fixture, args.latency, window = window, max_in_flight = args.clients)
+        result = load(url, citations, clients)
+        stop(service, server)
+
+        wrong = [i for i, (status, body) in enumerate(result['answers']) if status != 200 or urls(body['matches']) != expected[i]]
+        assert not wrong, f'{len(wrong)} answers differ from get_matches, first: {citations[wrong[0]][:70]}'
+        latency_ms = percentiles(result['latencies'])
+        print(f'{clients:>3} clients, {window * 1000:4.0f} ms window: {len(citations) / result["seconds"]:7.1f} requests/s, '
+            f'p50 {latency_ms["p50"]:7.1f} ms, p95 {latency_ms["p95"]:7.1f} ms, {result["refused"]} refused, '
+            f'{service.batcher.frames / max(1, service.batcher.batches):.1f} requests and {service.batcher.rows / max(1, service.batcher.batches):.0f} candidates per predict pass')
+
+    #backpressure: four times as many clients as the service takes, each posting once without retrying
+    service, server, url = run_service(fixture, 0.2, max_in_flight = 2)
+    result = load(url, fixture['citations'][:8], 8, retry = False)
+    metrics = service.metrics()
+    stop(service, server)
+    statuses = [status for status, _ in result['answers']]
+    assert set(statuses) <= {200, 503} and 0 < statuses.count(503) < len(statuses), statuses
+    assert f'wiki2ia_service_requests_total{{status="503"}} {statuses.count(503)}' in metrics
+    print(f'backpressure: max_in_flight 2, 8 concurrent requests, {statuses.count(200)} answered, {statuses.count(503)} refused with 503')
@@ -0,0 +1,120 @@
+# Title : Session Manager Check Against a Stub Server
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Runs the pooled session of session.py against a local HTTP server that answers 429 and 503 at
+#random, never answers for one path and is down for another. Checks that every flaky request ends in
+#a 200, that a dead endpoint raises IAServiceError instead of looking like an empty result, and that
+#the rate limit holds for the threads of one process and across processes sharing a SharedTokenBucket.
+#Run from the repository root: python benchmarks/session_stub.py
+
+import os
+import sys
+import json
+import random
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from session import IAServiceError, SessionManager, SharedTokenBucket
+
+FAILURE_RATE = 0.3
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def do_GET(self):
+        with self.lock:
+            roll = self.rng.random()
+        if self.path.startswith('/down'):
+            status = 503
+        elif self.path.startswith('/flaky') and roll < FAILURE_RATE / 2:
+            status = 429
+        elif self.path.startswith('/flaky') and roll < FAILURE_RATE:
+            status = 503
+        else:
+            status = 200
+        body = json.dumps({'metadata' : {'identifier' : self.path.rsplit('/', 1)[-1]}} if status == 200 else {}).encode()
+        self.send_response(status)
+        if status == 429:
+            self.send_header('Retry-After', '0')
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def fetch_all(sessions, url, n, threads):
+    s = sessions.get({})
+    with ThreadPoolExecutor(threads) as pool:
+        return list(pool.map(lambda i: s.get(f'{url}/flaky/item{i}', timeout = 5).json()['metadata']['identifier'], range(n)))
+
+
+def process_worker(sessions, url, n, out):
+    start = time.monotonic()
+    fetch_all(sessions, url, n, 4)
+    out.put(time.monotonic() - start)
+
+
+if __name__ == '__main__':
+    server, url = start_stub()
+
+    #threads of one process, flaky endpoint, 50 requests per second
+    sessions = SessionManager(rate = 50, burst = 5, retries = 8, backoff = 0.05)
+    start = time.monotonic()
+    ids = fetch_all(sessions, url, 200, 8)
+    elapsed = time.monotonic() - start
+    assert ids == [f'item{i}' for i in range(200)]
+    retried = sessions.adapter({}).retried
+    print(f'flaky: 200 requests all succeeded after {retried} retries in {elapsed:.2f} s, '
+          f'{(200 + retried) / elapsed:.1f} requests/sec against a limit of 50')
+    assert (200 + retried) / elapsed <= 50 * 1.1
+
+    #dead endpoint gives a typed error after the retries
+    dead = SessionManager(retries = 3, backoff = 0.01)
+    try:
+        dead.get({}).get(f'{url}/down/item', timeout = 5)
+        raise AssertionError('expected IAServiceError')
+    except IAServiceError as e:
+        print(f'down: IAServiceError status {e.status} after {dead.adapter({}).retried} retries')
+        assert e.status == 503
+
+    #nothing listening gives a typed error as well
+    try:
+        dead.get({}).get('http://127.0.0.1:9/metadata/item', timeout = 1)
+        raise AssertionError('expected IAServiceError')
+    except IAServiceError as e:
+        print(f'refused: IAServiceError {type(e).__name__}, status {e.status}')
+
+    #two processes drawing from one shared budget of 40 requests per second
+    context = multiprocessing.get_context('spawn')
+    shared = SessionManager(bucket = SharedTokenBucket(40, burst = 2), retries = 8, backoff = 0.05)
+    out = context.Queue()
+    workers = [context.Process(target = process_worker, args = (shared, url, 60, out)) for _ in range(2)]
+    start = time.monotonic()
+    for process in workers:
+        process.start()
+    times = [out.get() for _ in workers]
+    for process in workers:
+        process.join()
+    elapsed = time.monotonic() - start
+    print(f'shared: 2 processes x 60 requests in {elapsed:.2f} s, at least {120 / max(times):.1f} requests/sec '
+          f'against a shared limit of 40')
+    assert 120 / max(times) <= 40 * 1.1
+
+    server.shutdown()
@@ -0,0 +1,78 @@
+# Title : Match Statistics Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that stats.MatchStats counts the API calls and bytes of a get_matches call, and of each of its
+#citations, when other calls use the same session at the same time. The benchmark fixture's citations
+#are matched in two halves, one after the other and then on two threads at once, on one slowed down
+#FakeSession with concurrent metadata fetches, each half with its own MatchStats and then both with one.
+#Every citation record and every total has to equal the one of the calls run alone, and the session
+#has no hook left once the calls end.
+#Run from the repository root: python benchmarks/stats_check.py
+
+import logging
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+
+from stats import MatchStats
+from wiki2ia import get_matches
+
+COUNTED = ['api_calls', 'bytes_downloaded', 'candidates_scored']
+
+
+def match_half(session, cite_strings, stats):
+    get_matches({}, cite_strings, log_level = 'error', session = session, all_results = True, workers = 4, stats = stats)
+
+
+def counts(records):
+    '''Output : (list) the counters of every citation record, in citation order'''
+    return [dict((name, record[name]) for name in COUNTED) for record in sorted(records, key = lambda record: record['citation'])]
+
+
+def concurrently(session, halves, stats):
+    threads = [threading.Thread(target = match_half, args = (session, half, stats_half)) for half, stats_half in zip(halves, stats)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    citations = fixture['citations']
+    halves = [citations[::2], citations[1::2]]
+
+    alone = []
+    for half in halves:
+        records = []
+        session = FakeSession(fixture)
+        stats = MatchStats(callback = records.append)
+        match_half(session, half, stats)
+        assert stats.counters['api_calls'] == session.calls, f'{stats.counters["api_calls"]} API calls counted, {session.calls} made'
+        alone.append((counts(records), dict((name, stats.counters[name]) for name in COUNTED)))
+    print(f'alone        {" and ".join(str(totals["api_calls"]) for _, totals in alone)} API calls, as many as the session answered')
+
+    session = FakeSession(fixture, latency = 0.002)
+    records = [[], []]
+    stats = [MatchStats(callback = records[0].append), MatchStats(callback = records[1].append)]
+    concurrently(session, halves, stats)
+    for (expected, totals), stats_half, records_half in zip(alone, stats, records):
+        assert counts(records_half) == expected, 'a citation record differs from the call run alone'
+        assert dict((name, stats_half.counters[name]) for name in COUNTED) == totals, f'{dict(stats_half.counters)} differs from {totals}'
+    assert session.hooks['response'] == [], f'{len(session.hooks["response"])} hooks left on the session'
+    print(f'concurrent   two calls on one session, each with its own MatchStats: the records of all {len(citations)} citations and the totals equal the calls run alone, no hook left')
+
+    session = FakeSession(fixture, latency = 0.002)
+    shared = []
+    stats = MatchStats(callback = shared.append)
+    concurrently(session, halves, [stats, stats])
+    assert stats.counters['api_calls'] == session.calls == sum(totals['api_calls'] for _, totals in alone)
+    assert sorted(map(str, counts(shared))) == sorted(str(c) for expected, _ in alone for c in expected), 'a citation record differs from the call run alone'
+    assert session.hooks['response'] == []
+    print(f'shared       two calls on one session with one MatchStats: {stats.counters["api_calls"]} API calls, the citation records equal the calls run alone')
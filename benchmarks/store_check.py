@@ -0,0 +1,93 @@
+# Title : Result Store Check
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Matches the benchmark fixture's citations through a store.ResultStore four times: into an empty
+#store, again with the store filled, with a changed model version and with every entry stale. Checks
+#that every run returns what get_matches returns without a store, that the filled store needs no
+#requests, that a new model version re-predicts from stored features without requests, and that
+#stale entries are looked up again. Then reruns the filled store with other lookup settings, each of
+#which has to look its citations up again and return what get_matches returns with those settings.
+#Run from the repository root: python benchmarks/store_check.py
+
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import FakeSession, load_fixture
+
+import wiki2ia
+from blocking import Blocker
+from store import ResultStore
+from wiki2ia import MODEL_PATH, get_matches, model_version
+
+
+def same(a, b):
+    '''Output : (bool) whether two get_match results are equal, values and types, with NaN equal to NaN'''
+    if a is None or b is None:
+        return a is b
+    if a.keys() != b.keys():
+        return False
+    for name in a:
+        for column in set(a[name]) | set(b[name]):
+            x, y = a[name].get(column), b[name].get(column)
+            if isinstance(x, float) and isinstance(y, float) and math.isnan(x) and math.isnan(y):
+                continue
+            if type(x) != type(y) or x != y:
+                return False
+    return True
+
+
+if __name__ == '__main__':
+    logging.disable(logging.CRITICAL)
+    fixture = load_fixture()
+    citations = fixture['citations']
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'results.sqlite')
+        for all_results in [False, True]:
+            expected = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = all_results)
+
+            def run(name, store):
+                session = FakeSession(fixture)
+                start = time.perf_counter()
+                results = get_matches({}, citations, log_level = 'error', session = session, all_results = all_results, store = store)
+                seconds = time.perf_counter() - start
+                assert all(same(a, b) for a, b in zip(expected, results)), f'{name}: results differ from get_matches without a store'
+                print(f'all_results={all_results!s:<5} {name:<15} {session.calls:4d} requests, {seconds:5.2f} s, {store.stats()}')
+                return session.calls
+
+            assert run('empty store', ResultStore(path)) > 0
+            assert run('filled store', ResultStore(path)) == 0
+
+            #as if finalized_model.sav had been replaced
+            current = model_version()
+            wiki2ia._model_versions[MODEL_PATH] = 'retrained'
+            store = ResultStore(path)
+            assert run('new model', store) == 0 and store.repredicted > 0
+            wiki2ia._model_versions[MODEL_PATH] = current
+
+            store = ResultStore(path, max_age = 0)
+            assert run('stale entries', store) > 0 and store.stale == len(citations)
+            os.remove(path)
+
+        #settings that change the candidates found, each against the store filled with the defaults
+        settings = [{'cap' : 100}, {'retrieval' : 'search'}, {'blocker' : Blocker()}, {'blocker' : Blocker(year_window = 5)},
+            {'refine' : False}, {'refine_target' : 10}, {'direct_lookup' : False}]
+        get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = True, store = ResultStore(path))
+        for kwargs in settings:
+            expected = get_matches({}, citations, log_level = 'error', session = FakeSession(fixture), all_results = True, **kwargs)
+            store = ResultStore(path)
+            session = FakeSession(fixture)
+            results = get_matches({}, citations, log_level = 'error', session = session, all_results = True, store = store, **kwargs)
+            assert session.calls > 0 and store.hits == 0, f'{kwargs}: {store.hits} citations answered from entries of other settings'
+            assert all(same(a, b) for a, b in zip(expected, results)), f'{kwargs}: results differ from get_matches without a store'
+            session = FakeSession(fixture)
+            get_matches({}, citations, log_level = 'error', session = session, all_results = True, store = ResultStore(path), **kwargs)
+            assert session.calls == 0, f'{kwargs}: {session.calls} requests with its own entries stored'
+        print(f'settings     {len(settings)} other lookup settings each look every citation up again, then answer from their own entries')
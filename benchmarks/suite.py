@@ -0,0 +1,283 @@
+# Title : Offline Benchmark Suite
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Replays the recorded responses of fixtures/ia_responses.json.gz through replay.FakeSession and times
+#the matcher on its citations: the vignette set, the rest of fixtures/citations.txt and a few titles
+#with 200 to 650 candidates. Reports citations per second one at a time and in one batch, p50 and p95
+#latency per citation and per stage, and the peak memory of every stage. Stages are timed and memory
+#is traced in passes of their own, so neither slows the timed ones. Without network the numbers only move when the
+#code does, so two revisions can be compared:
+#
+#    python benchmarks/suite.py                        this working tree
+#    python benchmarks/suite.py --compare HEAD~3       HEAD~3 against this working tree
+#    python benchmarks/suite.py --compare v1 --against v2 --output report.json
+#
+#A revision is checked out with git worktree into a temporary directory and run by this file, so
+#revisions older than the suite, down to the original get_match, can be measured. Stage timings need
+#stats.py, for older revisions only the totals are reported. The matches found for every citation
+#are compared as well, a faster revision that finds other books is not an improvement.
+
+import argparse
+import inspect
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+
+from replay import FIXTURE, REPO_DIR, FakeSession, load_fixture
+
+
+def percentiles(values):
+    '''Output : (dict) p50, p95 and mean of values in milliseconds, None when there are none'''
+    if not values:
+        return None
+    values = np.array(values) * 1000
+    return {'p50' : round(float(np.percentile(values, 50)), 3), 'p95' : round(float(np.percentile(values, 95)), 3), 'mean' : round(float(values.mean()), 3)}
+
+
+def profiling_stats(stats_module, memory = False):
+    '''
+    Output : (MatchStats) of the revision under test, also keeping the duration of every stage run and,
+        with memory, the largest growth in traced memory while each stage ran
+    '''
+
+    class ProfilingStats(stats_module.MatchStats):
+
+        def __init__(self):
+            super().__init__()
+            self.durations = {}
+            self.peaks = {}
+            self.peak = 0
+            self._open = []
+
+        def _fold(self):
+            #stages can be nested, so a peak is added to every open stage before the peak is reset
+            current, peak = tracemalloc.get_traced_memory()
+            self.peak = max(self.peak, peak)
+            for entry in self._open:
+                entry[1] = max(entry[1], peak - entry[0])
+            tracemalloc.reset_peak()
+            return current
+
+        @contextmanager
+        def stage(self, name):
+            if memory:
+                self._open.append([self._fold(), 0])
+            start = time.perf_counter()
+            try:
+                with super().stage(name):
+                    yield
+            finally:
+                self.durations.setdefault(name, []).append(time.perf_counter() - start)
+                if memory:
+                    self._fold()
+                    self.peaks[name] = max(self.peaks.get(name, 0), self._open.pop()[1])
+
+    return ProfilingStats()
+
+
+def measure(tree, fixture_path, repeat, latency):
+    '''
+    Input :
+        tree : (str) directory of the revision to measure, its modules are imported from there
+        fixture_path : (str) see replay.load_fixture
+        repeat : (int) timed passes over the citations
+        latency : (float) seconds every fake request sleeps
+
+    Output : (dict) the measurements and the matches of every citation
+    '''
+    sys.path.insert(0, tree)
+    os.chdir(tree)
+    import utils
+    import wiki2ia
+    try:
+        import stats as stats_module
+    except ImportError:
+        stats_module = None
+
+    fixture = load_fixture(fixture_path)
+    citations = fixture['citations']
+    session = FakeSession(fixture, latency)
+    #every revision opens its session through get_session, whichever module it comes from
+    for module in (utils, wiki2ia):
+        if hasattr(module, 'get_session'):
+            module.get_session = lambda config, **kwargs: session
+
+    supports_stats = stats_module is not None and 'stats' in inspect.signature(wiki2ia.get_match).parameters
+    match = wiki2ia.get_match
+    logging.disable(logging.CRITICAL)
+
+    def match_one(cite, stats = None):
+        '''Output : (list) sorted urls of the matches, or the exception the revision raised'''
+        try:
+            if stats is not None:
+                result = match({}, cite, log_level = 'error', stats = stats)
+            else:
+                result = match({}, cite, log_level = 'error')
+        except Exception as e:
+            return [f'raised {type(e).__name__}']
+        return sorted(row['url_ia'] for row in result.values()) if result else []
+
+    #loads the model and warms the caches of the revision outside the timed passes
+    match_one(citations[0])
+
+    #timed without stats, so revisions with and without it are compared on the same work
+    latencies = []
+    matches = []
+    start = time.perf_counter()
+    for run in range(repeat):
+        for cite in citations:
+            t = time.perf_counter()
+            found = match_one(cite)
+            latencies.append(time.perf_counter() - t)
+            if run == 0:
+                matches.append(found)
+    single_seconds = time.perf_counter() - start
+
+    stats = profiling_stats(stats_module) if supports_stats else None
+    if stats is not None:
+        for _ in range(repeat):
+            for cite in citations:
+                match_one(cite, stats)
+
+    batch_seconds = None
+    #a batch stops at the first citation that raises
+    if hasattr(wiki2ia, 'get_matches') and not any(found[0].startswith('raised ') for found in matches if found):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            wiki2ia.get_matches({}, citations, log_level = 'error')
+        batch_seconds = time.perf_counter() - start
+
+    #peak memory in a pass of its own, tracemalloc slows every allocation down
+    tracemalloc.start()
+    memory_stats = profiling_stats(stats_module, memory = True) if supports_stats else None
+    calls = session.calls
+    for cite in citations:
+        match_one(cite, memory_stats)
+    peak = max(tracemalloc.get_traced_memory()[1], memory_stats.peak if memory_stats is not None else 0)
+    tracemalloc.stop()
+    calls = session.calls - calls
+
+    report = {
+        'tree' : tree,
+        'revision' : subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output = True, text = True).stdout.strip(),
+        'fixture' : fixture.get('source'),
+        'citations' : len(citations),
+        'repeat' : repeat,
+        'latency_per_request' : latency,
+        'requests_per_pass' : calls,
+        'throughput' : {
+            'single' : round(len(citations) * repeat / single_seconds, 2),
+            'batch' : round(len(citations) * repeat / batch_seconds, 2) if batch_seconds else None,
+        },
+        'latency_ms' : percentiles(latencies),
+        'peak_memory_mb' : round(peak / 2 ** 20, 2),
+        'stages' : {},
+        'errors' : sum(1 for found in matches if found and found[0].startswith('raised ')),
+        'labels' : [cite[:70] for cite in citations],
+        'matches' : matches,
+    }
+    if stats is not None:
+        for name in stats_module.STAGES:
+            if name in stats.durations:
+                report['stages'][name] = dict(percentiles(stats.durations[name]), runs = len(stats.durations[name]) // repeat,
+                    seconds = round(sum(stats.durations[name]) / repeat, 4), peak_memory_mb = round(memory_stats.peaks.get(name, 0) / 2 ** 20, 2))
+    return report
+
+
+def run_revision(revision, args):
+    '''Output : (dict) report of measure for a git revision, None for the working tree, run in a fresh interpreter'''
+    command = [sys.executable, os.path.abspath(__file__), '--fixture', args.fixture, '--repeat', str(args.repeat), '--latency', str(args.latency)]
+    with tempfile.TemporaryDirectory() as tmp:
+        tree = REPO_DIR
+        if revision is not None:
+            tree = os.path.join(tmp, 'tree')
+            subprocess.run(['git', '-C', REPO_DIR, 'worktree', 'add', '--detach', '--quiet', tree, revision], check = True)
+        try:
+            output = os.path.join(tmp, 'report.json')
+            #the author cleaning drops duplicates through a set, so matches depend on the hash seed
+            subprocess.run(command + ['--tree', tree, '--output', output], check = True, env = dict(os.environ, PYTHONHASHSEED = '0'))
+            with open(output) as f:
+                report = json.load(f)
+        finally:
+            if revision is not None:
+                subprocess.run(['git', '-C', REPO_DIR, 'worktree', 'remove', '--force', tree], check = True)
+    report['revision'] = revision or f'working tree ({report["revision"]})'
+    return report
+
+
+def print_report(report):
+    print(f'{report["revision"]}: {report["citations"]} citations x {report["repeat"]}, fixture {report["fixture"]}')
+    print(f'  throughput  {report["throughput"]["single"]} citations/sec one at a time, {report["throughput"]["batch"]} in a batch')
+    print(f'  latency     p50 {report["latency_ms"]["p50"]} ms, p95 {report["latency_ms"]["p95"]} ms, peak memory {report["peak_memory_mb"]} MB')
+    for name, s in report['stages'].items():
+        print(f'  {name:<11} {s["seconds"]:>8.4f} s  p50 {s["p50"]:>8.3f} ms  p95 {s["p95"]:>8.3f} ms  peak {s["peak_memory_mb"]:>6.2f} MB  {s["runs"]} runs')
+
+
+def compare(base, head):
+    '''Prints head against base, metric by metric, and the citations whose matches differ'''
+    def row(label, a, b, lower_is_better = True):
+        if a is None or b is None:
+            print(f'  {label:<28} {str(a):>10} {str(b):>10}')
+            return
+        change = (b - a) / a * 100 if a else 0.0
+        better = (change < 0) == lower_is_better
+        print(f'  {label:<28} {a:>10} {b:>10}  {change:+7.1f}% {"better" if better and abs(change) >= 10 else "worse" if abs(change) >= 10 else ""}')
+
+    print(f'\n{base["revision"]} -> {head["revision"]}')
+    row('single citations/sec', base['throughput']['single'], head['throughput']['single'], False)
+    row('batch citations/sec', base['throughput']['batch'], head['throughput']['batch'], False)
+    row('latency p50 ms', base['latency_ms']['p50'], head['latency_ms']['p50'])
+    row('latency p95 ms', base['latency_ms']['p95'], head['latency_ms']['p95'])
+    row('peak memory MB', base['peak_memory_mb'], head['peak_memory_mb'])
+    row('requests per pass', base['requests_per_pass'], head['requests_per_pass'])
+    for name in head['stages']:
+        if name in base['stages']:
+            row(f'{name} p95 ms', base['stages'][name]['p95'], head['stages'][name]['p95'])
+            row(f'{name} peak MB', base['stages'][name]['peak_memory_mb'], head['stages'][name]['peak_memory_mb'])
+
+    differ = [i for i, (a, b) in enumerate(zip(base['matches'], head['matches'])) if a != b]
+    print(f'  matches differ for {len(differ)} of {len(head["matches"])} citations')
+    short = lambda found: f'{len(found)} matches {found[:3]}{" ..." if len(found) > 3 else ""}'
+    for i in differ:
+        print(f'    {i}: {head["labels"][i]}\n       {short(base["matches"][i])}\n    -> {short(head["matches"][i])}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Offline benchmark of the matcher against recorded Internet Archive responses.')
+    parser.add_argument('--fixture', default = FIXTURE)
+    parser.add_argument('--repeat', type = int, default = 3, help = 'timed passes over the citations')
+    parser.add_argument('--latency', type = float, default = 0.0, help = 'seconds each fake request sleeps')
+    parser.add_argument('--compare', metavar = 'REVISION', help = 'git revision to compare against')
+    parser.add_argument('--against', metavar = 'REVISION', help = 'git revision compared to --compare, the working tree by default')
+    parser.add_argument('--output', help = 'write the report(s) as JSON here')
+    parser.add_argument('--tree', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.fixture = os.path.abspath(args.fixture)
+
+    if args.tree:
+        report = measure(args.tree, args.fixture, args.repeat, args.latency)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f)
+        else:
+            print_report(report)
+        sys.exit(0)
+
+    reports = []
+    for revision in ([args.compare, args.against] if args.compare else [args.against]):
+        reports.append(run_revision(revision, args))
+        print_report(reports[-1])
+    if len(reports) == 2:
+        compare(*reports)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports if len(reports) == 2 else reports[0], f, indent = 2)
@@ -0,0 +1,67 @@
+# Title : Template Parsing Check and Benchmark
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks utils.parse_cite_book on templates the old split on '|' and '=' got wrong: spaced keys,
+#wiki links, nested templates, urls with a query string, comments and repeated parameters. Then
+#writes the benchmark fixture's citations into a small pages-articles dump and checks that
+#dump.iter_cite_books finds every one and parses it as parse_cite_book does, and times the parsing.
+#Run from the repository root: python benchmarks/template_parse.py
+
+import os
+import sys
+import tempfile
+import timeit
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from replay import load_fixture
+
+from dump import iter_cite_books
+from utils import parse_cite_book
+from wiki2ia import KEYS_TO_KEEP
+
+CASES = [
+    ('{{cite book |title = Foo | last = X }}', {'title_wiki' : 'Foo', 'last_wiki' : 'X'}),
+    ('{{cite book|title=Foo|publisher=[[University of Hawaii|UH]]}}', {'title_wiki' : 'Foo', 'publisher_wiki' : 'UH'}),
+    ('{{cite book|title=Foo|publisher= [[University of Hawaii]] }}', {'title_wiki' : 'Foo', 'publisher_wiki' : 'University of Hawaii'}),
+    ('{{cite book|title={{lang|fr|Île de Pâques}}|last=Métraux}}', {'title_wiki' : 'Île de Pâques', 'last_wiki' : 'Métraux'}),
+    ('{{cite book|title={{lang|fr|[[Île de Pâques|Île]]}} et ses statues}}', {'title_wiki' : 'Île et ses statues'}),
+    ('{{cite book|title={{nowrap|Foo Bar}}|date={{circa|1900}}|url=http://example.org/foo {{dead link|date=May 2020}}}}', {'title_wiki' : 'Foo Bar', 'date_wiki' : '1900', 'url_wiki' : 'http://example.org/foo'}),
+    ('{{cite book|title=Foo|url=https://archive.org/details/foo?q=a&view=theater}}', {'title_wiki' : 'Foo', 'url_wiki' : 'https://archive.org/details/foo?q=a&view=theater'}),
+    ('{{cite book|title=Foo <!-- |last=Hidden -->|last=Shown}}', {'title_wiki' : 'Foo', 'last_wiki' : 'Shown'}),
+    ('{{cite book|title=Old|title=New|last=}}', {'title_wiki' : 'New'}),
+    ('{{cite book|Foo|title=Bar}}', {'title_wiki' : 'Bar'}),
+]
+
+
+def write_dump(path, citations):
+    '''writes a pages-articles dump with a page per citation, the citation between two sentences'''
+    with open(path, 'w', encoding = 'utf-8') as f:
+        f.write('<mediawiki xmlns="http://www.mediawiki.org/xml/export-0.10/">\n')
+        for i, cite_string in enumerate(citations):
+            text = f'Some prose.<ref>{cite_string}</ref> More prose {{{{citation needed}}}}.'
+            f.write(f'<page><title>Page {i}</title><ns>0</ns><id>{i}</id><revision><text>{escape(text)}</text></revision></page>\n')
+        f.write('</mediawiki>\n')
+
+
+if __name__ == '__main__':
+    for template, expected in CASES:
+        parsed = parse_cite_book(template, KEYS_TO_KEEP)
+        assert parsed == expected, f'{template}: {parsed}'
+    print(f'cases: {len(CASES)} templates parsed as expected')
+
+    citations = load_fixture()['citations']
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'pages.xml')
+        write_dump(path, citations)
+        records = list(iter_cite_books(path))
+    assert [record['template'] for record in records] == citations, 'iter_cite_books did not find every citation'
+    for record in records:
+        fields = dict((k, v) for k, v in record.items() if k not in ('page_id', 'page_title', 'template'))
+        assert fields == parse_cite_book(record['template'], KEYS_TO_KEEP), f'dump and parse_cite_book differ: {record["template"][:70]}'
+    print(f'dump: {len(records)} fixture citations found, fields equal to parse_cite_book')
+
+    seconds = min(timeit.repeat(lambda: [parse_cite_book(cite_string, KEYS_TO_KEEP) for cite_string in citations], number = 100, repeat = 3))
+    print(f'parse_cite_book: {seconds / (100 * len(citations)) * 1e6:.1f} us per citation')
@@ -0,0 +1,83 @@
+# Title : Tree Model Parity Check and Benchmark
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Checks that trees.TreeModel, over the export in finalized_model_trees/, predicts exactly what the
+#pickled finalized_model.sav predicts. The held out features are the features of generated candidate
+#batches, as in feature_parity.py, and random feature rows with missing values. Then times loading in
+#a fresh interpreter and predicting at a few batch sizes.
+#Run from the repository root: python benchmarks/tree_parity.py
+
+import os
+import sys
+import pickle
+import subprocess
+import time
+import timeit
+import warnings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+import features
+from feature_parity import make_frame
+from trees import TreeModel, file_hash
+from wiki2ia import MODEL_FEATURES, MODEL_PATH, TREES_PATH
+
+
+def held_out(n, seed):
+    '''Output : (pd.DataFrame) n feature rows drawn around the values the features take, with missing values'''
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame(rng.uniform(0, 100, (n, len(MODEL_FEATURES))), columns = MODEL_FEATURES)
+    for column in ['year_match', 'year_NA', 'author_NA', 'publisher_NA']:
+        data[column] = rng.integers(0, 2, n).astype(float)
+    return data.mask(rng.random(data.shape) < 0.15)
+
+
+def load_seconds(statement):
+    '''Output : (float) seconds a fresh interpreter takes to run statement, less the interpreter alone'''
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check = True, cwd = os.path.dirname(TREES_PATH))
+        return time.perf_counter() - start
+    return min(run(statement) for _ in range(3)) - min(run('pass') for _ in range(3))
+
+
+if __name__ == '__main__':
+    assert TreeModel(TREES_PATH).source_sha256 == file_hash(MODEL_PATH), 'finalized_model_trees/ is stale, run trees.py'
+    with open(MODEL_PATH, 'rb') as f:
+        model = pickle.load(f)
+    trees = TreeModel(TREES_PATH)
+
+    batches = []
+    for seed in range(10):
+        batches.append(features.create_features(make_frame(seed))[MODEL_FEATURES])
+    batches += [held_out(5000, seed) for seed in range(5)]
+
+    rows = 0
+    proba_ulps = 0.0
+    for X in batches:
+        np.testing.assert_array_equal(model.predict(X), trees.predict(X))
+        np.testing.assert_array_equal(model._raw_predict(X).ravel(), trees.decision_function(X))
+        proba_ulps = max(proba_ulps, float(np.max(np.abs(model.predict_proba(X) - trees.predict_proba(X)) / np.finfo(float).eps)))
+        rows += len(X)
+    print(f'parity: {rows} held out rows, predict and raw scores identical, probabilities within {proba_ulps:.0f} ulp')
+
+    #a threshold of 0.5 is predict, higher thresholds only ever drop matches
+    X = pd.concat(batches, ignore_index = True)
+    strict = trees.predict(X, threshold = 0.9)
+    assert not (strict & ~trees.predict(X).astype(bool)).any()
+    print(f'threshold: {trees.predict(X).sum()} matches at 0.5, {strict.sum()} at 0.9')
+
+    pickle_load = load_seconds(f'import pickle; pickle.load(open({MODEL_PATH!r}, "rb"))')
+    trees_load = load_seconds(f'from trees import TreeModel; TreeModel({TREES_PATH!r})')
+    print(f'load in a fresh interpreter: pickle and scikit-learn {pickle_load * 1000:.0f} ms, tree arrays {trees_load * 1000:.0f} ms')
+
+    warnings.simplefilter('ignore')
+    for n in [30, 500, 5000]:
+        rows = X.iloc[:n]
+        old = min(timeit.repeat(lambda: model.predict(rows), number = 5, repeat = 3)) / 5
+        new = min(timeit.repeat(lambda: trees.predict(rows), number = 5, repeat = 3)) / 5
+        print(f'{n:>5} rows: scikit-learn {old * 1000:.2f} ms, tree arrays {new * 1000:.2f} ms')
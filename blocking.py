@@ -0,0 +1,108 @@
+# Title : Candidate Blocking
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Ranks and prunes search hits with cheap signals read from the search results themselves, before any
+#item metadata is pulled and before cleaning, fuzzy matching and the model. Also lets get_results
+#page through searches with cap results or more instead of skipping the citation.
+
+import re
+
+from normalize import clean_title
+
+#fields the search has to return for a hit to be blocked
+BLOCKING_FIELDS = ['identifier', 'title', 'date', 'year']
+
+_YEAR = re.compile(r'(?<![0-9])(1[0-9]{3}|20[0-9]{2})(?![0-9])')
+
+
+def first_year(value):
+    '''Output : (int) first four digit year in value, None when there is none'''
+    if isinstance(value, list):
+        value = ' '.join(str(v) for v in value)
+    if not isinstance(value, str):
+        return None
+    match = _YEAR.search(value)
+    return int(match.group(1)) if match else None
+
+
+class Blocker:
+    '''
+    Keeps the search hits that can plausibly match a citation.
+
+    min_overlap : share of the citation's title words the hit's title must contain
+    min_length_ratio : shortest over longest cleaned title length
+    year_window : largest difference in years allowed when both are known, None does not check years
+    max_candidates : hits kept per citation after ranking
+    max_scan : hits read at most when paging through a search with cap results or more
+
+    A hit without a title is kept and ranked last, there is nothing to judge it by.
+    '''
+
+    def __init__(self, min_overlap = 0.5, min_length_ratio = 0.2, year_window = None, max_candidates = 50, max_scan = 1000):
+        self.min_overlap = min_overlap
+        self.min_length_ratio = min_length_ratio
+        self.year_window = year_window
+        self.max_candidates = max_candidates
+        self.max_scan = max_scan
+
+    def citation_key(self, cite_book_dict):
+        '''Output : (tuple) cleaned title, its words and the year of the citation'''
+        title = cite_book_dict.get('title_wiki')
+        title = clean_title(title) if isinstance(title, str) else ''
+        return title, set(title.split()), first_year(cite_book_dict.get('date_wiki'))
+
+    def score(self, key, hit):
+        '''Output : (tuple) title word overlap and length ratio, compared to rank hits. None when the hit is pruned'''
+        title, words, year = key
+        hit_title = hit.get('title')
+        if isinstance(hit_title, list):
+            hit_title = ' '.join(hit_title)
+        if not isinstance(hit_title, str) or not words:
+            return (0.0, 0.0)
+
+        hit_title = clean_title(hit_title)
+        overlap = len(words & set(hit_title.split())) / len(words)
+        if overlap < self.min_overlap:
+            return None
+
+        length_ratio = min(len(title), len(hit_title)) / max(len(title), len(hit_title), 1)
+        if length_ratio < self.min_length_ratio:
+            return None
+
+        if self.year_window is not None and year is not None:
+            hit_year = first_year(hit.get('year')) or first_year(hit.get('date'))
+            if hit_year is not None and abs(hit_year - year) > self.year_window:
+                return None
+
+        return (overlap, length_ratio)
+
+    def prune(self, cite_book_dict, hits):
+        '''
+        Input :
+            cite_book_dict : (dict) parsed wikipedia citation
+            hits : (iterable) search results with BLOCKING_FIELDS, read lazily
+
+        Output : (list) the max_candidates best ranked hits that passed, in search order. Reading stops
+            after max_scan hits, or earlier once max_candidates hits no later hit can outrank, with every
+            title word and a title of the same length, have been found.
+        '''
+        key = self.citation_key(cite_book_dict)
+        kept = []
+        best = 0
+        for i, hit in enumerate(hits):
+            if i >= self.max_scan:
+                break
+            rank = self.score(key, hit)
+            if rank is None:
+                continue
+            kept.append((rank, i, hit))
+            #a hit with every title word but a longer or shorter title is still outranked by a later exact one
+            if rank == (1.0, 1.0):
+                best += 1
+                if best >= self.max_candidates:
+                    break
+        #stable, so equally ranked hits keep the search order
+        kept.sort(key = lambda x: x[0], reverse = True)
+        kept = sorted(kept[:self.max_candidates], key = lambda x: x[1])
+        return [hit for _, _, hit in kept]
@@ -0,0 +1,210 @@
+# Title : Local Caches for Internet Archive Responses
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+import sqlite3
+import threading
+import time
+import json
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import Future
+
+
+class DiskCache:
+    '''
+    SQLite backed key/value cache for JSON serializable values, e.g. item metadata keyed by identifier.
+
+    Input :
+        path : (str) file of the SQLite database, created if missing
+        ttl : (float) seconds an entry stays valid, None keeps entries until evicted
+        max_entries : (int) entries kept, every put past it evicts the oldest entries. None is unbounded
+        table : (str) table name, lets several caches share one file
+
+    The database runs in WAL mode with a busy timeout, so several worker processes can open the same
+    file at once. Entries are evicted in the order they were stored, not by use, so a get is a read
+    only and workers that mostly read do not wait on each other for the write lock. The number of
+    entries is kept by triggers in a table of its own, so the bound costs no count on every put.
+    Each process should build its own DiskCache; pickling one reopens the file on load.
+    '''
+
+    #how many puts to allow between passes that drop expired entries
+    evict_every = 100
+
+    def __init__(self, path, ttl = None, max_entries = None, table = 'metadata'):
+        assert table.isidentifier()
+        assert max_entries is None or max_entries >= 0
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, timeout = 60, isolation_level = None, check_same_thread = False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        #one transaction, so a process opening the file while another creates it sees all of it or none
+        with self._transaction():
+            #'accessed' is written but no longer read, files from before eviction by insertion order have it NOT NULL
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored REAL NOT NULL, accessed REAL NOT NULL)')
+            self._conn.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_stored ON {self.table} (stored)')
+            self._conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table}_size (n INTEGER NOT NULL)')
+            self._conn.execute(f'INSERT INTO {self.table}_size SELECT COUNT(*) FROM {self.table} WHERE NOT EXISTS (SELECT 1 FROM {self.table}_size)')
+            self._conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.table}_added AFTER INSERT ON {self.table} BEGIN UPDATE {self.table}_size SET n = n + 1; END')
+            self._conn.execute(f'CREATE TRIGGER IF NOT EXISTS {self.table}_removed AFTER DELETE ON {self.table} BEGIN UPDATE {self.table}_size SET n = n - 1; END')
+
+    @contextmanager
+    def _transaction(self):
+        #IMMEDIATE takes the write lock up front, so two processes cannot both read the size and then both evict
+        self._conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self._conn.execute('ROLLBACK')
+            raise
+        self._conn.execute('COMMIT')
+
+    def __getstate__(self):
+        return {'path' : self.path, 'ttl' : self.ttl, 'max_entries' : self.max_entries, 'table' : self.table}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def get(self, key):
+        '''Output : the cached value, or None if missing or older than ttl'''
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(f'SELECT value, stored FROM {self.table} WHERE key = ?', (key,)).fetchone()
+            if row is None or (self.ttl is not None and now - row[1] > self.ttl):
+                #expired entries are left to the next put that drops them, a get does not write
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        #an upsert, INSERT OR REPLACE would delete the old row without firing the delete trigger
+        with self._lock, self._transaction():
+            self._conn.execute(f'INSERT INTO {self.table} (key, value, stored, accessed) VALUES (?, ?, ?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value, stored = excluded.stored, accessed = excluded.accessed', (key, json.dumps(value), now, now))
+            self._puts += 1
+            if self.ttl is not None and self._puts % self.evict_every == 0:
+                self._expire()
+            if self.max_entries is not None:
+                self._bound()
+
+    def _expire(self):
+        self._conn.execute(f'DELETE FROM {self.table} WHERE stored < ?', (time.time() - self.ttl,))
+
+    def _bound(self):
+        #drop the oldest entries past max_entries
+        excess = self._conn.execute(f'SELECT n FROM {self.table}_size').fetchone()[0] - self.max_entries
+        if excess > 0:
+            self._conn.execute(f'DELETE FROM {self.table} WHERE key IN (SELECT key FROM {self.table} ORDER BY stored LIMIT ?)', (excess,))
+
+    def evict(self):
+        '''Drops expired entries now instead of waiting for the next pass, and applies max_entries'''
+        with self._lock, self._transaction():
+            if self.ttl is not None:
+                self._expire()
+            if self.max_entries is not None:
+                self._bound()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f'SELECT n FROM {self.table}_size').fetchone()[0]
+
+    def stats(self):
+        '''Output : (dict) hit and miss counters of this process and the number of stored entries'''
+        return {'hits' : self.hits, 'misses' : self.misses, 'size' : len(self)}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SearchCache:
+    '''
+    In memory LRU of search results with an optional persistent tier. Concurrent lookups of the same
+    key are coalesced, only the first caller runs the search and the others wait for its result.
+
+    Input :
+        max_size : (int) number of results kept in memory
+        disk : (DiskCache) optional persistent tier checked on a memory miss, e.g. DiskCache(path, table = 'searches')
+    '''
+
+    def __init__(self, max_size = 10000, disk = None):
+        self.max_size = max_size
+        self.disk = disk
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._memory = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last = False)
+
+    def put(self, key, value):
+        with self._lock:
+            self._remember(key, value)
+        if self.disk is not None:
+            self.disk.put(key, value)
+
+    def get_or_compute(self, key, compute, cacheable = None):
+        '''
+        Input :
+            key : (str) normalized query
+            compute : (function) runs the search when the key is not cached
+            cacheable : (function) optional check of a computed value, values failing it are not stored
+
+        Output : the cached or computed value
+        '''
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            return future.result()
+
+        try:
+            value = self.disk.get(key) if self.disk is not None else None
+            if value is not None:
+                with self._lock:
+                    self.hits += 1
+                    self._remember(key, value)
+            else:
+                value = compute()
+                with self._lock:
+                    self.misses += 1
+                if cacheable is None or cacheable(value):
+                    self.put(key, value)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self):
+        '''Output : (dict) hit, miss and coalesced counters and the number of results held in memory'''
+        return {'hits' : self.hits, 'misses' : self.misses, 'coalesced' : self.coalesced, 'size' : len(self._memory)}
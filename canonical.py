@@ -0,0 +1,187 @@
+# Title : Citation Canonicalization
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#The same book is cited thousands of times with differences that do not change its matches: spacing,
+#|last= or |last1=, access-date, pages, archive-url. citation_key keeps exactly the values the search and
+#the features read, and a Deduplicator passed to get_matches as dedupe= looks every key up once and hands
+#its result to every citation with that key, in the same batch or a later one.
+#
+#    python canonical.py citations.jsonl       duplication report of an input, without any lookups
+
+import argparse
+import json
+import math
+from collections import OrderedDict
+
+from normalize import clean_author_wiki, clean_wiki_publisher, clean_year, combine_wiki_authors
+from utils import archive_identifier, isbn_variants, refinement_clauses
+
+
+def _part(value):
+    #NaN and a missing field are the same to the features, None from clean_year is not
+    if isinstance(value, float) and math.isnan(value):
+        return ''
+    return value.strip() if isinstance(value, str) else str(value)
+
+
+def citation_key(cite_book_dict, direct_lookup = True):
+    '''
+    Input :
+        cite_book_dict : (dict) parsed wikipedia citation, see wiki2ia.parse_citation
+        direct_lookup : (bool) the archive.org identifier and ISBN are part of the key, as get_matches looks them up first
+
+    Output : (str) the values the features read: the title, the author as clean_data combines it, the
+        publisher and the year, cleaned as for the features and with surrounding whitespace stripped, then
+        the author, year and publisher clauses a refined search adds. Citations with the same key are
+        searched and scored the same way.
+    '''
+    parts = [
+        _part(cite_book_dict.get('title_wiki')),
+        _part(clean_author_wiki(combine_wiki_authors(cite_book_dict))),
+        _part(clean_wiki_publisher(cite_book_dict.get('publisher_wiki', math.nan))),
+        _part(clean_year(cite_book_dict.get('date_wiki', math.nan))),
+        ' AND '.join(refinement_clauses(cite_book_dict)),
+    ]
+    if direct_lookup:
+        parts.append(archive_identifier(cite_book_dict.get('url_wiki')) or '')
+        parts.append(next(iter(isbn_variants(cite_book_dict.get('isbn_wiki'))), ''))
+    return '|'.join(parts)
+
+
+def relabel(result, cite_string):
+    '''Output : a get_match result, dict or dataframe, with cite_string as the input citation of every row'''
+    if result is None:
+        return None
+    if hasattr(result, 'columns'):
+        result = result.copy()
+        result['input_citation'] = cite_string
+        return result
+    return dict((name, dict(match, input_citation = cite_string)) for name, match in result.items())
+
+
+class Deduplicator:
+    '''
+    Results of get_matches by citation key, shared by every call it is passed to as dedupe=.
+
+    Input :
+        max_size : (int) keys whose results are kept in memory, the least recently used go first
+
+    Counts the citations seen, the keys looked up and the citations answered from another citation.
+    Results are only kept for the process it is in, a copy sent to a worker process starts empty.
+    '''
+
+    def __init__(self, max_size = 100000):
+        self.max_size = max_size
+        self.citations = 0
+        self.resolved = 0
+        self.duplicates = 0
+        #key : [result, citations with the key]
+        self._results = OrderedDict()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_results'] = OrderedDict()
+        return state
+
+    def select(self, keys, cite_strings, exp):
+        '''
+        Input :
+            keys : (list) citation_key of every citation of a batch
+            cite_strings : (list) the citations
+            exp : (list) results of the batch, filled in for citations with a key of an earlier batch
+
+        Output : (list) numbers of the citations to look up, the first one of each new key. Nothing is
+            counted until fan_out, so a batch that fails and is retried is only counted once.
+        '''
+        exp_keys = {}
+        for i, key in enumerate(keys):
+            if key in self._results:
+                self._results.move_to_end(key)
+                exp[i] = relabel(self._results[key][0], cite_strings[i])
+            elif key not in exp_keys:
+                exp_keys[key] = i
+        return list(exp_keys.values())
+
+    def fan_out(self, keys, cite_strings, exp, looked_up):
+        '''
+        Input :
+            keys, cite_strings, exp : see select, exp now has the results of looked_up
+            looked_up : (list) output of select
+
+        Output : (list) numbers of the citations answered from another citation of the batch. The batch's
+            citations, keys looked up and duplicates are counted here.
+        '''
+        first = dict((keys[i], i) for i in looked_up)
+        for i in looked_up:
+            self._results[keys[i]] = [exp[i], 1]
+        copied = []
+        for i, key in enumerate(keys):
+            if first.get(key) == i:
+                continue
+            if key in first:
+                exp[i] = relabel(exp[first[key]], cite_strings[i])
+                copied.append(i)
+            #a duplicate, of this batch or, filled in by select, of an earlier one
+            if key in self._results:
+                self._results[key][1] += 1
+        self.citations += len(keys)
+        self.resolved += len(looked_up)
+        self.duplicates += len(keys) - len(looked_up)
+        while len(self._results) > self.max_size:
+            self._results.popitem(last = False)
+        return copied
+
+    def merge(self, other):
+        '''Adds the counts of another Deduplicator, e.g. one sent back by a worker process'''
+        self.citations += other.citations
+        self.resolved += other.resolved
+        self.duplicates += other.duplicates
+
+    def most_common(self, n = 10):
+        '''Output : (list) (key, citations) of the n keys with the most citations among those kept'''
+        return sorted(((key, entry[1]) for key, entry in self._results.items()), key = lambda item: -item[1])[:n]
+
+    def report(self, api_calls = None, seconds = None):
+        '''
+        Input :
+            api_calls : (int) optional, API calls made for the keys looked up
+            seconds : (float) optional, time taken for them
+
+        Output : (dict) duplication counts and, given api_calls or seconds, the estimated calls and
+            seconds saved, at the average cost of a key that was looked up
+        '''
+        exp = {
+            'citations' : self.citations,
+            'distinct' : self.resolved,
+            'duplicates' : self.duplicates,
+            'duplicate_share' : round(self.duplicates / self.citations, 4) if self.citations else 0.0,
+        }
+        if api_calls is not None and self.resolved:
+            exp['api_calls_saved'] = round(api_calls / self.resolved * self.duplicates)
+        if seconds is not None and self.resolved:
+            exp['seconds_saved'] = round(seconds / self.resolved * self.duplicates, 1)
+        return exp
+
+
+if __name__ == '__main__':
+    from pipeline import iter_citations
+    from wiki2ia import parse_citation
+
+    parser = argparse.ArgumentParser(description = 'Count the duplicate citations of an input, as get_matches with a Deduplicator would.')
+    parser.add_argument('input', help = 'citations as .jsonl (e.g. from dump.py), .csv or one citation per line')
+    parser.add_argument('--field', default = None, help = 'citation field of JSONL or CSV rows')
+    parser.add_argument('--no-direct-lookup', action = 'store_true', help = 'leave the archive.org identifier and ISBN out of the key')
+    parser.add_argument('--top', type = int, default = 10, help = 'most cited keys to list')
+    args = parser.parse_args()
+
+    dedupe = Deduplicator(max_size = float('inf'))
+    for _, _, cite_string in iter_citations(args.input, args.field):
+        if not cite_string:
+            continue
+        keys = [citation_key(parse_citation(cite_string), not args.no_direct_lookup)]
+        dedupe.fan_out(keys, [cite_string], [None], dedupe.select(keys, [cite_string], [None]))
+
+    report = dedupe.report()
+    report['most_common'] = [{'key' : key, 'citations' : n} for key, n in dedupe.most_common(args.top)]
+    print(json.dumps(report, indent = 1, ensure_ascii = False))
@@ -0,0 +1,332 @@
+# Title : Lean Match Core
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Matches citations without pandas. Candidates are __slots__ records cleaned once when they are built,
+#their features are filled straight into a NumPy matrix and the model scores the matrices of a whole
+#batch of citations in one pass. get_match and get_matches both run on it, a DataFrame is only built
+#for return_dataframe. iter_matches yields the matches of one citation as their chunk is scored, and
+#with stop_threshold stops pulling metadata once a candidate is that likely a match. The feature
+#values are the same as features.create_features, see benchmarks/core_parity.py.
+#
+#    from core import iter_matches
+#    for candidate in iter_matches(config, cite_string, stop_threshold = 0.9):
+#        print(candidate.url, candidate.probability)
+
+import logging
+import warnings
+
+import numpy as np
+from thefuzz import fuzz
+
+from normalize import clean_author_wiki, clean_ia_author, clean_title, clean_wiki_publisher, clean_year, combine_wiki_authors, is_na
+from stats import citation, counting_responses, stage
+from utils import direct_records, fetch_candidates, get_session, search_title, try_to_pull
+from wiki2ia import MODEL_FEATURES, load_model, parse_citation
+
+
+def _as_feature_string(value):
+    #create_features turns authors into strings, and only the string 'nan' back into NA
+    value = str(value)
+    return np.nan if value == 'nan' else value
+
+
+class CitationFields:
+    '''
+    The citation's side of the features, cleaned as clean_data and create_features clean it.
+
+    Input :
+        cite_book_dict : (dict) parsed wikipedia citation, see wiki2ia.parse_citation
+    '''
+
+    __slots__ = ['title', 'author', 'publisher', 'year']
+
+    def __init__(self, cite_book_dict):
+        self.title = cite_book_dict.get('title_wiki')
+        self.author = _as_feature_string(clean_author_wiki(combine_wiki_authors(cite_book_dict)))
+        self.publisher = clean_wiki_publisher(cite_book_dict.get('publisher_wiki', np.nan))
+        self.year = clean_year(cite_book_dict.get('date_wiki', np.nan))
+
+
+class Candidate:
+    '''
+    One Internet Archive item, cleaned as clean_data and create_features clean it.
+
+    Input :
+        search_query : (str) query the item was found with
+        record : (dict) metadata record of the item, see utils.fetch_candidates
+        search_steps : (list) refinement steps of the query, None when it was not refined
+
+    probability and match are set once the candidate is scored.
+    '''
+
+    __slots__ = ['search_query', 'title', 'author', 'publisher', 'year', 'url', 'search_steps', 'probability', 'match']
+
+    def __init__(self, search_query, record, search_steps = None):
+        self.search_query = search_query
+        self.title = clean_title(try_to_pull(record, 'title'))
+        self.author = _as_feature_string(clean_ia_author(try_to_pull(record, 'creator')))
+        self.publisher = clean_wiki_publisher(try_to_pull(record, 'publisher'))
+        date = try_to_pull(record, 'date')
+        self.year = clean_year(date[:4] if isinstance(date, str) and len(date) > 4 else date)
+        self.url = try_to_pull(record, 'identifier-access')
+        self.search_steps = search_steps
+        self.probability = None
+        self.match = None
+
+    @classmethod
+    def from_output(cls, row, match):
+        '''Output : (Candidate) the candidate of a row of to_dict's output, e.g. one kept in a store.ResultStore'''
+        candidate = cls.__new__(cls)
+        candidate.search_query = None
+        candidate.title = row['title_ia']
+        candidate.author = row['author_ia']
+        candidate.publisher = row['publisher_ia']
+        candidate.year = row['date_ia']
+        candidate.url = row['url_ia']
+        steps = row.get('search_steps_ia')
+        candidate.search_steps = None if is_na(steps) else steps
+        candidate.probability = None
+        candidate.match = match
+        return candidate
+
+    def to_dict(self, cite_string, search_steps = False):
+        '''Output : (dict) the candidate as an entry of get_match's output, with 'search_steps_ia' when search_steps is True'''
+        exp = {'title_ia' : self.title, 'author_ia' : self.author, 'publisher_ia' : self.publisher, 'date_ia' : self.year, 'url_ia' : self.url}
+        if search_steps:
+            exp['search_steps_ia'] = self.search_steps if self.search_steps else np.nan
+        exp['input_citation'] = cite_string
+        exp['match'] = self.match
+        return exp
+
+
+def fill_missing_years(candidates):
+    '''
+    Makes the years of candidates a column as clean_data makes them: a column of years holds a None from
+    clean_year as NaN, unless every year in it is None.
+
+    Output : (list) the candidates whose year was changed
+    '''
+    changed = []
+    if any(candidate.year is not None for candidate in candidates):
+        for candidate in candidates:
+            if candidate.year is None:
+                candidate.year = np.nan
+                changed.append(candidate)
+    return changed
+
+
+def build_candidates(search_query, records, search_steps = None):
+    '''Output : (list) a Candidate for each record, the years made a column as clean_data makes them'''
+    candidates = [Candidate(search_query, record, search_steps) for record in records]
+    fill_missing_years(candidates)
+    return candidates
+
+
+def _score(scorer, a, b, scores):
+    if is_na(a) or is_na(b) or a == "" or b == "":
+        return np.nan
+    if (scorer, a, b) not in scores:
+        scores[(scorer, a, b)] = scorer(a, b)
+    return scores[(scorer, a, b)]
+
+
+def feature_matrix(citation, candidates):
+    '''
+    Input :
+        citation : (CitationFields) the citation
+        candidates : (list) Candidate records
+
+    Output : (np.ndarray) candidates x MODEL_FEATURES, the values features.create_features gives
+    '''
+    X = np.empty((len(candidates), len(MODEL_FEATURES)))
+    column = dict((name, i) for i, name in enumerate(MODEL_FEATURES))
+    #pairs repeat, e.g. the citation's publisher against the same publisher of several items
+    scores = {}
+    for row, candidate in enumerate(candidates):
+        both_present = bool(candidate.year) and bool(citation.year)
+        x = X[row]
+        x[column['title_match']] = _score(fuzz.ratio, candidate.title, citation.title, scores)
+        x[column['title_match_partial']] = _score(fuzz.partial_token_sort_ratio, citation.title, candidate.title, scores)
+        x[column['author_match']] = _score(fuzz.ratio, candidate.author, citation.author, scores)
+        x[column['author_sort']] = _score(fuzz.token_sort_ratio, candidate.author, citation.author, scores)
+        x[column['publisher_match']] = _score(fuzz.ratio, candidate.publisher, citation.publisher, scores)
+        x[column['publisher_match_partial']] = _score(fuzz.partial_ratio, citation.publisher, candidate.publisher, scores)
+        x[column['year_match']] = float(float(candidate.year) == float(citation.year)) if both_present else np.nan
+        x[column['year_NA']] = is_na(citation.year) or is_na(candidate.year)
+        x[column['author_NA']] = is_na(candidate.author) or is_na(citation.author)
+        x[column['publisher_NA']] = is_na(candidate.publisher) or is_na(citation.publisher)
+    return X
+
+
+def score(model, X):
+    '''Output : (tuple) probability of a match and the model's prediction for each row of X'''
+    with warnings.catch_warnings():
+        #a pickled model fit on a dataframe warns about the plain array, its columns are in MODEL_FEATURES order
+        warnings.simplefilter('ignore', UserWarning)
+        proba = model.predict_proba(X)
+    #the classifier's predict: the more likely class, the first one on a tie
+    return proba[:, 1], model.classes_[np.argmax(proba, axis = 1)].astype(bool)
+
+
+def score_citations(citations, groups, stats = None, model_filename = None):
+    '''
+    Input :
+        citations : (list) CitationFields of the citations
+        groups : (list) Candidate records of each citation, see build_candidates
+        stats : (stats.MatchStats) optional, the features, model load and predict stages are timed into it
+
+    Output : (list) the feature matrix of each group. probability and match are set on every candidate,
+        scored in a single pass over the candidates of all the groups.
+    '''
+    with stage(stats, 'features'):
+        matrices = [feature_matrix(fields, candidates) for fields, candidates in zip(citations, groups)]
+    candidates = [candidate for group in groups for candidate in group]
+    if not candidates:
+        return matrices
+    with stage(stats, 'model_load'):
+        model = load_model(model_filename) if model_filename else load_model()
+    with stage(stats, 'predict'):
+        probabilities, matches = score(model, np.vstack(matrices))
+    for candidate, probability, match in zip(candidates, probabilities.tolist(), matches.tolist()):
+        candidate.probability = probability
+        candidate.match = match
+    return matrices
+
+
+def format_candidates(candidates, cite_string, all_results = False, return_dataframe = False):
+    '''
+    description:
+        Turns the scored candidates of one citation into the output of get_match.
+    inputs:
+        candidates: the citation's scored Candidate records.
+        cite_string: the citation, the 'input_citation' of every row.
+    output:
+        dict of results, dataframe of results or None.
+    '''
+    rows = [i for i, candidate in enumerate(candidates) if all_results or candidate.match]
+    num_matches = sum(1 for candidate in candidates if candidate.match)
+    if not num_matches:
+        logging.info("There were no matches present.")
+        if not all_results:
+            return None
+    logging.info(f"Success. {num_matches} total matches. Returning results.")
+
+    #the title search was refined, see utils.search_title
+    search_steps = any(candidates[i].search_steps for i in rows)
+    exp = [candidates[i].to_dict(cite_string, search_steps) for i in rows]
+    if return_dataframe:
+        import pandas as pd
+        return pd.DataFrame(exp, index = rows, columns = list(exp[0]) if exp else None)
+    return dict((f'match{n+1}', row) for n, row in enumerate(exp))
+
+
+def scored_chunks(config, cite_string, cap = 500, workers = 1, retrieval = 'item', cache = None, search_cache = None, session = None, direct_lookup = True, blocker = None, refine = True, refine_target = None, stats = None, stop_threshold = None, chunk_size = 10, model_filename = None):
+    '''
+    Input : see iter_matches
+
+    Output : (generator) ('direct' or 'title', scored Candidate records) for each chunk of a citation's candidates.
+        The title search only runs when the direct lookup finds no match, as in get_matches. The years of the
+        title search's candidates are one column over every chunk, so the first chunk with a year can change the
+        years of earlier chunks, which are then scored again in place. Scoring every chunk gives the features
+        and predictions of scoring the candidates in one go.
+    '''
+    s = session if session is not None else get_session(config)
+    with stage(stats, 'parse'):
+        cite_book_dict = parse_citation(cite_string)
+    with stage(stats, 'clean'):
+        fields = CitationFields(cite_book_dict)
+
+    def scored(search_query, records, search_steps = None):
+        with stage(stats, 'clean'):
+            candidates = build_candidates(search_query, records, search_steps)
+        score_citations([fields], [candidates], stats, model_filename)
+        if stats is not None:
+            stats.count('candidates_scored', len(candidates))
+        return candidates
+
+    if direct_lookup:
+        found = direct_records(s, cite_book_dict, cap, workers, retrieval, cache, search_cache, stats)
+        if found is not None and found[1]:
+            candidates = scored(*found)
+            yield 'direct', candidates
+            if any(candidate.match for candidate in candidates):
+                return
+
+    found = search_title(s, cite_book_dict, cap, retrieval, search_cache, blocker, refine, refine_target, stats)
+    if found is None:
+        return
+    search_query, hits, steps = found
+    #in one go unless it can stop early
+    size = chunk_size if stop_threshold is not None else max(len(hits), 1)
+    earlier = []
+    for start in range(0, len(hits), size):
+        records = fetch_candidates(s, hits[start : start + size], workers, retrieval, cache = cache, stats = stats)
+        if not records:
+            continue
+        with stage(stats, 'clean'):
+            candidates = [Candidate(search_query, record, steps or None) for record in records]
+            changed = fill_missing_years(earlier + candidates)
+            ids = set(id(candidate) for candidate in candidates)
+            rescored = [candidate for candidate in changed if id(candidate) not in ids]
+        score_citations([fields, fields], [rescored, candidates], stats, model_filename)
+        if stats is not None:
+            stats.count('candidates_scored', len(candidates))
+        earlier += candidates
+        yield 'title', candidates
+        if stop_threshold is not None and any(candidate.probability > stop_threshold for candidate in candidates):
+            if start + size < len(hits):
+                logging.info(f'Stopped after {start + size} of {len(hits)} results, a candidate scored over {stop_threshold}')
+            return
+
+
+def iter_matches(config, cite_string, cap = 500, all_results = False, workers = 1, retrieval = 'item', cache = None, search_cache = None, session = None, direct_lookup = True, blocker = None, refine = True, refine_target = None, stats = None, stop_threshold = None, chunk_size = 10):
+    '''
+    description:
+        Matches one citation, yielding each match as soon as its chunk of candidates is scored.
+    inputs:
+        config, cap, workers, retrieval, cache, search_cache, session, direct_lookup, blocker, refine, refine_target: as for get_matches.
+        all_results: yield every scored candidate, not only the matches.
+        stats: optional stats.MatchStats, its stage timings and counters are added to while the generator runs.
+        stop_threshold: stop pulling metadata for further candidates once one has a match probability over this.
+            None scores every candidate, as get_match does.
+        chunk_size: candidates pulled and scored at a time when stop_threshold is set.
+    output:
+        generator of Candidate records, with probability and match set. A chunk bringing the first year of the
+        candidates' years scores the earlier chunks again, updating candidates already yielded, see scored_chunks.
+    '''
+    for _, candidates in scored_chunks(config, cite_string, cap, workers, retrieval, cache, search_cache, session, direct_lookup, blocker, refine, refine_target, stats, stop_threshold, chunk_size):
+        for candidate in candidates:
+            if all_results or candidate.match:
+                yield candidate
+
+
+def match_citation(config, cite_string, all_results = False, return_dataframe = False, session = None, stats = None, **kwargs):
+    '''
+    description:
+        get_match on top of scored_chunks: the candidates of the last lookup that ran, as get_matches picks them,
+        turned into get_match's dict or dataframe output.
+    inputs:
+        as for get_match, kwargs are passed to scored_chunks.
+    output:
+        dict of results, dataframe of results or None.
+    '''
+    s = session if session is not None else get_session(config)
+    caches = [c for c in (kwargs.get('cache'), kwargs.get('search_cache')) if c is not None]
+
+    #every response of the session counts as an API call of the citation, as in get_matches
+    with counting_responses(stats, s), citation(stats, 0, caches) as record:
+        phases = {}
+        for phase, candidates in scored_chunks(config, cite_string, session = s, stats = stats, **kwargs):
+            phases.setdefault(phase, []).extend(candidates)
+    if stats is not None:
+        stats.finish_citation(record)
+
+    candidates = phases.get('title', phases.get('direct', []))
+    if 'title' not in phases and not any(candidate.match for candidate in candidates):
+        #the direct lookup's candidates are only kept when they match
+        candidates = []
+    if not candidates:
+        logging.warning("No results. Returning None Object.")
+        return None
+    return format_candidates(candidates, cite_string, all_results, return_dataframe)
@@ -0,0 +1,126 @@
+# Title : Streaming Cite Book Extractor for Wikipedia XML Dumps
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Reads a pages-articles dump (.xml or .xml.bz2) page by page and yields every cite book template
+#with its parsed fields. Memory stays constant: each page element is cleared once it is read.
+#
+#    python dump.py enwiki-latest-pages-articles.xml.bz2 > citations.jsonl
+
+import argparse
+import bz2
+import json
+import re
+import sys
+import xml.etree.ElementTree as ET
+
+from utils import parse_template
+from wiki2ia import KEYS_TO_KEEP
+
+_BRACES = re.compile(r'\{\{|\}\}')
+_NAME_END = re.compile(r'\||\}\}|\{\{')
+_SPACES = re.compile(r'[\s_]+')
+
+
+def normalize_template_name(name):
+    '''Output : (str) lower case name with underscores and runs of whitespace as single spaces'''
+    return _SPACES.sub(' ', name).strip().lower()
+
+
+def open_dump(path):
+    if path == '-':
+        return sys.stdin.buffer
+    if path.endswith('.bz2'):
+        #handles the multistream dumps as well
+        return bz2.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_pages(path, namespaces = (0,)):
+    '''
+    Input :
+        path : (str) dump file, '-' reads stdin
+        namespaces : (tuple) page namespaces to keep, None keeps all. 0 is articles.
+
+    Output : (generator) (page id, page title, wikitext) for every page
+    '''
+    f = open_dump(path)
+    try:
+        context = ET.iterparse(f, events = ('start', 'end'))
+        root = None
+        for event, elem in context:
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            if tag != 'page':
+                continue
+
+            page = dict((child.tag.rsplit('}', 1)[-1], child) for child in elem)
+            ns = int(page['ns'].text) if 'ns' in page else 0
+            if namespaces is None or ns in namespaces:
+                text = None
+                if 'revision' in page:
+                    for child in page['revision']:
+                        if child.tag.rsplit('}', 1)[-1] == 'text':
+                            text = child.text
+                yield int(page['id'].text), page['title'].text, text or ''
+
+            #drop the finished page so memory does not grow with the dump
+            elem.clear()
+            root.clear()
+    finally:
+        if f is not sys.stdin.buffer:
+            f.close()
+
+
+def iter_templates(text, names = ('cite book',)):
+    '''
+    Input :
+        text : (str) wikitext of a page
+        names : (tuple) normalized template names to keep
+
+    Output : (generator) the full text of every matching template, including templates nested in
+        other templates. A template is yielded once its closing braces are seen.
+    '''
+    names = set(names)
+    stack = []
+    for token in _BRACES.finditer(text):
+        if token.group() == '{{':
+            stack.append(token.start())
+        elif stack:
+            start = stack.pop()
+            name_end = _NAME_END.search(text, start + 2)
+            name = text[start + 2 : name_end.start() if name_end else token.start()]
+            if normalize_template_name(name) in names:
+                yield text[start : token.end()]
+
+
+def iter_cite_books(path, keys_to_keep = KEYS_TO_KEEP, names = ('cite book',), namespaces = (0,)):
+    '''
+    Input :
+        path : (str) dump file, '-' reads stdin
+        keys_to_keep : (list) template parameters to keep, renamed with a '_wiki' suffix like parse_cite_book
+
+    Output : (generator) one dict per cite book template with 'page_id', 'page_title', 'template'
+        and the kept parameters that have a value, as parse_cite_book gives them: the last of a repeated
+        parameter wins, as in MediaWiki. 'template' can go straight to get_match or get_matches.
+    '''
+    for page_id, page_title, text in iter_pages(path, namespaces):
+        for template in iter_templates(text, names):
+            record = {'page_id' : page_id, 'page_title' : page_title, 'template' : template}
+            record.update(parse_template(template, keys_to_keep))
+            yield record
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Extract cite book templates from a Wikipedia XML dump as JSON lines.')
+    parser.add_argument('dump', help = 'pages-articles dump, .xml or .xml.bz2, - for stdin')
+    parser.add_argument('--limit', type = int, default = None, help = 'stop after this many templates')
+    args = parser.parse_args()
+
+    for i, record in enumerate(iter_cite_books(args.dump)):
+        if args.limit is not None and i >= args.limit:
+            break
+        sys.stdout.write(json.dumps(record, ensure_ascii = False) + '\n')
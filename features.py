@@ -0,0 +1,114 @@
+# Title : Feature Engine
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Bulk versions of the model features. Every string pair is scored once per batch with the same
+#thefuzz scorers the model was fit with, and the NA masks and year comparison are computed on whole
+#columns. benchmarks/feature_parity.py checks the output against the original row by row code.
+
+import numpy as np
+import pandas as pd
+from thefuzz import fuzz
+from normalize import clean_column, clean_year
+
+#(partial, sort) -> scorer, as chosen in get_lev_distance_or_NA
+SCORERS = {
+    (False, False) : fuzz.ratio,
+    (True, False) : fuzz.partial_ratio,
+    (False, True) : fuzz.token_sort_ratio,
+    (True, True) : fuzz.partial_token_sort_ratio
+}
+
+
+def score_pairs(left, right, scorer):
+    '''
+    Input :
+        left : (array like) first strings of every pair
+        right : (array like) second strings of every pair
+        scorer : (function) thefuzz scorer taking two strings
+
+    Output : (np.ndarray) float scores, NaN where either string is NA or empty. Each distinct
+        pair is scored once no matter how many rows share it.
+    '''
+    left = np.asarray(left, dtype = object)
+    right = np.asarray(right, dtype = object)
+    valid = ~(pd.isna(left) | pd.isna(right) | (left == "") | (right == ""))
+
+    out = np.full(len(left), np.nan)
+    scores = {}
+    for i in np.flatnonzero(valid):
+        pair = (left[i], right[i])
+        if pair not in scores:
+            scores[pair] = scorer(*pair)
+        out[i] = scores[pair]
+    return out
+
+
+def get_lev_distance_or_NA(data, columns, partial = False, sort = False):
+    assert isinstance(data, pd.DataFrame)
+    assert isinstance(columns, list)
+    assert len(columns) == 2
+    #If partial is True, First column will be fully matched, Second column partially matched
+    assert isinstance(columns[0], str)
+    assert isinstance(columns[1], str)
+
+    return score_pairs(data[columns[0]], data[columns[1]], SCORERS[(partial, sort)])
+
+
+def clean_years(values):
+    '''
+    Input : (pd.Series) raw dates or years
+
+    Output : (pd.Series) clean_year of every value, parsing each distinct value once
+    '''
+    return clean_column(values, clean_year)
+
+
+def truthy(values):
+    '''Output : (np.ndarray) bool() of every element, the test the year comparison has always used'''
+    return np.frompyfunc(bool, 1, 1)(np.asarray(values, dtype = object)).astype(bool)
+
+
+def create_features(data):
+    assert isinstance(data, pd.DataFrame)
+    assert not data.empty
+
+    #lev distance for title
+    data['title_match'] = get_lev_distance_or_NA(data, ['title_ia', 'title_wiki'])
+
+    # using partial matching because title_ia is usually more descriptive
+    data['title_match_partial'] = get_lev_distance_or_NA(data, ['title_wiki', 'title_ia'], partial = True, sort = True)
+
+    #for author
+    data.author_ia = data.author_ia.astype('str')
+    data.author_wiki = data.author_wiki.astype('str')
+
+    for var in ['author_ia', 'author_wiki']:
+        data[var] = data[var].replace({'nan': np.nan})
+
+    data['author_match'] = get_lev_distance_or_NA(data, ['author_ia', 'author_wiki'])
+
+    data['author_sort'] = get_lev_distance_or_NA(data, ['author_ia', 'author_wiki'], sort = True)
+
+    #for publisher
+    data['publisher_match'] = get_lev_distance_or_NA(data, ['publisher_ia', 'publisher_wiki'])
+
+    # using partial matching because publisher_ia is usually more descriptive
+    data['publisher_match_partial'] = get_lev_distance_or_NA(data, ['publisher_wiki', 'publisher_ia'], partial = True)
+
+    #year
+    data['year_wiki'] = clean_years(data.date_wiki)
+    data.date_ia = clean_years(data.date_ia)
+
+    year_ia = data.date_ia.to_numpy(dtype = object)
+    year_wiki = data.year_wiki.to_numpy(dtype = object)
+    both_present = truthy(year_ia) & truthy(year_wiki)
+    same_year = year_ia.astype(float) == year_wiki.astype(float)
+    data['year_match'] = np.where(both_present, same_year, np.nan)
+
+    #NA flags
+    data['year_NA'] = (pd.isna(year_wiki) | pd.isna(year_ia)).astype(int)
+    data['author_NA'] = (data.author_ia.isna() | data.author_wiki.isna()).astype(int)
+    data['publisher_NA'] = (data.publisher_ia.isna() | data.publisher_wiki.isna()).astype(int)
+
+    return data
@@ -0,0 +1,265 @@
+# Title : Offline Local Candidate Index
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Builds an on disk inverted index of Internet Archive book metadata from a bulk export and serves it
+#through the two session calls get_results makes, search_items and get_item. A LocalIndex can be
+#passed as the session of get_results, get_matches or pipeline.py (--index) and no request leaves
+#the machine. Every file is memory mapped, so processes opening the same index share its pages.
+#
+#    python index.py ia_books.jsonl ia_index/
+#
+#The export holds one JSON object per line with 'identifier', 'title' and optionally 'creator',
+#'publisher', 'date', 'year', 'isbn' and 'identifier-access'.
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+from array import array
+
+import numpy as np
+
+from normalize import clean_title
+from blocking import first_year
+from utils import IA_DETAILS_URL, METADATA_FIELDS, isbn_variants
+
+INDEX_FILES = ['tokens.npy', 'starts.npy', 'postings.npy', 'identifiers.npy', 'identifier_docs.npy', 'offsets.npy']
+
+_TITLE_QUERY = re.compile(r'\btitle:(.*?)(?= AND [a-z-]+:|$)')
+#clauses utils.refinement_clauses adds to a title search, checked against the stored metadata
+_FIELD_QUERY = re.compile(r'\b(creator|publisher|year):(\([^)]*\)|\S+)')
+_ISBN_QUERY = re.compile(r'\bisbn:\(?([0-9Xx ]+(?:OR [0-9Xx ]+)*)\)?')
+_IDENTIFIER_QUERY = re.compile(r'\bidentifier:(\S+)')
+
+
+def token_hash(token):
+    '''Output : (int) stable 64 bit hash of a token or identifier, the key of the sorted lookup arrays'''
+    return int.from_bytes(hashlib.blake2b(token.encode('utf-8'), digest_size = 8).digest(), 'little')
+
+
+def title_tokens(title):
+    '''Output : (set) the words of clean_title(title), the same cleaning get_results applies to the query'''
+    if not isinstance(title, str):
+        return set()
+    return set(clean_title(title).split())
+
+
+def open_export(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding = 'utf-8')
+    return open(path, encoding = 'utf-8')
+
+
+def build_index(export_path, index_dir):
+    '''
+    Input :
+        export_path : (str) JSONL (optionally .gz) of Internet Archive item metadata, one item per line
+        index_dir : (str) directory to write the index to, created when missing
+
+    Output : (int) number of items indexed. Items without identifier or title are skipped.
+    '''
+    os.makedirs(index_dir, exist_ok = True)
+
+    #(hash, doc) pairs of every title word and ISBN, kept as flat arrays rather than a dict of lists
+    pair_hashes = array('Q')
+    pair_docs = array('I')
+    id_hashes = array('Q')
+    offsets = array('q', [0])
+
+    doc = 0
+    with open_export(export_path) as f, open(os.path.join(index_dir, 'records.jsonl'), 'wb') as out:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            identifier, title = item.get('identifier'), item.get('title')
+            if not identifier or not title:
+                continue
+
+            record = dict((field, item[field]) for field in METADATA_FIELDS if item.get(field) is not None)
+            record['identifier'] = identifier
+            record.setdefault('identifier-access', IA_DETAILS_URL.format(identifier))
+            encoded = (json.dumps(record, ensure_ascii = False) + '\n').encode('utf-8')
+            out.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+
+            keys = title_tokens(title if isinstance(title, str) else ' '.join(title))
+            isbns = item.get('isbn') or []
+            for isbn in [isbns] if isinstance(isbns, str) else isbns:
+                keys.update('isbn:' + variant for variant in isbn_variants(isbn))
+            for key in keys:
+                pair_hashes.append(token_hash(key))
+                pair_docs.append(doc)
+            id_hashes.append(token_hash(identifier))
+            doc += 1
+
+    pair_hashes = np.frombuffer(pair_hashes, dtype = np.uint64)
+    pair_docs = np.frombuffer(pair_docs, dtype = np.uint32)
+    order = np.lexsort((pair_docs, pair_hashes))
+    pair_hashes, pair_docs = pair_hashes[order], pair_docs[order]
+    tokens, starts = np.unique(pair_hashes, return_index = True)
+
+    id_hashes = np.frombuffer(id_hashes, dtype = np.uint64)
+    id_order = np.argsort(id_hashes, kind = 'stable')
+
+    arrays = {
+        'tokens.npy' : tokens,
+        'starts.npy' : np.append(starts, len(pair_docs)).astype(np.int64),
+        'postings.npy' : pair_docs,
+        'identifiers.npy' : id_hashes[id_order],
+        'identifier_docs.npy' : id_order.astype(np.uint32),
+        'offsets.npy' : np.frombuffer(offsets, dtype = np.int64),
+    }
+    for name, values in arrays.items():
+        np.save(os.path.join(index_dir, name), values)
+    with open(os.path.join(index_dir, 'index.json'), 'w') as f:
+        json.dump({'items' : doc, 'tokens' : len(tokens), 'postings' : len(pair_docs)}, f)
+    return doc
+
+
+class SearchResults:
+    '''The part of internetarchive's Search that get_results uses'''
+
+    def __init__(self, index, docs, fields):
+        self._index = index
+        self._docs = docs
+        self._fields = fields
+        self.num_found = len(docs)
+
+    def iter_as_results(self):
+        for doc in self._docs:
+            record = self._index.record(doc)
+            fields = self._fields or ['identifier']
+            yield dict((field, record[field]) for field in fields if field in record)
+
+
+class LocalItem:
+    '''The part of internetarchive's Item that get_results uses'''
+
+    def __init__(self, identifier, metadata):
+        self.identifier = identifier
+        self.item_metadata = {'metadata' : metadata} if metadata is not None else {}
+
+
+class LocalIndex:
+    '''
+    Read only, memory mapped view of an index written by build_index, used in place of an
+    internetarchive session.
+
+    search_items understands the queries get_results and get_direct_results send: 'title:<cleaned
+    title>' finds the items whose title has every word of the query, 'isbn:(a OR b)' the items with
+    any of the ISBNs and 'identifier:<id>' a single item. The creator, publisher and year clauses of a
+    refined title search are checked against the stored metadata. Other clauses, such as the
+    collection, are ignored.
+    '''
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        for name in INDEX_FILES:
+            setattr(self, '_' + name[:-4], np.load(os.path.join(index_dir, name), mmap_mode = 'r'))
+        self._records_file = open(os.path.join(index_dir, 'records.jsonl'), 'rb')
+        size = os.fstat(self._records_file.fileno()).st_size
+        self._records = mmap.mmap(self._records_file.fileno(), 0, access = mmap.ACCESS_READ) if size else b''
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getstate__(self):
+        #worker processes map the files again rather than receive copies
+        return {'index_dir' : self.index_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['index_dir'])
+
+    def record(self, doc):
+        '''Output : (dict) stored metadata of item number doc'''
+        return json.loads(self._records[self._offsets[doc] : self._offsets[doc + 1]])
+
+    def postings(self, key):
+        '''Output : (np.ndarray) sorted item numbers of a title word or 'isbn:' key'''
+        h = np.uint64(token_hash(key))
+        i = np.searchsorted(self._tokens, h)
+        if i == len(self._tokens) or self._tokens[i] != h:
+            return np.empty(0, dtype = np.uint32)
+        return self._postings[self._starts[i] : self._starts[i + 1]]
+
+    def find_identifier(self, identifier):
+        '''Output : (int) item number of identifier, None when it is not in the index'''
+        h = np.uint64(token_hash(identifier))
+        i = np.searchsorted(self._identifiers, h)
+        if i == len(self._identifiers) or self._identifiers[i] != h:
+            return None
+        doc = int(self._identifier_docs[i])
+        return doc if self.record(doc)['identifier'] == identifier else None
+
+    def find(self, query):
+        '''Output : (np.ndarray) sorted item numbers matching a search query, see the class description'''
+        match = _IDENTIFIER_QUERY.search(query)
+        if match:
+            doc = self.find_identifier(match.group(1))
+            return np.array([] if doc is None else [doc], dtype = np.uint32)
+
+        match = _ISBN_QUERY.search(query)
+        if match:
+            isbns = [isbn for isbn in re.split(r'\s+OR\s+|\s+', match.group(1)) if isbn]
+            found = [self.postings('isbn:' + variant) for isbn in isbns for variant in isbn_variants(isbn)]
+            return np.unique(np.concatenate(found)) if found else np.empty(0, dtype = np.uint32)
+
+        match = _TITLE_QUERY.search(query)
+        words = match.group(1).split() if match else []
+        if not words:
+            return np.empty(0, dtype = np.uint32)
+        #intersect from the rarest word up, so common words only shrink an already small set
+        lists = sorted((self.postings(word) for word in set(words)), key = len)
+        docs = lists[0]
+        for other in lists[1:]:
+            if not len(docs):
+                break
+            docs = np.intersect1d(docs, other, assume_unique = True)
+
+        filters = [(field, [word for word in re.findall(r'[^\s()]+', value) if word != 'AND']) for field, value in _FIELD_QUERY.findall(query)]
+        if filters and len(docs):
+            docs = np.array([doc for doc in docs if self.matches_fields(self.record(doc), filters)], dtype = np.uint32)
+        return docs
+
+    def matches_fields(self, record, filters):
+        '''Output : (bool) whether the record has every word of each (field, words) filter, the year as a number'''
+        for field, words in filters:
+            if field == 'year':
+                year = first_year(record.get('year')) or first_year(record.get('date'))
+                if str(year) not in words:
+                    return False
+                continue
+            value = record.get(field)
+            if isinstance(value, list):
+                value = ' '.join(value)
+            if not set(words) <= title_tokens(value):
+                return False
+        return True
+
+    def search_items(self, query, fields = None, **kwargs):
+        return SearchResults(self, self.find(query), fields)
+
+    def get_item(self, identifier, **kwargs):
+        doc = self.find_identifier(identifier)
+        return LocalItem(identifier, None if doc is None else self.record(doc))
+
+    def close(self):
+        if isinstance(self._records, mmap.mmap):
+            self._records.close()
+        self._records_file.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Build a local candidate index from an Internet Archive metadata export.')
+    parser.add_argument('export', help = 'JSON lines of item metadata, optionally .gz')
+    parser.add_argument('index_dir', help = 'directory to write the index to')
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO)
+    logging.info(f'Indexed {build_index(args.export, args.index_dir)} items into {args.index_dir}')
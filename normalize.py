@@ -0,0 +1,151 @@
+# Title : Text Normalization
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Cleaning of titles, authors, publishers and years with precompiled translation tables and regexes.
+#Output is identical to the original chains of str.replace calls, see benchmarks/normalize_parity.py.
+
+import logging
+import math
+import re
+
+
+#characters each cleaner removes, as bytes translation tables for ASCII text (the common and
+#fastest case) and as precompiled character classes for everything else
+_TITLE_CHARS = ':,;\'".[]!/\\@*#?%'
+_TITLE_TABLE = _TITLE_CHARS.encode('ascii')
+_TITLE_PATTERN = re.compile('[' + re.escape(_TITLE_CHARS) + ']')
+
+_AUTHOR_CHARS = ':-[]()'
+_AUTHOR_TABLE = _AUTHOR_CHARS.encode('ascii')
+_AUTHOR_PATTERN = re.compile('[' + re.escape(_AUTHOR_CHARS) + ']')
+
+_WIKI_AUTHOR_CHARS = ':-[]().'
+_WIKI_AUTHOR_TABLE = _WIKI_AUTHOR_CHARS.encode('ascii')
+_WIKI_AUTHOR_PATTERN = re.compile('[' + re.escape(_WIKI_AUTHOR_CHARS) + ']')
+
+_INITIALS = re.compile(r'[A-Z]\.')
+_DIGITS = re.compile(r'[0-9]+')
+
+#removed one after the other, in this order, as a removal can join the text around it into a new match
+_AUTHOR_ROLES = ["author", "editor in chief", "compiler", "editor"]
+
+#author fields of a wikipedia citation that make up its author
+AUTHOR_FIELDS = ['first_wiki', 'last_wiki', 'first1_wiki', 'last1_wiki', 'first2_wiki', 'last2_wiki']
+
+
+def clean_title(title):
+    if isinstance(title, float):
+        return title
+    if title.isascii():
+        title = title.encode('ascii').translate(None, _TITLE_TABLE).decode('ascii')
+    else:
+        title = _TITLE_PATTERN.sub("", title)
+    return title.lower().strip()
+
+
+def clean_ia_author(author):
+    try:
+        author.find("(")
+    except AttributeError:
+        #object is NA
+        return author
+    if "(" in author and ")" in author:
+        author = _INITIALS.sub("", author)
+    author = author.lower().split(',')
+    if len(author) == 1:
+        author = author[0]
+    else:
+        author.reverse()
+        author = ' '.join(author)
+    if author.isascii():
+        author = author.encode('ascii').translate(None, _AUTHOR_TABLE).decode('ascii')
+    else:
+        author = _AUTHOR_PATTERN.sub("", author)
+    author = author.replace("  ", " ")
+    for role in _AUTHOR_ROLES:
+        author = author.replace(role, "")
+    author = _DIGITS.sub("", author).strip()
+    words = author.split(" ")
+    if len(set(words)) < len(words):
+        #sorted, the order of a set changes with the hash seed and so from one process to the next
+        author = " ".join(sorted(set(words))).strip()
+    return author
+
+
+def clean_wiki_publisher(var):
+    if isinstance(var, float):
+        return var
+    try:
+        var.find("(")
+    except AttributeError:
+        #object is NA
+        return var
+    return var.replace("[", "").replace("]", "")
+
+
+def clean_author_wiki(var):
+    if isinstance(var, float):
+        return var
+    if var.isascii():
+        var = var.encode('ascii').translate(None, _WIKI_AUTHOR_TABLE).decode('ascii')
+    else:
+        var = _WIKI_AUTHOR_PATTERN.sub("", var)
+    return var.lower().strip()
+
+
+def is_na(value):
+    '''Output : (bool) whether value is None or NaN, what pd.isna says of a single value read from JSON'''
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def combine_wiki_authors(cite_book_dict):
+    '''
+    Input :
+        cite_book_dict : (dict) parsed wikipedia citation
+
+    Output : (str) its AUTHOR_FIELDS joined in the order the citation gives them, NaN when it has none.
+        Built per citation, as a batch of citations has no single column order to join them in.
+    '''
+    names = [str(value) for key, value in cite_book_dict.items() if key in AUTHOR_FIELDS and not is_na(value)]
+    if not names:
+        return math.nan
+    return ' '.join(names).strip()
+
+
+def clean_year(string):
+    if is_na(string):
+        return math.nan
+    string = str(string)
+    if any(char.isdigit() for char in string) == False:
+        return math.nan
+    string = re.subn(r'\.[0-9]+',"",string)[0]
+    string = re.subn(r'\.',"",string)[0]
+    if string:
+        try:
+            return int(''.join(filter(str.isdigit, string)))
+        except:
+            logging.debug(f'No year in {string!r}')
+    else:
+        return math.nan
+
+
+def clean_column(values, func):
+    '''
+    Input :
+        values : (pd.Series) column to clean
+        func : (function) one of the cleaning functions above
+
+    Output : (pd.Series) func of every value. Each distinct value is cleaned once, which matters
+        because the wikipedia columns repeat for every candidate and popular books repeat across citations.
+    '''
+    cleaned = {}
+    def lookup(value):
+        try:
+            if value not in cleaned:
+                cleaned[value] = func(value)
+            return cleaned[value]
+        except TypeError:
+            #unhashable value
+            return func(value)
+    return values.apply(lookup)
@@ -0,0 +1,340 @@
+# Title : Bulk Matching Pipeline
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Streams citations from a JSONL, CSV or text file through get_matches and appends one JSON line of
+#results per citation. A checkpoint file next to the output records how many rows are finished and
+#how long the output was at that point, so an interrupted run picks up where it stopped.
+#
+#    python pipeline.py citations.jsonl matches.jsonl --batch-size 50 --workers 8
+
+import argparse
+import csv
+import json
+import logging
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from blocking import Blocker
+from cache import DiskCache, SearchCache
+from canonical import Deduplicator
+from session import SessionManager, SharedTokenBucket, default_manager
+from stats import MatchStats
+from store import ResultStore
+from wiki2ia import get_matches, set_log_level
+
+#fields tried, in order, when --field is not given
+CITATION_FIELDS = ['template', 'cite_string', 'citation', 'input_citation']
+
+#input fields copied to the output next to the results
+PASSTHROUGH_FIELDS = ['page_id', 'page_title']
+
+#progress lines go through their own logger so they show at any --log-level
+progress = logging.getLogger('pipeline')
+progress.setLevel(logging.INFO)
+
+
+def iter_citations(path, field = None):
+    '''
+    Input :
+        path : (str) .jsonl / .json lines, .csv or any other file read as one citation per line
+        field : (str) name of the citation field in JSONL or CSV rows, see CITATION_FIELDS when None
+
+    Output : (generator) (row number, input record, citation string)
+    '''
+    with open(path, newline = '', encoding = 'utf-8') as f:
+        if path.endswith('.csv'):
+            rows = csv.DictReader(f)
+        elif path.endswith('.jsonl') or path.endswith('.json'):
+            rows = (json.loads(line) for line in f if line.strip())
+        else:
+            rows = ({'cite_string' : line.rstrip('\n')} for line in f if line.strip())
+
+        for i, record in enumerate(rows):
+            key = field or next((k for k in CITATION_FIELDS if k in record), None)
+            yield i, record, record.get(key) if key else None
+
+
+def to_json_safe(value):
+    '''Output : value with numpy scalars turned into python ones and NaN into None'''
+    if isinstance(value, dict):
+        return dict((k, to_json_safe(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return [to_json_safe(v) for v in value]
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+class RequestCounter:
+    '''Counts every HTTP response of a requests based session through a response hook. Stays at 0 for
+        sessions without hooks, such as index.LocalIndex.'''
+
+    def __init__(self, session):
+        self.count = 0
+        self._lock = threading.Lock()
+        self._hooks = getattr(session, 'hooks', None)
+        if self._hooks is not None:
+            self._hooks['response'].append(self._hook)
+
+    def _hook(self, response, *args, **kwargs):
+        with self._lock:
+            self.count += 1
+
+    def close(self):
+        '''stops counting, pooled sessions outlive a run'''
+        if self._hooks is not None and self._hook in self._hooks['response']:
+            self._hooks['response'].remove(self._hook)
+
+
+class Checkpoint:
+    '''
+    Progress of one output file, stored as JSON in <output>.checkpoint and replaced atomically.
+
+    rows : input rows finished, output_bytes : size of the output when they were, plus running totals
+    '''
+
+    def __init__(self, output_path, restart = False):
+        self.path = output_path + '.checkpoint'
+        self.state = {'rows' : 0, 'output_bytes' : 0, 'matched' : 0, 'errors' : 0, 'duplicates' : 0, 'api_calls' : 0, 'seconds' : 0.0}
+        if os.path.exists(self.path) and not restart:
+            with open(self.path) as f:
+                self.state.update(json.load(f))
+
+    def save(self):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+
+def match_batch(config, cite_strings, match_kwargs):
+    '''
+    Output : (list) (result, error) per citation. A failing batch is retried one citation at a time so a
+        bad citation only costs its own row.
+    '''
+    try:
+        return [(result, None) for result in get_matches(config, cite_strings, **match_kwargs)]
+    except Exception:
+        logging.exception("Batch failed, retrying its citations one at a time.")
+
+    exp = []
+    for cite_string in cite_strings:
+        try:
+            exp.append((get_matches(config, [cite_string], **match_kwargs)[0], None))
+        except Exception as e:
+            exp.append((None, f'{type(e).__name__}: {e}'))
+    return exp
+
+
+def format_row(row, record, cite_string, result, error):
+    exp = {'row' : row}
+    for field in PASSTHROUGH_FIELDS:
+        if field in record:
+            exp[field] = record[field]
+    exp['input_citation'] = cite_string
+    exp['matches'] = None if result is None else [to_json_safe(match) for match in result.values()]
+    if error is not None:
+        exp['error'] = error
+    return exp
+
+
+def open_output(output_path, state):
+    '''Output : the output file opened for binary writing at the checkpointed size. Anything written
+        after the last checkpoint is dropped, those rows are redone.'''
+    mode = 'r+b' if os.path.exists(output_path) else 'wb'
+    out = open(output_path, mode)
+    out.truncate(state['output_bytes'])
+    out.seek(state['output_bytes'])
+    if state['rows']:
+        progress.info(f"Resuming after {state['rows']} finished rows.")
+    return out
+
+
+def write_metrics(path, stats):
+    '''Replaces path with the Prometheus text of stats, e.g. for the node exporter textfile collector'''
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(stats.to_prometheus())
+    os.replace(tmp, path)
+
+
+def run(input_path, output_path, config, batch_size = 50, field = None, restart = False, report_every = 30, sessions = None, metrics_path = None, **match_kwargs):
+    '''
+    description:
+        Matches every citation of input_path and appends the results to output_path as JSON lines.
+        Resumes from output_path's checkpoint unless restart is True.
+    inputs:
+        config: Internet Archive configuration dictionary, as for get_match.
+        batch_size: citations sent to get_matches at once. Output and checkpoint are written after each batch.
+        report_every: seconds between throughput log lines.
+        sessions: session.SessionManager the session comes from, session.default_manager when None.
+        metrics_path: file rewritten with the Prometheus text of the run's stats.MatchStats after every batch.
+        match_kwargs: passed on to get_matches, e.g. cap, workers, retrieval, cache, search_cache, a session
+            such as index.LocalIndex, a canonical.Deduplicator as dedupe, whose report is logged at the end, or a
+            store.ResultStore as store.
+    output:
+        the final checkpoint state (dict).
+    '''
+    checkpoint = Checkpoint(output_path, restart)
+    state = checkpoint.state
+
+    out = open_output(output_path, state)
+
+    session = match_kwargs.pop('session', None) or (sessions or default_manager).get(config)
+    counter = RequestCounter(session)
+    if metrics_path and match_kwargs.get('stats') is None:
+        match_kwargs['stats'] = MatchStats()
+    stats = match_kwargs.get('stats')
+    dedupe = match_kwargs.get('dedupe')
+
+    start = time.time()
+    last_report = start
+    rows_this_run = 0
+    api_calls_before = state['api_calls']
+    seconds_before = state['seconds']
+    duplicates_before = state['duplicates']
+
+    def flush(batch):
+        nonlocal rows_this_run, last_report
+        results = match_batch(config, [cite_string for _, _, cite_string in batch], dict(match_kwargs, session = session))
+        for (row, record, cite_string), (result, error) in zip(batch, results):
+            line = json.dumps(format_row(row, record, cite_string, result, error), ensure_ascii = False) + '\n'
+            out.write(line.encode('utf-8'))
+            state['matched'] += result is not None
+            state['errors'] += error is not None
+        out.flush()
+        os.fsync(out.fileno())
+
+        now = time.time()
+        rows_this_run += len(batch)
+        state['rows'] = batch[-1][0] + 1
+        state['output_bytes'] = out.tell()
+        state['api_calls'] = api_calls_before + counter.count
+        state['seconds'] = seconds_before + now - start
+        if dedupe is not None:
+            state['duplicates'] = duplicates_before + dedupe.duplicates
+        checkpoint.save()
+        if metrics_path:
+            write_metrics(metrics_path, stats)
+
+        if now - last_report >= report_every:
+            last_report = now
+            elapsed = now - start
+            progress.info(f"{state['rows']} rows done, {rows_this_run / elapsed:.2f} citations/sec, "
+                f"{counter.count / elapsed:.2f} API calls/sec, {state['matched']} matched, {state['errors']} errors")
+            if stats is not None:
+                progress.info(f"Stage seconds so far: {stats.summary()['seconds']}")
+
+    try:
+        batch = []
+        for row, record, cite_string in iter_citations(input_path, field):
+            if row < state['rows']:
+                continue
+            batch.append((row, record, cite_string))
+            if len(batch) >= batch_size:
+                flush(batch)
+                batch = []
+        if batch:
+            flush(batch)
+    finally:
+        out.close()
+        counter.close()
+
+    elapsed = max(time.time() - start, 1e-9)
+    progress.info(f"Finished {rows_this_run} rows in {round(elapsed/60, 2)} minutes, "
+        f"{rows_this_run / elapsed:.2f} citations/sec, {counter.count / elapsed:.2f} API calls/sec.")
+    if dedupe is not None:
+        progress.info(f"Duplicate citations: {dedupe.report(counter.count, elapsed)}")
+    if match_kwargs.get('store') is not None:
+        progress.info(f"Result store: {match_kwargs['store'].stats()}")
+    return state
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Match Wikipedia book citations to Internet Archive items in bulk.')
+    parser.add_argument('input', help = 'citations as .jsonl (e.g. from dump.py), .csv or one citation per line')
+    parser.add_argument('output', help = 'JSON lines results, appended to and resumed from')
+    parser.add_argument('--field', default = None, help = 'citation field of JSONL or CSV rows')
+    parser.add_argument('--batch-size', type = int, default = 50)
+    parser.add_argument('--cap', type = int, default = 500)
+    parser.add_argument('--workers', type = int, default = 1, help = 'concurrent metadata requests per citation')
+    parser.add_argument('--retrieval', choices = ['item', 'search'], default = 'item')
+    parser.add_argument('--no-direct-lookup', action = 'store_true', help = 'always search by title, ignoring archive.org urls and ISBNs')
+    parser.add_argument('--no-refine', action = 'store_true', help = 'skip title searches over --cap instead of narrowing them by author, year and publisher')
+    parser.add_argument('--refine-target', type = int, default = None, help = 'result count a refined search has to get below, --cap by default')
+    parser.add_argument('--block', action = 'store_true', help = 'prune search results by title overlap before pulling metadata, page through searches over --cap')
+    parser.add_argument('--max-candidates', type = int, default = 50, help = 'candidates kept per citation with --block')
+    parser.add_argument('--year-window', type = int, default = None, help = 'with --block, drop candidates more than this many years from the citation')
+    parser.add_argument('--no-dedupe', action = 'store_true', help = 'look up every citation, even when an earlier one has the same title, author, year and publisher')
+    parser.add_argument('--dedupe-size', type = int, default = 100000, help = 'citation keys whose results are kept for later duplicates')
+    parser.add_argument('--all-results', action = 'store_true', help = 'write unmatched candidates too')
+    parser.add_argument('--index', default = None, help = 'local index directory built by index.py, searched instead of the Internet Archive API')
+    parser.add_argument('--cache', default = None, help = 'SQLite file for item metadata')
+    parser.add_argument('--cache-ttl', type = float, default = None, help = 'seconds cached metadata stays valid')
+    parser.add_argument('--store', default = None, help = 'SQLite file of results by citation, reruns only look up new, changed or stale citations')
+    parser.add_argument('--store-max-age', type = float, default = None, help = 'seconds after which stored results are looked up again')
+    parser.add_argument('--store-max-age-unmatched', type = float, default = None, help = 'seconds after which stored results without a match are looked up again')
+    parser.add_argument('--search-cache-size', type = int, default = 10000, help = 'search results kept in memory, 0 disables')
+    parser.add_argument('--rate', type = float, default = None, help = 'Internet Archive requests per second, shared by all processes')
+    parser.add_argument('--retries', type = int, default = 5, help = 'retries of a request that gets 429, 5xx or no connection')
+    parser.add_argument('--env', default = os.path.join(os.getcwd(), '.env'), help = '.env file with access and secret keys')
+    parser.add_argument('--processes', type = int, default = 1, help = 'worker processes, see runner.py')
+    parser.add_argument('--shard', default = None, help = 'k/N to run only part k (0 based) of N when several machines share the input')
+    parser.add_argument('--metrics', default = None, help = 'file rewritten with Prometheus metrics after every batch')
+    parser.add_argument('--restart', action = 'store_true', help = 'ignore the checkpoint and start over')
+    parser.add_argument('--report-every', type = float, default = 30, help = 'seconds between throughput log lines')
+    parser.add_argument('--log-level', default = 'warning', choices = ['error', 'info', 'debug', 'warning', 'critical'])
+    args = parser.parse_args(argv)
+
+    set_log_level(args.log_level)
+
+    config = {}
+    if os.path.exists(args.env):
+        from dotenv import get_key
+        config = {'s3' : {'access' : get_key(args.env, "access"), 'secret' : get_key(args.env, "secret")}}
+
+    cache = DiskCache(args.cache, ttl = args.cache_ttl) if args.cache else None
+    match_kwargs = dict(cap = args.cap, log_level = args.log_level, all_results = args.all_results,
+        workers = args.workers, retrieval = args.retrieval, cache = cache, direct_lookup = not args.no_direct_lookup,
+        blocker = Blocker(max_candidates = args.max_candidates, year_window = args.year_window) if args.block else None,
+        refine = not args.no_refine, refine_target = args.refine_target,
+        dedupe = None if args.no_dedupe else Deduplicator(args.dedupe_size),
+        store = ResultStore(args.store, args.store_max_age, args.store_max_age_unmatched) if args.store else None)
+
+    bucket = SharedTokenBucket(args.rate) if args.rate and (args.processes > 1 or args.shard) else None
+    sessions = SessionManager(rate = args.rate, bucket = bucket, retries = args.retries, pool_size = max(32, args.workers))
+
+    if args.index:
+        from index import LocalIndex
+        match_kwargs['session'] = LocalIndex(args.index)
+
+    if args.processes > 1 or args.shard:
+        import runner
+        shard = tuple(int(x) for x in args.shard.split('/')) if args.shard else (0, 1)
+        return runner.run(args.input, args.output, config, args.processes, shard = shard,
+            batch_size = args.batch_size, field = args.field, restart = args.restart,
+            report_every = args.report_every, search_cache_size = args.search_cache_size, sessions = sessions,
+            metrics_path = args.metrics, **match_kwargs)
+
+    return run(args.input, args.output, config,
+        batch_size = args.batch_size,
+        field = args.field,
+        restart = args.restart,
+        report_every = args.report_every,
+        sessions = sessions,
+        metrics_path = args.metrics,
+        search_cache = SearchCache(args.search_cache_size) if args.search_cache_size else None,
+        **match_kwargs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+# Title : Sharded Multi-process Runner
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Runs the bulk pipeline on several processes. Every citation is assigned to a shard by a hash of its
+#text, or of its canonical.citation_key when duplicates are looked up once, so the split is the same
+#on every run and every machine and duplicates meet in one worker. Each worker process opens its own
+#Internet Archive session and loads its own model, works through its shard's queue in batches and
+#takes batches from other shards' queues once its own is empty. The parent writes results in input
+#order and keeps the same checkpoint as pipeline.run, so a sharded run resumes the same way.
+#
+#    python pipeline.py citations.jsonl matches.jsonl --processes 8
+#    python pipeline.py citations.jsonl matches_0.jsonl --processes 8 --shard 0/5   (machine 1 of 5)
+
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import time
+
+from cache import SearchCache
+from canonical import citation_key
+from session import default_manager
+from stats import MatchStats
+from pipeline import Checkpoint, RequestCounter, format_row, iter_citations, match_batch, open_output, progress, write_metrics
+from wiki2ia import parse_citation
+
+
+def citation_hash(cite_string):
+    '''Output : (int) stable 64 bit hash of a citation, unlike hash() it does not change between processes'''
+    return int(hashlib.md5((cite_string or '').encode('utf-8')).hexdigest()[:16], 16)
+
+
+def assign_shard(cite_string, processes, machines = 1):
+    '''
+    Output : (tuple) (machine, worker) the citation belongs to. The machine split uses the low part of
+        the hash and the worker split what is left, so both are independent of each other.
+    '''
+    h = citation_hash(cite_string)
+    return h % machines, (h // machines) % processes
+
+
+def worker(shard, queues, results, stop, config, search_cache_size, sessions, match_kwargs):
+    '''Worker process: own session, own model, own shard queue first, then the other shards'''
+    match_kwargs = dict(match_kwargs)
+    session = match_kwargs.pop('session', None) or (sessions or default_manager).get(config)
+    counter = RequestCounter(session)
+    match_kwargs['session'] = session
+    collect_stats = match_kwargs.get('stats') is not None
+    if search_cache_size:
+        match_kwargs['search_cache'] = SearchCache(search_cache_size)
+
+    order = [queues[(shard + i) % len(queues)] for i in range(len(queues))]
+    while not stop.is_set():
+        batch = None
+        try:
+            batch = order[0].get(timeout = 0.1)
+        except queue.Empty:
+            for other in order[1:]:
+                try:
+                    batch = other.get_nowait()
+                    break
+                except queue.Empty:
+                    continue
+        if batch is None:
+            continue
+
+        calls_before = counter.count
+        if collect_stats:
+            #a fresh one per batch, the parent adds them up
+            match_kwargs['stats'] = MatchStats()
+        matched = match_batch(config, [cite_string for _, _, cite_string in batch], match_kwargs)
+        lines = []
+        for (row, record, cite_string), (result, error) in zip(batch, matched):
+            line = json.dumps(format_row(row, record, cite_string, result, error), ensure_ascii = False) + '\n'
+            lines.append((row, line.encode('utf-8'), result is not None, error is not None))
+        results.put((shard, lines, counter.count - calls_before, match_kwargs.get('stats'), match_kwargs.get('dedupe')))
+
+
+def run(input_path, output_path, config, processes, shard = (0, 1), batch_size = 50, field = None, restart = False,
+        report_every = 30, search_cache_size = 10000, max_in_flight = None, sessions = None, metrics_path = None, **match_kwargs):
+    '''
+    description:
+        pipeline.run spread over several worker processes.
+    inputs:
+        processes: number of worker processes.
+        shard: (index, count) to run only this machine's part of the input when several machines share it.
+            Rows of other machines are skipped, so every machine writes its own output file.
+        search_cache_size: size of the in memory search cache of each worker, 0 disables it.
+        max_in_flight: batches queued or running at once, bounds memory. Defaults to 4 per process.
+        sessions: session.SessionManager each worker opens its session from. Give it a session.SharedTokenBucket
+            to hold all workers to one rate limit.
+        match_kwargs: passed on to get_matches. Caches and sessions must be picklable, e.g. cache.DiskCache
+            or index.LocalIndex, each worker gets its own copy. A stats.MatchStats collects the totals of every
+            worker, its callback is not called. A canonical.Deduplicator is copied empty to every worker, which keep
+            their own results, and ends up with the counts of all of them. A store.ResultStore is reopened by every worker.
+        metrics_path: file rewritten with the Prometheus text of the run's stats after every write.
+    output:
+        the final checkpoint state (dict).
+    '''
+    machine, machines = shard
+    assert 0 <= machine < machines
+    max_in_flight = max_in_flight or 4 * processes
+    if metrics_path and match_kwargs.get('stats') is None:
+        match_kwargs['stats'] = MatchStats()
+    stats = match_kwargs.get('stats')
+    dedupe = match_kwargs.get('dedupe')
+    direct_lookup = match_kwargs.get('direct_lookup', True)
+
+    checkpoint = Checkpoint(output_path, restart)
+    state = checkpoint.state
+    out = open_output(output_path, state)
+
+    #spawned, not forked, so no session, SQLite connection or lock is shared with the parent
+    context = multiprocessing.get_context('spawn')
+    queues = [context.Queue() for _ in range(processes)]
+    results = context.Queue()
+    stop = context.Event()
+    workers = [
+        context.Process(target = worker, args = (i, queues, results, stop, config, search_cache_size, sessions, match_kwargs), daemon = True)
+        for i in range(processes)
+    ]
+    for process in workers:
+        process.start()
+
+    start = time.time()
+    last_report = start
+    api_calls_before = state['api_calls']
+    seconds_before = state['seconds']
+    api_calls = 0
+    rows_this_run = 0
+    batches_per_shard = [0] * processes
+    duplicates_before = state['duplicates']
+    #latest counts of the Deduplicator of each worker
+    worker_dedupes = {}
+    in_flight = 0
+
+    #rows finished out of order, written once every row before them is done. None marks a row of another machine.
+    finished = {}
+    pending = [[] for _ in range(processes)]
+
+    def dispatch(i):
+        nonlocal in_flight
+        queues[i].put(pending[i])
+        pending[i] = []
+        in_flight += 1
+
+    def write_ready():
+        nonlocal rows_this_run, last_report
+        row = state['rows']
+        while row in finished:
+            line = finished.pop(row)
+            if line is not None:
+                out.write(line[0])
+                state['matched'] += line[1]
+                state['errors'] += line[2]
+                rows_this_run += 1
+            row += 1
+        if row == state['rows']:
+            return
+        out.flush()
+        os.fsync(out.fileno())
+        now = time.time()
+        state['rows'] = row
+        state['output_bytes'] = out.tell()
+        state['api_calls'] = api_calls_before + api_calls
+        state['seconds'] = seconds_before + now - start
+        if worker_dedupes:
+            state['duplicates'] = duplicates_before + sum(worker_dedupe.duplicates for worker_dedupe in worker_dedupes.values())
+        checkpoint.save()
+        if metrics_path:
+            write_metrics(metrics_path, stats)
+
+        if now - last_report >= report_every:
+            last_report = now
+            elapsed = now - start
+            progress.info(f"{state['rows']} rows done, {rows_this_run / elapsed:.2f} citations/sec, "
+                f"{api_calls / elapsed:.2f} API calls/sec, {state['matched']} matched, {state['errors']} errors, "
+                f"batches per worker {batches_per_shard}")
+
+    def collect(block):
+        nonlocal in_flight, api_calls
+        try:
+            worker_shard, lines, calls, batch_stats, worker_dedupe = results.get(timeout = 1) if block else results.get_nowait()
+        except queue.Empty:
+            if block and not all(process.is_alive() for process in workers):
+                raise Exception("A worker process died, stopping. Rerun to resume from the checkpoint.")
+            return
+        in_flight -= 1
+        api_calls += calls
+        if batch_stats is not None:
+            stats.merge(batch_stats)
+        if worker_dedupe is not None:
+            worker_dedupes[worker_shard] = worker_dedupe
+        batches_per_shard[worker_shard] += 1
+        for row, line, matched, error in lines:
+            finished[row] = (line, matched, error)
+        write_ready()
+
+    try:
+        for row, record, cite_string in iter_citations(input_path, field):
+            if row < state['rows']:
+                continue
+            key = citation_key(parse_citation(cite_string), direct_lookup) if dedupe is not None and cite_string else cite_string
+            row_machine, row_shard = assign_shard(key, processes, machines)
+            if row_machine != machine:
+                finished[row] = None
+                continue
+            pending[row_shard].append((row, record, cite_string))
+            if len(pending[row_shard]) >= batch_size:
+                dispatch(row_shard)
+                while in_flight >= max_in_flight:
+                    collect(block = True)
+            collect(block = False)
+
+        for i in range(processes):
+            if pending[i]:
+                dispatch(i)
+        while in_flight:
+            collect(block = True)
+        write_ready()
+    finally:
+        stop.set()
+        for process in workers:
+            process.join(timeout = 5)
+            if process.is_alive():
+                process.terminate()
+        out.close()
+
+    elapsed = max(time.time() - start, 1e-9)
+    progress.info(f"Finished {rows_this_run} rows on {processes} processes in {round(elapsed/60, 2)} minutes, "
+        f"{rows_this_run / elapsed:.2f} citations/sec, {api_calls / elapsed:.2f} API calls/sec, batches per worker {batches_per_shard}.")
+    if dedupe is not None:
+        for worker_dedupe in worker_dedupes.values():
+            dedupe.merge(worker_dedupe)
+        progress.info(f"Duplicate citations: {dedupe.report(api_calls)}")
+    if match_kwargs.get('store') is not None:
+        progress.info(f"Result store: {match_kwargs['store'].summary()}")
+    return state
@@ -0,0 +1,338 @@
+# Title : Matching Service
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Long running HTTP service for callers that match one citation at a time, such as link fixing bots.
+#The session, the caches and the model stay loaded between requests. Every request looks its citation
+#up in its own thread, and the candidates of the requests that arrive within a short window are
+#featurized and predicted in one pass. Past max_in_flight requests it answers 503 with
+#Retry-After rather than queueing without bound.
+#
+#    python service.py --port 8080 --cache ia_metadata.sqlite
+#
+#    POST /match    {"citation" : "{{cite book ...}}", "all_results" : false}
+#                   -> {"citation" : ..., "matches" : [...] or null}
+#    GET  /health   -> {"status" : "ok", "in_flight" : n, ...}
+#    GET  /metrics  -> Prometheus text: stage timings, API calls, caches, batches, request latency
+#
+#benchmarks/service_load.py load tests it against replayed Internet Archive responses.
+
+import argparse
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cache import DiskCache, SearchCache
+from core import score_citations
+from pipeline import to_json_safe
+from session import IAServiceError, SessionManager
+from stats import LATENCY_BUCKETS, MatchStats, cache_counts
+from wiki2ia import get_matches, load_model, set_log_level
+
+
+class ServiceBusy(Exception):
+    '''The service already has max_in_flight requests, the caller should retry later'''
+
+
+class Batcher:
+    '''
+    Predicts the candidates of concurrent get_matches calls together, used as their predictor.
+
+    Input :
+        window : (float) seconds to wait for more candidates after the first ones arrive
+        max_rows : (int) candidates that end the wait early
+        stats : (stats.MatchStats) optional, the features, model load and predict stages are timed into it
+
+    One thread runs every pass, so the model and stats are only used from there.
+    '''
+
+    def __init__(self, window = 0.01, max_rows = 5000, stats = None):
+        self.window = window
+        self.max_rows = max_rows
+        self.stats = stats
+        self.batches = 0
+        self.frames = 0
+        self.rows = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target = self._run, name = 'batcher', daemon = True)
+        self._thread.start()
+
+    def predict(self, citations, groups, stats = None):
+        '''Output : (list) the feature matrix of each group, once the batch they joined is scored, see core.score_citations.
+            The batch is timed into the Batcher's stats, not the caller's.'''
+        future = Future()
+        self._queue.put((citations, groups, future))
+        return future.result()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            pending = [item]
+            rows = sum(len(group) for group in item[1])
+            deadline = time.monotonic() + self.window
+            while rows < self.max_rows:
+                try:
+                    item = self._queue.get(timeout = max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if item is None:
+                    #predicts what is pending, then stops
+                    self._queue.put(None)
+                    break
+                pending.append(item)
+                rows += sum(len(group) for group in item[1])
+            self._predict(pending)
+
+    def _predict(self, pending):
+        try:
+            matrices = score_citations([fields for citations, _, _ in pending for fields in citations],
+                [group for _, groups, _ in pending for group in groups], self.stats)
+        except Exception as e:
+            for _, _, future in pending:
+                future.set_exception(e)
+            return
+
+        rows = sum(len(X) for X in matrices)
+        self.batches += 1
+        self.frames += len(pending)
+        self.rows += rows
+        if self.stats is not None:
+            self.stats.count('candidates_scored', rows)
+        #the candidates are scored in place, each caller gets the matrices of its groups back by position
+        start = 0
+        for citations, _, future in pending:
+            future.set_result(matrices[start : start + len(citations)])
+            start += len(citations)
+
+
+class MatchService:
+    '''
+    Input :
+        config : (dict) internetarchive configuration
+        session : the session to match with, e.g. a LocalIndex. The pooled session of sessions when None.
+        sessions : (session.SessionManager) used when session is None
+        window, max_rows : see Batcher
+        max_in_flight : (int) requests matched at once, more are refused with ServiceBusy
+        match_kwargs : passed to get_matches, e.g. cache, search_cache, cap or blocker
+
+    The session, model and caches are loaded once, when the service is built.
+    '''
+
+    def __init__(self, config, session = None, sessions = None, window = 0.01, max_rows = 5000, max_in_flight = 64, **match_kwargs):
+        self.config = config
+        self.session = session if session is not None else (sessions or SessionManager()).get(config)
+        self.match_kwargs = match_kwargs
+        self.max_in_flight = max_in_flight
+        self.stats = MatchStats()
+        self.batcher = Batcher(window, max_rows, self.stats)
+        load_model()
+
+        #one hook for the service, get_matches adds none as it gets no stats
+        self._hooks = getattr(self.session, 'hooks', None)
+        if self._hooks is not None:
+            self._hooks['response'].append(self.stats.response_hook)
+
+        self.started = time.time()
+        self.in_flight = 0
+        self.requests = {}
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self._cache_counts = (0, 0)
+        self._lock = threading.Lock()
+
+    def match(self, cite_string, all_results = False):
+        '''Output : get_match's output for cite_string. Raises ServiceBusy at max_in_flight requests.'''
+        with self._lock:
+            if self.in_flight >= self.max_in_flight:
+                raise ServiceBusy(f'{self.in_flight} requests in flight')
+            self.in_flight += 1
+        try:
+            return get_matches(self.config, [cite_string], all_results = all_results, session = self.session, predictor = self.batcher.predict, **self.match_kwargs)[0]
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def record(self, status, seconds):
+        '''Counts a finished request by HTTP status, and its latency'''
+        with self._lock:
+            self.requests[status] = self.requests.get(status, 0) + 1
+            if status == 200:
+                self.latency_sum += seconds
+                self.latency_buckets[next((i for i, bound in enumerate(LATENCY_BUCKETS) if seconds <= bound), len(LATENCY_BUCKETS))] += 1
+
+    def health(self):
+        return {
+            'status' : 'ok',
+            'uptime_seconds' : round(time.time() - self.started, 1),
+            'in_flight' : self.in_flight,
+            'max_in_flight' : self.max_in_flight,
+            'model' : type(load_model()).__name__,
+            'batches' : self.batcher.batches,
+        }
+
+    def metrics(self, prefix = 'wiki2ia'):
+        '''Output : (str) MatchStats totals and the service's own metrics in the Prometheus text format'''
+        #get_matches gets no stats, so the cache counters are brought up to date from the caches here
+        counts = cache_counts([c for c in (self.match_kwargs.get('cache'), self.match_kwargs.get('search_cache')) if c is not None])
+        with self._lock:
+            self.stats.count('cache_hits', counts[0] - self._cache_counts[0])
+            self.stats.count('cache_misses', counts[1] - self._cache_counts[1])
+            self._cache_counts = counts
+
+            lines = [self.stats.to_prometheus(prefix).rstrip('\n')]
+            lines += [f'# TYPE {prefix}_service_requests_total counter']
+            lines += [f'{prefix}_service_requests_total{{status="{status}"}} {n}' for status, n in sorted(self.requests.items())]
+            lines += [
+                f'# TYPE {prefix}_service_in_flight gauge', f'{prefix}_service_in_flight {self.in_flight}',
+                f'# TYPE {prefix}_service_batches_total counter', f'{prefix}_service_batches_total {self.batcher.batches}',
+                f'# HELP {prefix}_service_batched_requests_total Requests whose candidates went through a batched predict.',
+                f'# TYPE {prefix}_service_batched_requests_total counter', f'{prefix}_service_batched_requests_total {self.batcher.frames}',
+                f'# HELP {prefix}_service_request_seconds Time to answer a successful /match request.',
+                f'# TYPE {prefix}_service_request_seconds histogram',
+            ]
+            cumulative = 0
+            for bound, n in zip(LATENCY_BUCKETS + ['+Inf'], self.latency_buckets):
+                cumulative += n
+                lines.append(f'{prefix}_service_request_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines += [f'{prefix}_service_request_seconds_sum {self.latency_sum:.6f}', f'{prefix}_service_request_seconds_count {self.requests.get(200, 0)}']
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        if self._hooks is not None and self.stats.response_hook in self._hooks['response']:
+            self._hooks['response'].remove(self.stats.response_hook)
+        self.batcher.close()
+
+
+class MatchHandler(BaseHTTPRequestHandler):
+    '''Routes requests to the MatchService of its server'''
+
+    protocol_version = 'HTTP/1.1'
+
+    def send(self, status, body, content_type = 'application/json', headers = None):
+        if not isinstance(body, str):
+            body = json.dumps(body)
+        body = body.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == '/health':
+            self.send(200, service.health())
+        elif self.path == '/metrics':
+            self.send(200, service.metrics(), content_type = 'text/plain; version=0.0.4')
+        else:
+            self.send(404, {'error' : f'no route {self.path}'})
+
+    def do_POST(self):
+        service = self.server.service
+        start = time.perf_counter()
+        if self.path != '/match':
+            status, body, headers = 404, {'error' : f'no route {self.path}'}, None
+        else:
+            status, body, headers = self.match(service)
+        #counted before answering, so a client that reads /metrics next sees its request
+        service.record(status, time.perf_counter() - start)
+        self.send(status, body, headers = headers)
+
+    def match(self, service):
+        '''Output : (tuple) status, body and extra headers of a /match request'''
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+            cite_string = request['citation']
+            assert isinstance(cite_string, str)
+        except (ValueError, KeyError, TypeError, AssertionError):
+            return 400, {'error' : 'expected a JSON object with a "citation" string'}, None
+
+        try:
+            result = service.match(cite_string, all_results = bool(request.get('all_results', False)))
+        except ServiceBusy as e:
+            return 503, {'error' : str(e)}, {'Retry-After' : '1'}
+        except IAServiceError as e:
+            return 502, {'error' : str(e), 'status' : e.status}, None
+        except Exception as e:
+            logging.exception('Matching failed')
+            return 500, {'error' : f'{type(e).__name__}: {e}'}, None
+
+        matches = None if result is None else [to_json_safe(match) for match in result.values()]
+        return 200, {'citation' : cite_string, 'matches' : matches}, None
+
+    def log_message(self, format, *args):
+        logging.debug(format % args)
+
+
+def serve(service, host = '127.0.0.1', port = 8080):
+    '''Output : (ThreadingHTTPServer) bound to host and port, call serve_forever to answer requests'''
+    server = ThreadingHTTPServer((host, port), MatchHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Serve citation matching over HTTP, with the session, caches and model kept loaded.')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 8080)
+    parser.add_argument('--window-ms', type = float, default = 10, help = 'milliseconds to collect requests into one predict pass')
+    parser.add_argument('--max-batch-rows', type = int, default = 5000, help = 'candidates that end the window early')
+    parser.add_argument('--max-in-flight', type = int, default = 64, help = 'requests matched at once, more get 503')
+    parser.add_argument('--cap', type = int, default = 500)
+    parser.add_argument('--workers', type = int, default = 1, help = 'concurrent metadata requests per citation')
+    parser.add_argument('--retrieval', choices = ['item', 'search'], default = 'item')
+    parser.add_argument('--no-direct-lookup', action = 'store_true')
+    parser.add_argument('--no-refine', action = 'store_true')
+    parser.add_argument('--index', default = None, help = 'local index directory built by index.py, searched instead of the Internet Archive API')
+    parser.add_argument('--cache', default = None, help = 'SQLite file for item metadata')
+    parser.add_argument('--cache-ttl', type = float, default = None, help = 'seconds cached metadata stays valid')
+    parser.add_argument('--search-cache-size', type = int, default = 10000, help = 'search results kept in memory, 0 disables')
+    parser.add_argument('--rate', type = float, default = None, help = 'Internet Archive requests per second')
+    parser.add_argument('--retries', type = int, default = 5)
+    parser.add_argument('--env', default = os.path.join(os.getcwd(), '.env'), help = '.env file with access and secret keys')
+    parser.add_argument('--log-level', default = 'warning', choices = ['error', 'info', 'debug', 'warning', 'critical'])
+    args = parser.parse_args()
+
+    set_log_level(args.log_level)
+
+    config = {}
+    if os.path.exists(args.env):
+        from dotenv import get_key
+        config = {'s3' : {'access' : get_key(args.env, "access"), 'secret' : get_key(args.env, "secret")}}
+
+    session = None
+    if args.index:
+        from index import LocalIndex
+        session = LocalIndex(args.index)
+
+    service = MatchService(config, session = session,
+        sessions = SessionManager(rate = args.rate, retries = args.retries, pool_size = max(32, args.max_in_flight * args.workers)),
+        window = args.window_ms / 1000, max_rows = args.max_batch_rows, max_in_flight = args.max_in_flight,
+        cap = args.cap, log_level = args.log_level, workers = args.workers, retrieval = args.retrieval,
+        direct_lookup = not args.no_direct_lookup, refine = not args.no_refine,
+        cache = DiskCache(args.cache, ttl = args.cache_ttl) if args.cache else None,
+        search_cache = SearchCache(args.search_cache_size) if args.search_cache_size else None)
+
+    server = serve(service, args.host, args.port)
+    logging.warning(f'Serving on http://{args.host}:{server.server_address[1]}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,192 @@
+# Title : Internet Archive Session Management
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#One pooled internetarchive session per process and configuration, with a client side rate limit and
+#retries with exponential backoff and jitter on 429, 5xx and dropped connections. A request that still
+#fails raises IAServiceError, so a failed lookup is never mistaken for a book that is not there.
+
+import json
+import logging
+import multiprocessing
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from internetarchive import get_session as open_session
+
+#responses worth another try: rate limited, or the service is having a bad moment
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class IAServiceError(Exception):
+    '''
+    The Internet Archive could not be reached, or kept answering 429 or 5xx, after every retry.
+    Unlike a result of None, it says nothing about whether the citation has a match.
+    '''
+
+    def __init__(self, message, status = None, url = None):
+        super().__init__(message)
+        self.status = status
+        self.url = url
+
+
+class TokenBucket:
+    '''
+    Token bucket rate limit for the threads of one process.
+
+    Input :
+        rate : (float) requests per second on average
+        burst : (int) requests allowed back to back after an idle period, rate when None
+    '''
+
+    def __init__(self, rate, burst = None):
+        assert rate > 0
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        self._state = [self.burst, time.monotonic()]
+        self._lock = threading.Lock()
+
+    def _take(self, state):
+        '''Output : (float) seconds to wait before a token is free, 0 after taking one'''
+        now = time.monotonic()
+        tokens = min(self.burst, state[0] + (now - state[1]) * self.rate)
+        state[1] = now
+        if tokens >= 1:
+            state[0] = tokens - 1
+            return 0.0
+        state[0] = tokens
+        return (1 - tokens) / self.rate
+
+    def acquire(self):
+        '''Blocks until the rate allows one more request'''
+        while True:
+            with self._lock:
+                wait = self._take(self._state)
+            if not wait:
+                return
+            time.sleep(wait)
+
+
+class SharedTokenBucket(TokenBucket):
+    '''
+    TokenBucket kept in shared memory, so every worker process spends the same budget. Build it in the
+    parent and hand it to the workers when they start, e.g. inside the match_kwargs of runner.run.
+    '''
+
+    def __init__(self, rate, burst = None):
+        assert rate > 0
+        self.rate = rate
+        self.burst = burst or max(1, rate)
+        context = multiprocessing.get_context('spawn')
+        #monotonic clocks are shared by the processes of one machine
+        self._state = context.RawArray('d', [self.burst, time.monotonic()])
+        self._lock = context.Lock()
+
+
+class RetryAdapter(HTTPAdapter):
+    '''
+    Pooled HTTP adapter that waits on a rate limit before every request and retries 429, 5xx and
+    connection errors with exponential backoff and full jitter, honouring Retry-After.
+
+    Input :
+        bucket : (TokenBucket) optional rate limit, shared by every session using it
+        retries : (int) retries after the first attempt
+        backoff : (float) base delay in seconds, doubled on every retry
+        max_backoff : (float) longest single delay
+        pool_size : (int) connections kept open per host, at least the number of concurrent requests
+    '''
+
+    def __init__(self, bucket = None, retries = 5, backoff = 0.5, max_backoff = 30, pool_size = 32):
+        self.bucket = bucket
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retried = 0
+        super().__init__(pool_connections = 4, pool_maxsize = pool_size, max_retries = 0)
+
+    def delay(self, attempt, response = None):
+        '''Output : (float) seconds to wait before retry number attempt (0 based)'''
+        if response is not None and response.headers.get('Retry-After', '').isdigit():
+            return min(float(response.headers['Retry-After']), self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def send(self, request, *args, **kwargs):
+        for attempt in range(self.retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            try:
+                response = super().send(request, *args, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = IAServiceError(f'{type(e).__name__} for {request.url}: {e}', url = request.url)
+                response = None
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                error = IAServiceError(f'HTTP {response.status_code} for {request.url}', status = response.status_code, url = request.url)
+
+            if attempt == self.retries:
+                break
+            wait = self.delay(attempt, response)
+            if response is not None:
+                response.close()
+            self.retried += 1
+            logging.debug(f'{error}, retry {attempt + 1} of {self.retries} in {wait:.2f} seconds')
+            time.sleep(wait)
+        raise error
+
+
+class SessionManager:
+    '''
+    Hands out one internetarchive session per process and configuration, with a RetryAdapter mounted.
+    Pickling keeps the settings and the bucket but not the sessions, so worker processes open their own.
+
+    Input :
+        rate : (float) requests per second allowed, None for no limit. Ignored when bucket is given.
+        burst : (int) see TokenBucket
+        bucket : (TokenBucket) rate limit to use, e.g. a SharedTokenBucket for several processes
+        retries, backoff, max_backoff, pool_size : see RetryAdapter
+    '''
+
+    def __init__(self, rate = None, burst = None, bucket = None, retries = 5, backoff = 0.5, max_backoff = 30, pool_size = 32):
+        if bucket is None and rate:
+            bucket = TokenBucket(rate, burst)
+        self.bucket = bucket
+        self.adapter_kwargs = {'retries' : retries, 'backoff' : backoff, 'max_backoff' : max_backoff, 'pool_size' : pool_size}
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        return {'bucket' : self.bucket, 'adapter_kwargs' : self.adapter_kwargs}
+
+    def __setstate__(self, state):
+        self.__init__(bucket = state['bucket'], **state['adapter_kwargs'])
+
+    def get(self, config):
+        '''Output : (ArchiveSession) the pooled session for config, opened on first use in this process'''
+        key = (os.getpid(), json.dumps(config, sort_keys = True, default = str))
+        with self._lock:
+            if key not in self._sessions:
+                s = open_session(config)
+                adapter = RetryAdapter(self.bucket, **self.adapter_kwargs)
+                #replaces the adapter internetarchive mounts for its host, whose retries would stack with these
+                s.mount(f'{s.protocol}//{s.host}', adapter)
+                s.mount('https://', adapter)
+                s.mount('http://', adapter)
+                self._sessions[key] = s
+            return self._sessions[key]
+
+    def adapter(self, config):
+        '''Output : (RetryAdapter) the adapter of the session for config, e.g. to read its retried count'''
+        s = self.get(config)
+        return s.get_adapter(f'{s.protocol}//{s.host}/')
+
+
+default_manager = SessionManager()
+
+def get_session(config):
+    '''Output : (ArchiveSession) the pooled session of the default SessionManager for config'''
+    return default_manager.get(config)
@@ -0,0 +1,237 @@
+# Title : Match Statistics
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Per stage timings and counters of get_matches, collected when a MatchStats is passed as stats=.
+#Totals cover every call the object was passed to, a callback receives one record per citation, and
+#to_prometheus renders everything in the Prometheus text exposition format.
+
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+
+#stages in the order a citation goes through them
+STAGES = ['parse', 'search', 'fetch', 'clean', 'features', 'model_load', 'predict']
+
+#counters kept per citation and in total
+COUNTERS = ['api_calls', 'cache_hits', 'cache_misses', 'candidates_scored', 'bytes_downloaded', 'deduplicated']
+
+#upper bounds, in seconds, of the per citation latency histogram
+LATENCY_BUCKETS = [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60]
+
+#the MatchStats counting the responses of the running call, and the open citation record of each MatchStats
+#by id. Context variables, so calls on other threads keep their own, and utils.fetch_items hands the caller's
+#to its worker threads.
+_counting = ContextVar('counting', default = ())
+_records = ContextVar('records', default = {})
+
+#sessions with the counting hook installed, and the calls counting on each
+_hooked = {}
+_hooked_lock = threading.Lock()
+
+
+def stage(stats, name):
+    '''Output : context manager timing stage name into stats, or doing nothing when stats is None'''
+    return nullcontext() if stats is None else stats.stage(name)
+
+
+def citation(stats, number, caches = (), record = None):
+    '''Output : context manager giving the record of citation number in stats, see MatchStats.citation, or None when stats is None'''
+    return nullcontext() if stats is None else stats.citation(number, caches, record)
+
+
+def cache_counts(caches):
+    '''Output : (tuple) hits and misses of caches added up, e.g. a cache.DiskCache and a cache.SearchCache'''
+    return sum(getattr(c, 'hits', 0) for c in caches), sum(getattr(c, 'misses', 0) for c in caches)
+
+
+def _count_response(response, *args, **kwargs):
+    '''requests response hook counting a response into the MatchStats of the call that received it'''
+    for stats in _counting.get():
+        stats.response_hook(response)
+
+
+@contextmanager
+def counting_responses(stats, session):
+    '''
+    Counts every response session receives in the with block, on this thread or on the worker threads of
+    utils.fetch_items, as an API call into stats and the open citation record. Responses other calls receive
+    on the same session at the same time are not counted. Does nothing when stats is None or the session
+    has no hooks.
+    '''
+    hooks = getattr(session, 'hooks', None) if stats is not None else None
+    if hooks is None or stats in _counting.get():
+        yield
+        return
+    with _hooked_lock:
+        if _hooked.setdefault(id(session), 0) == 0:
+            hooks['response'].append(_count_response)
+        _hooked[id(session)] += 1
+    token = _counting.set(_counting.get() + (stats,))
+    try:
+        yield
+    finally:
+        _counting.reset(token)
+        with _hooked_lock:
+            _hooked[id(session)] -= 1
+            if _hooked[id(session)] == 0:
+                del _hooked[id(session)]
+                hooks['response'].remove(_count_response)
+
+
+class MatchStats:
+    '''
+    Input :
+        callback : (function) optional, called with the record of every citation once it is scored
+
+    A citation's record has its number in the batch, 'seconds' for the stages run for it alone (parse,
+    search and fetch), 'latency' as their sum and the COUNTERS. Cleaning, features, model load and
+    predict run once per batch and only count in the totals. API calls and bytes are every response
+    the session received for the lookup of the citation. The open record is kept per thread, so one
+    MatchStats can be passed to calls running at the same time.
+    '''
+
+    def __init__(self, callback = None):
+        self.callback = callback
+        self.seconds = defaultdict(float)
+        self.calls = defaultdict(int)
+        self.counters = defaultdict(int)
+        self.citations = 0
+        self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latency_sum = 0.0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        state['callback'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def _current(self):
+        '''the citation record open on this thread, None when there is none'''
+        return _records.get().get(id(self))
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.seconds[name] += elapsed
+                self.calls[name] += 1
+                if self._current is not None and name in ('parse', 'search', 'fetch'):
+                    self._current['seconds'][name] = self._current['seconds'].get(name, 0.0) + elapsed
+
+    def count(self, name, n = 1, record = None):
+        '''Adds n to counter name, and to record or the open citation record'''
+        with self._lock:
+            self.counters[name] += n
+            record = record if record is not None else self._current
+            if record is not None:
+                record[name] = record.get(name, 0) + n
+
+    def response_hook(self, response, *args, **kwargs):
+        '''requests response hook counting API calls and bytes'''
+        length = response.headers.get('Content-Length')
+        self.count('api_calls')
+        self.count('bytes_downloaded', int(length) if length and length.isdigit() else len(response.content or b''))
+
+    def start_citation(self, number, record = None):
+        '''Opens the record of citation number, or reopens record, stages and counts are added to it until end_citation'''
+        if record is None:
+            record = {'citation' : number, 'seconds' : {}}
+            for name in COUNTERS:
+                record[name] = 0
+        records = dict(_records.get())
+        records[id(self)] = record
+        _records.set(records)
+
+    @contextmanager
+    def citation(self, number, caches = (), record = None):
+        '''
+        Opens the record of citation number, or reopens record, for the with block and gives it. The cache
+        hits and misses of caches during the block are counted into it.
+        '''
+        self.start_citation(number, record)
+        hits, misses = cache_counts(caches)
+        try:
+            yield self._current
+        finally:
+            hits_after, misses_after = cache_counts(caches)
+            self.count('cache_hits', hits_after - hits)
+            self.count('cache_misses', misses_after - misses)
+            self.end_citation()
+
+    def end_citation(self):
+        '''Output : (dict) the record of the citation, now closed'''
+        records = dict(_records.get())
+        record = records.pop(id(self), None)
+        _records.set(records)
+        return record
+
+    def finish_citation(self, record):
+        '''Adds a closed record to the latency histogram and hands it to the callback'''
+        record['latency'] = sum(record['seconds'].values())
+        with self._lock:
+            self.citations += 1
+            self.latency_sum += record['latency']
+            bucket = next((i for i, bound in enumerate(LATENCY_BUCKETS) if record['latency'] <= bound), len(LATENCY_BUCKETS))
+            self.latency_buckets[bucket] += 1
+        if self.callback is not None:
+            self.callback(record)
+
+    def merge(self, other):
+        '''Adds the totals of another MatchStats, e.g. one sent back by a worker process'''
+        with self._lock:
+            for name, value in other.seconds.items():
+                self.seconds[name] += value
+            for name, value in other.calls.items():
+                self.calls[name] += value
+            for name, value in other.counters.items():
+                self.counters[name] += value
+            self.citations += other.citations
+            self.latency_sum += other.latency_sum
+            self.latency_buckets = [a + b for a, b in zip(self.latency_buckets, other.latency_buckets)]
+
+    def summary(self):
+        '''Output : (dict) totals, for logs and JSON'''
+        return {
+            'citations' : self.citations,
+            'seconds' : dict((name, round(self.seconds[name], 4)) for name in STAGES if name in self.seconds),
+            'counters' : dict((name, self.counters[name]) for name in COUNTERS),
+        }
+
+    def to_prometheus(self, prefix = 'wiki2ia'):
+        '''Output : (str) the totals in the Prometheus text exposition format'''
+        lines = [
+            f'# HELP {prefix}_stage_seconds_total Seconds spent in each matching stage.',
+            f'# TYPE {prefix}_stage_seconds_total counter',
+        ]
+        lines += [f'{prefix}_stage_seconds_total{{stage="{name}"}} {self.seconds[name]:.6f}' for name in STAGES]
+        lines += [
+            f'# HELP {prefix}_stage_runs_total Times each matching stage ran.',
+            f'# TYPE {prefix}_stage_runs_total counter',
+        ]
+        lines += [f'{prefix}_stage_runs_total{{stage="{name}"}} {self.calls[name]}' for name in STAGES]
+        for name in COUNTERS:
+            lines += [f'# TYPE {prefix}_{name}_total counter', f'{prefix}_{name}_total {self.counters[name]}']
+
+        lines += [
+            f'# HELP {prefix}_citation_seconds Parse, search and fetch time per citation.',
+            f'# TYPE {prefix}_citation_seconds histogram',
+        ]
+        cumulative = 0
+        for bound, n in zip(LATENCY_BUCKETS + ['+Inf'], self.latency_buckets):
+            cumulative += n
+            lines.append(f'{prefix}_citation_seconds_bucket{{le="{bound}"}} {cumulative}')
+        lines += [f'{prefix}_citation_seconds_sum {self.latency_sum:.6f}', f'{prefix}_citation_seconds_count {self.citations}']
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,148 @@
+# Title : Persistent Result Store
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Keeps what get_matches worked out for every canonical citation, so a rerun over a new Wikipedia
+#snapshot only looks up citations it has not seen. A citation's entry is keyed by the hash of its
+#canonical.citation_key and the settings of the lookup, see wiki2ia.store_key, and holds the candidate
+#identifiers, the candidates' output fields and feature vectors, the model version and the
+#predictions. Entries predicted by another model are predicted again from their stored features,
+#without any request. Entries older than the staleness policy are looked up again.
+#
+#    python pipeline.py citations.jsonl matches.jsonl --store results.sqlite --store-max-age 2592000
+#    python store.py results.sqlite            summary of a store
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+#candidate columns stored to rebuild get_match's output, search_steps_ia only when the search was refined
+STORED_COLUMNS = ['title_ia', 'author_ia', 'publisher_ia', 'date_ia', 'url_ia', 'search_steps_ia']
+
+
+def citation_hash(key):
+    '''Output : (str) sha256 of a wiki2ia.store_key, the key of its entry'''
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _json_default(value):
+    #numpy scalars of the candidate columns
+    return value.item()
+
+
+class ResultStore:
+    '''
+    SQLite table of get_matches results by canonical citation, built like cache.DiskCache.
+
+    Input :
+        path : (str) file of the SQLite database, created if missing
+        max_age : (float) seconds after which an entry is looked up again, None keeps entries until replaced
+        max_age_unmatched : (float) optional shorter max_age for entries without a match, as new
+            Internet Archive items can only turn those into matches
+        table : (str) table name
+
+    Pickling one reopens the file on load, so worker processes can share a store.
+    '''
+
+    def __init__(self, path, max_age = None, max_age_unmatched = None, table = 'results'):
+        assert table.isidentifier()
+        self.path = path
+        self.max_age = max_age
+        self.max_age_unmatched = max_age_unmatched
+        self.table = table
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.repredicted = 0
+        self._lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        self._conn = sqlite3.connect(self.path, timeout = 60, isolation_level = None, check_same_thread = False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(f'CREATE TABLE IF NOT EXISTS {self.table} (hash TEXT PRIMARY KEY, citation_key TEXT NOT NULL, '
+            'model_version TEXT NOT NULL, matched INTEGER NOT NULL, fetched REAL NOT NULL, entry TEXT NOT NULL)')
+
+    def __getstate__(self):
+        return {'path' : self.path, 'max_age' : self.max_age, 'max_age_unmatched' : self.max_age_unmatched, 'table' : self.table}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def is_stale(self, matched, fetched, now = None):
+        '''Output : (bool) whether an entry fetched at fetched, with or without a match, is due to be looked up again'''
+        limit = self.max_age_unmatched if not matched and self.max_age_unmatched is not None else self.max_age
+        return limit is not None and (now or time.time()) - fetched > limit
+
+    def get(self, key):
+        '''
+        Input :
+            key : (str) wiki2ia.store_key of a citation
+
+        Output : (dict) its entry, see put, or None when there is none or it is stale
+        '''
+        with self._lock:
+            row = self._conn.execute(f'SELECT model_version, matched, fetched, entry FROM {self.table} WHERE hash = ?', (citation_hash(key),)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            if self.is_stale(row[1], row[2]):
+                self.stale += 1
+                return None
+            self.hits += 1
+        entry = json.loads(row[3])
+        entry.update(key = key, model_version = row[0], fetched = row[2])
+        return entry
+
+    def put(self, key, entry):
+        '''
+        Input :
+            key : (str) wiki2ia.store_key of a citation
+            entry : (dict) 'candidates' identifiers, 'rows' as {column : values} of STORED_COLUMNS,
+                'feature_names', 'features' one vector per candidate, 'match' one bool per candidate,
+                'model_version' and 'fetched', the time the candidates were looked up
+        '''
+        body = dict((name, entry[name]) for name in ['candidates', 'rows', 'feature_names', 'features', 'match'])
+        with self._lock:
+            self._conn.execute(f'INSERT OR REPLACE INTO {self.table} (hash, citation_key, model_version, matched, fetched, entry) VALUES (?, ?, ?, ?, ?, ?)',
+                (citation_hash(key), key, entry['model_version'], int(any(entry['match'])), entry['fetched'], json.dumps(body, default = _json_default)))
+
+    def update_prediction(self, key, entry):
+        '''Stores the match and model_version of an entry predicted again, keeping when it was fetched'''
+        self.put(key, entry)
+        with self._lock:
+            self.repredicted += 1
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f'SELECT COUNT(*) FROM {self.table}').fetchone()[0]
+
+    def stats(self):
+        '''Output : (dict) counters of this process and the number of stored entries'''
+        return {'hits' : self.hits, 'misses' : self.misses, 'stale' : self.stale, 'repredicted' : self.repredicted, 'size' : len(self)}
+
+    def summary(self):
+        '''Output : (dict) entries, matched entries and entries per model version, and the oldest and newest fetch times'''
+        with self._lock:
+            total, matched, oldest, newest = self._conn.execute(f'SELECT COUNT(*), COALESCE(SUM(matched), 0), MIN(fetched), MAX(fetched) FROM {self.table}').fetchone()
+            versions = dict(self._conn.execute(f'SELECT model_version, COUNT(*) FROM {self.table} GROUP BY model_version').fetchall())
+            stale = sum(self.is_stale(row[0], row[1]) for row in self._conn.execute(f'SELECT matched, fetched FROM {self.table}'))
+        return {'entries' : total, 'matched' : matched, 'stale' : stale, 'model_versions' : versions,
+            'oldest_fetch' : time.ctime(oldest) if oldest else None, 'newest_fetch' : time.ctime(newest) if newest else None}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Summarize a result store.')
+    parser.add_argument('path', help = 'SQLite file of the store')
+    parser.add_argument('--max-age', type = float, default = None, help = 'seconds after which entries count as stale')
+    parser.add_argument('--max-age-unmatched', type = float, default = None, help = 'seconds after which entries without a match count as stale')
+    args = parser.parse_args()
+
+    print(json.dumps(ResultStore(args.path, args.max_age, args.max_age_unmatched).summary(), indent = 1))
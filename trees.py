@@ -0,0 +1,183 @@
+# Title : NumPy Tree Model
+# Author : Alex Bass
+# Date : 18 Oct 2026
+
+#Exports the trees of the fitted HistGradientBoostingClassifier in finalized_model.sav to plain NumPy
+#arrays, and predicts from them with NumPy alone: no pickle, no scikit-learn, and nothing that breaks
+#when either changes version. Every array is memory mapped, so processes loading the same export
+#share its pages. Predictions are the same as loaded_model.predict, see benchmarks/tree_parity.py.
+#
+#    python trees.py finalized_model.sav finalized_model_trees/
+#
+#The nodes of all trees are numbered one after the other, and a leaf's children are the leaf itself.
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+TREE_FILES = ['features.npy', 'thresholds.npy', 'missing_go_to_left.npy', 'left.npy', 'right.npy', 'values.npy', 'roots.npy']
+
+
+def file_hash(path):
+    '''Output : (str) sha256 of a file, the version of a pickled model'''
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def export_trees(model_path, out_dir):
+    '''
+    Input :
+        model_path : (str) pickled binary HistGradientBoostingClassifier without categorical features
+        out_dir : (str) directory to write the arrays and model.json to, created when missing
+
+    Output : (int) number of trees exported
+    '''
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+    assert model.n_trees_per_iteration_ == 1, 'only binary classifiers are supported'
+
+    trees = [predictors[0] for predictors in model._predictors]
+    assert not any(tree.nodes['is_categorical'].any() for tree in trees), 'categorical splits are not supported'
+
+    features, thresholds, missing, left, right, values, roots = [], [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        nodes = tree.nodes
+        ids = np.arange(offset, offset + len(nodes))
+        leaf = nodes['is_leaf'].astype(bool)
+        roots.append(offset)
+        features.append(nodes['feature_idx'])
+        thresholds.append(nodes['num_threshold'])
+        missing.append(nodes['missing_go_to_left'])
+        left.append(np.where(leaf, ids, nodes['left'].astype(np.int64) + offset))
+        right.append(np.where(leaf, ids, nodes['right'].astype(np.int64) + offset))
+        values.append(np.where(leaf, nodes['value'], 0.0))
+        offset += len(nodes)
+
+    os.makedirs(out_dir, exist_ok = True)
+    arrays = {
+        'features.npy' : np.concatenate(features).astype(np.uint16),
+        'thresholds.npy' : np.concatenate(thresholds).astype(np.float64),
+        'missing_go_to_left.npy' : np.concatenate(missing).astype(bool),
+        'left.npy' : np.concatenate(left).astype(np.int32),
+        'right.npy' : np.concatenate(right).astype(np.int32),
+        'values.npy' : np.concatenate(values).astype(np.float64),
+        'roots.npy' : np.array(roots, dtype = np.int32),
+    }
+    for name, array in arrays.items():
+        np.save(os.path.join(out_dir, name), array)
+
+    meta = {
+        'baseline' : float(model._baseline_prediction.ravel()[0]),
+        'classes' : model.classes_.tolist(),
+        'feature_names' : [str(name) for name in getattr(model, 'feature_names_in_', [])] or None,
+        'n_features' : int(model.n_features_in_),
+        'max_depth' : int(max(tree.nodes['depth'].max() for tree in trees)),
+        'source_sha256' : file_hash(model_path),
+    }
+    with open(os.path.join(out_dir, 'model.json'), 'w') as f:
+        json.dump(meta, f, indent = 1)
+    return len(trees)
+
+
+class TreeModel:
+    '''
+    Predictor over an export of export_trees, used in place of the unpickled classifier.
+
+    Input :
+        model_dir : (str) directory written by export_trees
+
+    predict, predict_proba and decision_function take a 2D array or a DataFrame with the feature
+    names of the fitted model, NaN for missing values, like the classifier's.
+    '''
+
+    def __init__(self, model_dir):
+        self.model_dir = model_dir
+        for name in TREE_FILES:
+            #a plain array over the mapped pages, indexing a np.memmap goes through its subclass on every step
+            setattr(self, '_' + name[:-4], np.asarray(np.load(os.path.join(model_dir, name), mmap_mode = 'r')))
+        with open(os.path.join(model_dir, 'model.json')) as f:
+            meta = json.load(f)
+        self.baseline = meta['baseline']
+        self.classes_ = np.array(meta['classes'])
+        self.feature_names = meta['feature_names']
+        self.n_features = meta['n_features']
+        self.max_depth = meta['max_depth']
+        self.source_sha256 = meta['source_sha256']
+        #left and right child of node i at 2 * i and 2 * i + 1, one lookup per step instead of two
+        self._children = np.column_stack([self._left, self._right]).ravel()
+
+    def __getstate__(self):
+        #worker processes map the files again rather than receive copies
+        return {'model_dir' : self.model_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['model_dir'])
+
+    def _as_array(self, X):
+        if hasattr(X, 'columns') and self.feature_names is not None:
+            X = X[self.feature_names]
+        X = np.asarray(X, dtype = np.float64)
+        assert X.ndim == 2 and X.shape[1] == self.n_features, f'expected {self.n_features} features, got shape {X.shape}'
+        return X
+
+    def leaves(self, X):
+        '''Output : (np.ndarray) node number of the leaf each sample reaches in each tree, samples x trees'''
+        X = self._as_array(X)
+        n_trees = len(self._roots)
+        nodes = np.tile(self._roots, len(X))
+        #position of each (sample, tree) pair's sample in the flattened features
+        starts = np.repeat(np.arange(len(X)) * self.n_features, n_trees)
+        values = X.ravel()
+
+        #only pairs not yet on a leaf take another step, most trees end well before max_depth
+        active = np.flatnonzero(self._left[nodes] != nodes)
+        while len(active):
+            current = nodes[active]
+            x = values[starts[active] + self._features[current]]
+            go_right = np.where(np.isnan(x), ~self._missing_go_to_left[current], x > self._thresholds[current])
+            current = self._children[2 * current + go_right]
+            nodes[active] = current
+            active = active[self._left[current] != current]
+        return nodes.reshape(len(X), n_trees)
+
+    def decision_function(self, X):
+        '''Output : (np.ndarray) raw score of each sample, the log odds of the positive class'''
+        values = self._values[self.leaves(X)]
+        raw = np.full(len(values), self.baseline)
+        #tree by tree, in the classifier's order, so the float sums are the same
+        for tree in range(values.shape[1]):
+            raw += values[:, tree]
+        return raw
+
+    def predict_proba(self, X):
+        '''Output : (np.ndarray) samples x 2 probabilities of the two classes'''
+        raw = self.decision_function(X)
+        #the classifier's logistic function, within one ulp: NumPy's exp can round differently from libm's
+        with np.errstate(over = 'ignore'):
+            positive = 1 / (1 + np.exp(-raw))
+        return np.column_stack([1 - positive, positive])
+
+    def predict(self, X, threshold = 0.5):
+        '''
+        Input :
+            X : features, see the class description
+            threshold : (float) probability the positive class has to exceed
+
+        Output : (np.ndarray) predicted class of each sample. With the default threshold this is the
+            classifier's predict, which picks the more likely class and the negative one on a tie.
+        '''
+        return self.classes_[(self.predict_proba(X)[:, 1] > threshold).astype(int)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Export the trees of a pickled HistGradientBoostingClassifier to NumPy arrays.')
+    parser.add_argument('model', help = 'pickled model, e.g. finalized_model.sav')
+    parser.add_argument('out_dir', help = 'directory to write the arrays to')
+    args = parser.parse_args()
+
+    print(f'Exported {export_trees(args.model, args.out_dir)} trees to {args.out_dir}')
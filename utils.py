@@ -2,16 +2,53 @@
 # Author : Alex Bass
 # Date : 12 Feb 2023
 
+#pandas, numpy, features (thefuzz) and session (requests, internetarchive) are imported by the
+#functions that use them, so parsing citations alone, as dump.py does, starts without them
 
-from internetarchive import get_session
-from dotenv import load_dotenv
-from os import getcwd, getenv
+import importlib
 import json
+import math
 import re
-import pandas as pd
-import numpy as np
 import logging
-from thefuzz import fuzz
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from blocking import BLOCKING_FIELDS, first_year
+from stats import stage
+from normalize import AUTHOR_FIELDS, clean_title, clean_ia_author, clean_wiki_publisher, clean_author_wiki, clean_column, combine_wiki_authors
+
+#fields get_results needs for a candidate, requested from the search index in 'search' retrieval
+SEARCH_FIELDS = ['identifier', 'title', 'creator', 'publisher', 'date', 'year', 'identifier-access']
+
+#fields kept from an item's metadata, this is what a metadata cache stores per identifier
+METADATA_FIELDS = ['title', 'creator', 'publisher', 'date', 'year', 'identifier-access']
+
+#format of 'identifier-access' in item metadata, used when the search index does not return it
+IA_DETAILS_URL = 'http://archive.org/details/{}'
+
+_LAZY_NAMES = {'create_features' : 'features', 'get_lev_distance_or_NA' : 'features'}
+
+def __getattr__(name):
+    #names of features.py kept importable from here, loaded on first use
+    if name in _LAZY_NAMES:
+        return getattr(importlib.import_module(_LAZY_NAMES[name]), name)
+    raise AttributeError(f"module 'utils' has no attribute '{name}'")
+
+
+def get_session(config):
+    '''Output : (ArchiveSession) the pooled session of session.get_session, requests and internetarchive are imported on the first call'''
+    from session import get_session as pooled_session
+    return pooled_session(config)
+
+
+_logging_configured = False
+
+def configure_logging(level):
+    '''Sets up the root logger at level on the first call, as logging.basicConfig would, later calls cost nothing'''
+    global _logging_configured
+    if not _logging_configured:
+        logging.basicConfig(level=level)
+        _logging_configured = True
+
 
 #quick utility function
 def try_to_pull(json, value):
@@ -24,22 +61,181 @@ def try_to_pull(json, value):
         return  None
 
 
-def get_results(config, cite_book_dict, cap, log):
+def fetch_items(s, ia_ids, workers = 1):
+    '''
+    Input :
+        s : (ArchiveSession) session used to pull item metadata
+        ia_ids : (list) Internet Archive identifiers to pull
+        workers : (int) number of concurrent requests, 1 pulls the items one at a time
+
+    Output : (list) items in the same order as ia_ids
+    '''
+    if workers <= 1 or len(ia_ids) <= 1:
+        return [s.get_item(ia_id) for ia_id in ia_ids]
+
+    pool = ThreadPoolExecutor(max_workers = min(workers, len(ia_ids)))
+    try:
+        #map keeps input order and re-raises the first failed request. Each request runs in a copy of the
+        #caller's context, so stats.counting_responses counts it against the caller's citation
+        contexts = [copy_context() for _ in ia_ids]
+        return list(pool.map(lambda context, ia_id: context.run(s.get_item, ia_id), contexts, ia_ids))
+    finally:
+        pool.shutdown(wait = False, cancel_futures = True)
+
+
+def pull_metadata(big_json):
+    '''
+    Input :
+        big_json : (dict) metadata section of an Internet Archive item
+
+    Output : (dict) METADATA_FIELDS as returned by try_to_pull
+    '''
+    return dict((field, try_to_pull(big_json, field)) for field in METADATA_FIELDS)
+
+
+def fetch_metadata(s, ia_ids, workers = 1, cache = None):
+    '''
+    Input :
+        s : (ArchiveSession) session used to pull item metadata
+        ia_ids : (list) Internet Archive identifiers to pull
+        workers : (int) number of concurrent requests
+        cache : (object) optional cache with get(identifier) and put(identifier, value), e.g. cache.DiskCache
+
+    Output : (list) pull_metadata output in the same order as ia_ids, None for items without metadata
+    '''
+    exp = [cache.get(ia_id) if cache is not None else None for ia_id in ia_ids]
+    missing = [i for i, value in enumerate(exp) if value is None]
+
+    test_items = fetch_items(s, [ia_ids[i] for i in missing], workers)
+
+    for i, test_item in zip(missing, test_items):
+        try:
+            big_json = test_item.item_metadata['metadata']
+        except Exception:
+            continue
+        exp[i] = pull_metadata(big_json)
+        if cache is not None:
+            cache.put(ia_ids[i], exp[i])
+
+    return exp
+
+
+def assemble_candidates(search_query, records, cite_book_dict):
+    '''
+    Input :
+        search_query : (str) query the candidates were found with
+        records : (list) metadata dicts of the candidates, one per row
+        cite_book_dict : (dict) parsed wikipedia citation repeated on every row
+
+    Output : (pd.DataFrame) one row per candidate, built column by column in a single allocation.
+        'author_wiki' is the citation's combined author, see normalize.combine_wiki_authors.
+    '''
+    import pandas as pd
+
+    n = len(records)
+    columns = {
+        'search_query_ia' : [search_query] * n,
+        'title_ia' : [try_to_pull(big_json, 'title') for big_json in records],
+        'author_ia' : [try_to_pull(big_json, 'creator') for big_json in records],
+        'publisher_ia' : [try_to_pull(big_json, 'publisher') for big_json in records],
+        'date_ia' : [try_to_pull(big_json, 'date') for big_json in records],
+        'year_ia' : [try_to_pull(big_json, 'year') for big_json in records],
+        'url_ia' : [try_to_pull(big_json, 'identifier-access') for big_json in records]
+    }
+
+    for key, value in cite_book_dict.items():
+        columns[key] = [value] * n
+    columns['author_wiki'] = [combine_wiki_authors(cite_book_dict)] * n
+
+    return pd.DataFrame(columns)
+
+
+def run_search(s, search_query, cap, fields = None):
+    '''
+    Input :
+        s : (ArchiveSession) session used to search
+        search_query : (str) Internet Archive search query
+        cap : (int) results at or above this count are not listed
+        fields : (list) fields to return for every result, only the identifier when None
+
+    Output : (dict) 'num_found' and 'hits', the list of search results. 'hits' is None when the query
+        failed, found nothing or found cap results or more
+    '''
+    if fields:
+        response = s.search_items(search_query, fields = fields)
+    else:
+        response = s.search_items(search_query)
+    num_found = response.num_found
+    if isinstance(num_found, dict) or num_found >= cap or num_found == 0:
+        return {'num_found' : num_found, 'hits' : None}
+    return {'num_found' : num_found, 'hits' : list(response.iter_as_results())}
+
+
+def get_results(config, cite_book_dict, cap, log, session = None, workers = 1, retrieval = 'item', fallback_fields = ('title',), cache = None, search_cache = None, blocker = None, refine = False, refine_target = None, stats = None):
     '''Output: a dataframe with features to be predicted on
+
+    session : (ArchiveSession) optional already opened session to reuse across calls
+    workers : (int) number of item metadata requests to run concurrently
+    retrieval : (str) 'item' pulls the full metadata of every search hit, 'search' builds candidates
+        from SEARCH_FIELDS of the paged search results without any per item request
+    fallback_fields : (tuple) in 'search' retrieval, hits missing any of these fields are pulled per item
+    cache : (object) optional item metadata cache consulted before every per item request, see fetch_metadata
+    search_cache : (cache.SearchCache) optional memo of search results keyed by requested fields and query
+    blocker : (blocking.Blocker) optional pruning of the search hits before any metadata is pulled. With a
+        blocker, searches with cap results or more are paged through instead of skipped.
+    refine : (bool) when the title search finds refine_target results or more, narrow it with the clauses of
+        refinement_clauses one at a time until it finds fewer. A clause that finds nothing is left out. The
+        queries tried are recorded in a 'search_steps_ia' column.
+    refine_target : (int) result count to narrow below, cap when None. When every clause leaves the search at or
+        above it, only its first refine_target results are pulled
+    stats : (stats.MatchStats) optional, search and fetch time are added to it
     '''
     assert isinstance(config, dict)
     assert isinstance(cite_book_dict, dict)
     assert isinstance(cap, int)
+    assert retrieval in ['item', 'search']
+    import pandas as pd
     
-    logging.basicConfig(level=log)
+    configure_logging(log)
     
     #configuring API connection
-    s = get_session(config)
+    s = session if session is not None else get_session(config)
 
+    found = title_records(s, cite_book_dict, cap, workers, retrieval, fallback_fields, cache, search_cache, blocker, refine, refine_target, stats)
+    if found is None:
+        return None
+    search_query, records, steps = found
+
+    data = assemble_candidates(search_query, records, cite_book_dict)
+    if steps:
+        data['search_steps_ia'] = pd.Series([steps] * len(data), index = data.index, dtype = object)
+    return data
+
+
+def title_records(s, cite_book_dict, cap, workers = 1, retrieval = 'item', fallback_fields = ('title',), cache = None, search_cache = None, blocker = None, refine = False, refine_target = None, stats = None):
+    '''Output : (tuple) query, metadata records and refinement steps of the items get_results finds, None when the search lists none'''
+    found = search_title(s, cite_book_dict, cap, retrieval, search_cache, blocker, refine, refine_target, stats)
+    if found is None:
+        return None
+    search_query, hits, steps = found
+    return search_query, fetch_candidates(s, hits, workers, retrieval, fallback_fields, cache, stats), steps
+
+
+def search_title(s, cite_book_dict, cap, retrieval = 'item', search_cache = None, blocker = None, refine = False, refine_target = None, stats = None):
+    '''
+    Input :
+        s : (ArchiveSession) session used to search
+        cite_book_dict : (dict) parsed wikipedia citation
+        the other arguments as for get_results
+
+    Output : (tuple) the query, its listed hits and the refinement steps tried, a list of {'query', 'num_found'},
+        empty when the search was not refined. Metadata is not pulled yet, see fetch_candidates. None, with
+        the reason logged, when the citation has no title or the search lists nothing.
+    '''
     try:
         title = cite_book_dict['title_wiki'] #grab from wikipedia dict
         title = clean_title(title)
-        if title is None or title == "None" or pd.isna(title):
+        if title is None or title == "None" or (isinstance(title, float) and math.isnan(title)):
             logging.error("This Wikipedia Reference Has No Title!")
             return None
     except KeyError:
@@ -47,52 +243,254 @@ def get_results(config, cite_book_dict, cap, log):
         return None
 
     search_query = f'collection:internetarchivebooks AND title:{title}'
-    response = s.search_items(search_query)
-    logging.info(f'There were {response.num_found} results found for this query')
-    if isinstance(response.num_found, dict):
+    steps = []
+    if refine:
+        #results are only listed once the query finds fewer than target, so nothing is pulled for a query that gets narrowed
+        target = min(refine_target or cap, cap)
+        hits, num_found = search_hits(s, search_query, cite_book_dict, target, retrieval, search_cache, blocker, page = False, stats = stats)
+        if not isinstance(num_found, dict) and num_found >= target:
+            steps.append({'query' : search_query, 'num_found' : num_found})
+            for clause in refinement_clauses(cite_book_dict):
+                query = f'{search_query} AND {clause}'
+                clause_hits, clause_found = search_hits(s, query, cite_book_dict, target, retrieval, search_cache, blocker, page = False, stats = stats)
+                steps.append({'query' : query, 'num_found' : clause_found})
+                if isinstance(clause_found, dict) or clause_found == 0:
+                    continue
+                search_query, hits, num_found = query, clause_hits, clause_found
+                logging.info(f'Refined the query to {num_found} results: {search_query}')
+                if num_found < target:
+                    break
+        if hits is None and not isinstance(num_found, dict) and num_found >= target and (num_found < cap or blocker is not None):
+            #still at or above target, listed as without refinement but only the first target results are pulled
+            hits, num_found = search_hits(s, search_query, cite_book_dict, cap, retrieval, search_cache, blocker, stats = stats)
+            if hits is not None:
+                hits = hits[:target]
+    else:
+        hits, num_found = search_hits(s, search_query, cite_book_dict, cap, retrieval, search_cache, blocker, stats = stats)
+
+    logging.info(f'There were {num_found} results found for this query')
+    if isinstance(num_found, dict):
         logging.error(f"There is likely a special character in the title that cause the API call to fail: {title}")
         return None
-    if response.num_found >= cap:
+    if num_found >= cap and hits is None:
         logging.warn("The number of API responses exceeded the cap allowed")
         return None
-    if response.num_found == 0:
+    if num_found == 0:
         logging.warn("There were no API responses found for this query")
         return None
+    if hits is None:
+        logging.error(f"There is likely a special character in the title that cause the API call to fail: {title}")
+        return None
 
-    ia_ids = [item['identifier'] for item in response.iter_as_results()]
+    return search_query, hits, steps
 
-    for i, ia_id in enumerate(ia_ids):
 
-        #pull relevant metadata
-        test_item = s.get_item(ia_id)
-        try:
-            big_json = test_item.item_metadata['metadata']
-        except:
-            logging.error(f"There is likely a special character in the title that cause the API call to fail: {title}")
-            return None
+#words left out of a publisher clause, they are in too many publisher names to narrow a search
+_PUBLISHER_STOP_WORDS = {'press', 'books', 'book', 'ltd', 'inc', 'co', 'company', 'publishers', 'publishing', 'publications', 'university', 'and', 'the', 'of', '&'}
+
+def refinement_clauses(cite_book_dict):
+    '''
+    Input :
+        cite_book_dict : (dict) parsed wikipedia citation
+
+    Output : (list) search clauses that narrow a title search, in the order they are tried: the author's
+        surname, the year and the publisher. Fields the citation does not have are left out.
+    '''
+    exp = []
+    for key in ['last_wiki', 'last1_wiki']:
+        surname = cite_book_dict.get(key)
+        words = clean_title(surname).split() if isinstance(surname, str) else []
+        if words:
+            exp.append(f'creator:({" AND ".join(words)})')
+            break
+
+    year = first_year(cite_book_dict.get('date_wiki'))
+    if year is not None:
+        exp.append(f'year:{year}')
+
+    publisher = cite_book_dict.get('publisher_wiki')
+    words = clean_title(publisher).split() if isinstance(publisher, str) else []
+    words = [word for word in words if word not in _PUBLISHER_STOP_WORDS]
+    if words:
+        exp.append(f'publisher:({" AND ".join(words)})')
+    return exp
+
+
+def search_hits(s, search_query, cite_book_dict, cap, retrieval = 'item', search_cache = None, blocker = None, page = True, stats = None):
+    '''
+    Input :
+        s : (ArchiveSession) session used to search
+        search_query : (str) Internet Archive search query
+        cite_book_dict : (dict) parsed wikipedia citation, for the blocker
+        page : (bool) with a blocker, page through a search with cap results or more
+        stats : (stats.MatchStats) optional, the time spent searching is added to it
+        the other arguments as for get_results
+
+    Output : (tuple) hits and num_found of the search. hits is None when the search found nothing or
+        found cap results or more without paging.
+    '''
+    fields = SEARCH_FIELDS if retrieval == 'search' else None
+    if blocker is not None and fields is None:
+        fields = BLOCKING_FIELDS
+    with stage(stats, 'search'):
+        if search_cache is not None:
+            key = f'{",".join(fields) if fields else "identifier"}|{search_query}'
+            result = search_cache.get_or_compute(key, lambda: run_search(s, search_query, cap, fields), cacheable = lambda r: not isinstance(r['num_found'], dict))
+            if result['hits'] is None and not isinstance(result['num_found'], dict) and 0 < result['num_found'] < cap:
+                #cached by a call with a lower cap, so the results were never listed
+                result = run_search(s, search_query, cap, fields)
+                search_cache.put(key, result)
+        else:
+            result = run_search(s, search_query, cap, fields)
+
+        num_found = result['num_found']
+        hits = result['hits']
+        if hits is not None and not isinstance(num_found, dict) and num_found >= cap and not (blocker is not None and page):
+            #listed by a call with a higher cap, over this call's cap
+            hits = None
+        if blocker is not None and not isinstance(num_found, dict):
+            if hits is None and num_found >= cap and page:
+                #read the listing page by page, prune stops as soon as it has enough candidates
+                logging.info(f'Paging through {num_found} results, at most {blocker.max_scan}')
+                hits = blocker.prune(cite_book_dict, s.search_items(search_query, fields = fields).iter_as_results())
+            elif hits is not None:
+                hits = blocker.prune(cite_book_dict, hits)
+            if hits is not None:
+                logging.debug(f'{len(hits)} results left after blocking')
+    return hits, num_found
+
+
+def fetch_candidates(s, hits, workers = 1, retrieval = 'item', fallback_fields = ('title',), cache = None, stats = None):
+    '''
+    Input :
+        s : (ArchiveSession) session used to pull item metadata
+        hits : (list) search hits, as listed by search_hits
+        stats : (stats.MatchStats) optional, the time spent pulling metadata is added to it
+        the other arguments as for get_results
 
-        ia_link = try_to_pull(big_json, 'identifier-access')
+    Output : (list) a metadata record per hit, for assemble_candidates. Hits without item metadata are
+        left out. Requests that fail raise session.IAServiceError.
+    '''
+    #copies, cached search results must not be changed below
+    hits = [dict(hit) for hit in hits]
+
+    if retrieval == 'search':
+        to_fetch = [i for i, hit in enumerate(hits) if any(field not in hit for field in fallback_fields)]
+        for hit in hits:
+            if 'identifier-access' not in hit:
+                hit['identifier-access'] = IA_DETAILS_URL.format(hit['identifier'])
+    else:
+        to_fetch = list(range(len(hits)))
+    logging.debug(f'Pulling item metadata for {len(to_fetch)} of {len(hits)} results')
+
+    #pull relevant metadata
+    with stage(stats, 'fetch'):
+        metadata = fetch_metadata(s, [hits[i]['identifier'] for i in to_fetch], workers, cache)
+
+    #request failures raise session.IAServiceError, None is an item without metadata, e.g. a dark item
+    missing = set()
+    for i, big_json in zip(to_fetch, metadata):
+        if big_json is None:
+            missing.add(i)
+        else:
+            hits[i] = big_json
+    if missing:
+        logging.warning(f'{len(missing)} of {len(hits)} results have no item metadata and are left out')
+        hits = [hit for i, hit in enumerate(hits) if i not in missing]
+    return hits
 
-        res_dict = {
-            'search_query_ia' : search_query,
-            'title_ia' : try_to_pull(big_json, 'title'),
-            'author_ia' : try_to_pull(big_json, 'creator'),
-            'publisher_ia' : try_to_pull(big_json, 'publisher'),
-            'date_ia' :  try_to_pull(big_json, 'date'),
-            'year_ia' : try_to_pull(big_json, 'year'),
-            'url_ia' : ia_link
-        }
 
-        res_dict = {**res_dict, **cite_book_dict}
+def search_candidates(s, search_query, cite_book_dict, cap, workers = 1, retrieval = 'item', fallback_fields = ('title',), cache = None, search_cache = None, blocker = None, page = True, stats = None):
+    '''
+    Output : (tuple) candidates dataframe and num_found of a search, search_hits followed by fetch_candidates.
+        The dataframe is None when search_hits lists no hits.
+    '''
+    hits, num_found = search_hits(s, search_query, cite_book_dict, cap, retrieval, search_cache, blocker, page, stats)
+    if hits is None:
+        return None, num_found
+    return assemble_candidates(search_query, fetch_candidates(s, hits, workers, retrieval, fallback_fields, cache, stats), cite_book_dict), num_found
 
-        tmp = pd.DataFrame(res_dict, index = [0])
 
-        if not 'df' in locals():
-            df = tmp
-        else:
-            df = pd.concat([df, tmp])
+_IA_URL = re.compile(r'archive\.org/(?:details|stream|download)/([^/?#&\s\[\]|}]+)')
 
-    return df
+def archive_identifier(url):
+    '''Output : (str) Internet Archive identifier of an archive.org item url, None for any other url'''
+    if not isinstance(url, str):
+        return None
+    match = _IA_URL.search(url)
+    return match.group(1) if match else None
+
+
+def isbn_variants(isbn):
+    '''
+    Input :
+        isbn : (str) ISBN as written in the citation, with or without hyphens and spaces
+
+    Output : (list) the ISBN-13 and, for 978 ISBNs, the ISBN-10 form, as Internet Archive items carry
+        either. Empty when the value is not a valid ISBN.
+    '''
+    if not isinstance(isbn, str):
+        return []
+    digits = re.sub(r'[^0-9Xx]', '', isbn).upper()
+
+    if len(digits) == 10 and digits[:9].isdigit():
+        check = sum((10 - i) * int(d) for i, d in enumerate(digits[:9])) % 11
+        if digits[9] != '0123456789X'[(11 - check) % 11]:
+            return []
+        isbn13 = '978' + digits[:9]
+    elif len(digits) == 13 and digits.isdigit():
+        isbn13 = digits[:12]
+    else:
+        return []
+    isbn13 += str((10 - sum((3 if i % 2 else 1) * int(d) for i, d in enumerate(isbn13)) % 10) % 10)
+    if len(digits) == 13 and isbn13 != digits:
+        return []
+
+    exp = [isbn13]
+    if isbn13.startswith('978'):
+        check = sum((10 - i) * int(d) for i, d in enumerate(isbn13[3:12])) % 11
+        exp.append(isbn13[3:12] + '0123456789X'[(11 - check) % 11])
+    return exp
+
+
+def get_direct_results(config, cite_book_dict, cap, log, session = None, workers = 1, retrieval = 'item', cache = None, search_cache = None, stats = None):
+    '''Output: a dataframe with features to be predicted on, found without a title search. None when
+        the citation has neither an archive.org url nor an ISBN, or when neither finds an item.
+
+    The identifier in an archive.org 'url' is checked with a single metadata request. Failing that,
+    the ISBN is searched for, which usually finds one or two items.
+    '''
+    s = session if session is not None else get_session(config)
+
+    found = direct_records(s, cite_book_dict, cap, workers, retrieval, cache, search_cache, stats)
+    if found is None:
+        return None
+    return assemble_candidates(found[0], found[1], cite_book_dict)
+
+
+def direct_records(s, cite_book_dict, cap, workers = 1, retrieval = 'item', cache = None, search_cache = None, stats = None):
+    '''Output : (tuple) query and metadata records of the items get_direct_results finds, None when it finds none'''
+    ia_id = archive_identifier(cite_book_dict.get('url_wiki'))
+    if ia_id is not None:
+        with stage(stats, 'fetch'):
+            big_json = fetch_metadata(s, [ia_id], cache = cache)[0]
+        if big_json is not None and big_json['title'] is not None:
+            logging.info(f'Found the item of the citation url: {ia_id}')
+            big_json = dict(big_json)
+            if big_json['identifier-access'] is None:
+                big_json['identifier-access'] = IA_DETAILS_URL.format(ia_id)
+            return f'identifier:{ia_id}', [big_json]
+        logging.info(f'The citation url does not point to an item with metadata: {ia_id}')
+
+    isbns = isbn_variants(cite_book_dict.get('isbn_wiki'))
+    if isbns:
+        search_query = f'isbn:({" OR ".join(isbns)})'
+        hits, num_found = search_hits(s, search_query, cite_book_dict, cap, retrieval, search_cache, stats = stats)
+        logging.info(f'There were {num_found} results found for the ISBN')
+        if hits is not None:
+            return search_query, fetch_candidates(s, hits, workers, retrieval, cache = cache, stats = stats)
+
+    return None
 
 
 def parse_cite_book(string, keys_to_keep):
@@ -101,26 +499,114 @@ def parse_cite_book(string, keys_to_keep):
         string : (str) Cite Book string from wikipedia
         keys_to_keep : (list) keys from Cite Book string to keep
 
-    Output : (dict) to be converted into tabular data with relevant information
+    Output : (dict) to be converted into tabular data with relevant information, see parse_template
+    '''
+    #splitting on every '|' and '=' gets spaced keys, nested templates, wiki links and urls with a query
+    #string wrong without an error, so every template goes through the tokenizer, as in dump.py
+    return parse_template(string, keys_to_keep)
+
+
+_TEMPLATE_TOKENS = re.compile(r'\{\{|\}\}|\[\[|\]\]|\||=')
+_COMMENTS = re.compile(r'<!--.*?(-->|$)', re.DOTALL)
+
+def tokenize_template(template):
+    '''
+    Input :
+        template : (str) one template with its outer braces, e.g. '{{cite book |title=...}}'
+
+    Output : (tuple) the template name and a list of (key, value) pairs. Splits only on the '|' and
+        first '=' that are not inside a nested template or wiki link. Positional parameters are keyed
+        by their position, as in MediaWiki. Names, keys and values are stripped of whitespace.
+    '''
+    inner = _COMMENTS.sub('', template).strip()
+    if inner.startswith('{{'):
+        inner = inner[2:]
+    if inner.endswith('}}'):
+        inner = inner[:-2]
+
+    pieces = []
+    start = 0
+    equals = None
+    braces = 0
+    links = 0
+    for token in _TEMPLATE_TOKENS.finditer(inner):
+        text = token.group()
+        if text == '{{':
+            braces += 1
+        elif text == '}}':
+            braces = max(braces - 1, 0)
+        elif text == '[[':
+            links += 1
+        elif text == ']]':
+            links = max(links - 1, 0)
+        elif braces or links:
+            continue
+        elif text == '|':
+            pieces.append((inner[start:token.start()], equals))
+            start = token.end()
+            equals = None
+        elif equals is None:
+            equals = token.start() - start
+    pieces.append((inner[start:], equals))
+
+    name = pieces[0][0].strip()
+    params = []
+    position = 0
+    for piece, equals in pieces[1:]:
+        if equals is None:
+            position += 1
+            params.append((str(position), piece.strip()))
+        else:
+            params.append((piece[:equals].strip(), piece[equals + 1:].strip()))
+    return name, params
+
+
+def parse_template(string, keys_to_keep):
+    '''
+    Input :
+        string : (str) Cite Book string from wikipedia
+        keys_to_keep : (list) keys from Cite Book string to keep
+
+    Output : (dict) the kept parameters, renamed with a '_wiki' suffix, built with tokenize_template and
+        their values rendered with render_wikitext. Empty values are left out, of a repeated parameter
+        the last value wins.
     '''
+    name, params = tokenize_template(string)
+    rendered = ((k, render_wikitext(v)) for k, v in params if k in keys_to_keep)
+    return dict((k+'_wiki', v) for k, v in rendered if v)
 
-    strings = string.split('|')
 
-    #cleaning strings
-    strings = strings[1:]
-    strings = [re.subn('}','',string)[0] for string in strings]
-    strings = [string.rstrip() for string in strings]
-    strings = [string.lstrip() for string in strings]
+#a wiki link or template with no other link or template inside it
+_INNERMOST_MARKUP = re.compile(r'\[\[([^\[\]{}]*)\]\]|\{\{([^\[\]{}]*)\}\}')
 
-    #creating and filtering dictionary
-    strings_dict = dict((re.search(r'(.+)=', string).groups(1)[0], re.search(r'=(.+)', string).groups(1)[0]) for string in strings)
+def _render_markup(match):
+    link, template = match.groups()
+    if link is not None:
+        pieces = link.split('|')
+        label = pieces[-1].strip() if len(pieces) > 1 else ''
+        #'[[Target|]]' and '[[Target]]' show the target
+        return label or pieces[0].strip().lstrip(':')
+    positional = [piece for piece in template.split('|')[1:] if '=' not in piece]
+    return positional[-1].strip() if positional else ''
 
-    strings_dict = dict((k, v) for k, v in strings_dict.items() if k in keys_to_keep)
 
-    #renaming keys
-    exp = dict((k+'_wiki', v) for k,v in strings_dict.items())
+def render_wikitext(value):
+    '''
+    Input :
+        value : (str) template parameter value
 
-    return(exp)
+    Output : (str) value as a reader sees it, as far as a search needs: a wiki link becomes its label,
+        or its target when it has none, and a nested template its last positional parameter, e.g.
+        '{{lang|fr|Île}}' becomes 'Île'. A template without positional parameters is left out.
+    '''
+    while '[[' in value or '{{' in value:
+        #innermost first, so '{{lang|fr|[[Île de Pâques|Île]]}}' renders its link before the template is split
+        rendered = _INNERMOST_MARKUP.sub(_render_markup, value)
+        if rendered == value:
+            #unbalanced brackets, left as they are
+            break
+        value = rendered
+    return value.strip()
 
 
 def pandas_row_to_dict(row_num, data):
@@ -138,138 +624,21 @@ def pandas_row_to_dict(row_num, data):
 
     return results
 
-def clean_title(title):
-    if isinstance(title, float):
-        return title
-    title = title.replace(":", "")
-    title = title.replace(",", "")
-    title = title.replace(";", "")
-    title = title.replace("'", "")
-    title = title.replace('"', "")
-    title = title.replace('.', "")
-    title = title.replace('[', "")
-    title = title.replace(']', "")
-    title = title.replace('!', "")
-    title = title.replace('/', "")
-    title = title.replace('\\', "")
-    title = title.replace('@', "")
-    title = title.replace('*', "")
-    title = title.replace('#', "")
-    title = title.replace('?', "")
-    title = title.replace('%', "")
-    title = title.lower()
-    title = title.strip()
-    return title
-
-def clean_ia_author(author):
-    try:
-        author.find("(")
-    except AttributeError:
-        #object is NA
-        return author
-    if author.find("(") != -1 and author.find(")") != -1:
-        author = re.subn(r'[A-Z]\.',"", author)[0]
-    author = author.lower()
-    author = author.split(',')
-    if isinstance(author, list) and len(author) == 1:
-        author = author[0]
-    elif isinstance(author, list) and len(author) > 1:
-        author.reverse()
-        author = ' '.join(author)
-    author = author.replace(":", "")
-    author = author.replace("-", "")
-    author = author.replace("[", "")
-    author = author.replace("]", "")
-    author = author.replace("(", "")
-    author = author.replace(")", "")
-    author = author.replace("  ", " ")
-    author = author.replace("author", "")
-    author = author.replace("editor in chief", "")
-    author = author.replace("compiler", "")
-    author = author.replace("editor", "")
-    author = re.subn(r'[0-9]+',"", author)[0]
-    author = author.strip()
-    if len(list(set(author.split(" ")))) < len(list(author.split(" "))):
-        author = list(set(author.split(" ")))
-        author = " ".join(author)
-        author = author.strip()
-    return author
-
-def clean_wiki_publisher(var):
-    if isinstance(var, float):
-        return var
-    try:
-        var.find("(")
-    except AttributeError:
-        #object is NA
-        return var
-    var = var.replace("[", "")
-    var = var.replace("]", "")
-    return var
-
-def clean_author_wiki(var):
-    if isinstance(var, float):
-        return var
-    var = var.replace(":", "")
-    var = var.replace("-", "")
-    var = var.replace("[", "")
-    var = var.replace("]", "")
-    var = var.replace("(", "")
-    var = var.replace(")", "")
-    var = var.replace(".", "")
-    var = var.lower()
-    var = var.strip()
-    return var
-
-def get_lev_distance_or_NA(data, columns, partial = False, sort = False):
-    assert isinstance(data, pd.DataFrame)
-    assert isinstance(columns, list)
-    assert len(columns) == 2
-    #If partial is True, First column will be fully matched, Second column partially matched
-    assert isinstance(columns[0], str)
-    assert isinstance(columns[1], str)
-    
-    out = []
-    for i in range(data.shape[0]):
-        val1 = data[columns[0]].iloc[i]
-        val2 = data[columns[1]].iloc[i]
-        if pd.isna(val1) or val1 == "" or pd.isna(val2) or val2 == "":
-            out.append(np.nan)
-        else:
-            if partial and sort:
-                out.append(fuzz.partial_token_sort_ratio(val1, val2))
-            elif partial:
-                out.append(fuzz.partial_ratio(val1, val2))
-            elif sort:
-                out.append(fuzz.token_sort_ratio(val1, val2))
-            else:
-                out.append(fuzz.ratio(val1, val2))
-    return out
-
 def clean_data(data):
+    import pandas as pd
     assert isinstance(data, pd.DataFrame)
     assert not data.empty
-    
-    cols_to_check = ['first_wiki', 'last_wiki', 'first1_wiki', 'last1_wiki', 'first2_wiki', 'last2_wiki']
-    tmp_col_list = [x for x in data.columns if x in cols_to_check]
-    
-    tmp = data[tmp_col_list]
-
-    def quick_combine(row):
-        row = row.dropna()
-        if len(row) == 0:
-            return np.nan
-        val = ' '.join(row.astype('str'))
-        val = val.strip()
-        return val
-
-    data['author_wiki'] = tmp.apply(quick_combine, axis = 1)
-    
-    data.publisher_wiki = data.publisher_wiki.apply(clean_wiki_publisher)
-    data.author_ia = data.author_ia.apply(clean_ia_author)
-    data.publisher_ia = data.publisher_ia.apply(clean_wiki_publisher)
-    data.author_wiki = data.author_wiki.apply(clean_author_wiki)
-    data.title_ia = data.title_ia.apply(clean_title)
+    if 'author_wiki' not in data.columns:
+        #frames not built by assemble_candidates, with the citation's author fields as separate columns
+        columns = [column for column in data.columns if column in AUTHOR_FIELDS]
+        rows = data[columns].to_dict('records') if columns else [{}] * len(data)
+        data['author_wiki'] = [combine_wiki_authors(row) for row in rows]
+
+    data.publisher_wiki = clean_column(data.publisher_wiki, clean_wiki_publisher)
+    data.author_ia = clean_column(data.author_ia, clean_ia_author)
+    data.publisher_ia = clean_column(data.publisher_ia, clean_wiki_publisher)
+    data.author_wiki = clean_column(data.author_wiki, clean_author_wiki)
+    data.title_ia = clean_column(data.title_ia, clean_title)
 
     def quick_date_clean(date):
         if isinstance(date, str) and len(date)>4:
@@ -281,73 +650,3 @@ def clean_data(data):
     data.date_ia = data.date_ia.apply(quick_date_clean)
     data.drop(columns='year_ia', inplace=True)
     return data
-
-def create_features(data):
-    assert isinstance(data, pd.DataFrame)
-    assert not data.empty
-    
-    #lev distance for title
-    data['title_match'] = get_lev_distance_or_NA(data, ['title_ia', 'title_wiki'])
-
-    # using partial matching because title_ia is usually more descriptive
-    data['title_match_partial'] = get_lev_distance_or_NA(data, ['title_wiki', 'title_ia'], partial = True, sort = True)
-
-    #for author
-    data.author_ia = data.author_ia.astype('str')
-    data.author_wiki = data.author_wiki.astype('str')
-
-    for var in ['author_ia', 'author_wiki']:
-        data[var] = data[var].replace({'nan': np.nan})
-
-    data['author_match'] = get_lev_distance_or_NA(data, ['author_ia', 'author_wiki'])
-
-    data['author_sort'] = get_lev_distance_or_NA(data, ['author_ia', 'author_wiki'], sort = True)
-
-    #for publisher
-    data['publisher_match'] = get_lev_distance_or_NA(data, ['publisher_ia', 'publisher_wiki'])
-
-    # using partial matching because publisher_ia is usually more descriptive
-    data['publisher_match_partial'] = get_lev_distance_or_NA(data, ['publisher_wiki', 'publisher_ia'], partial = True)
-
-    #year
-    def clean(string):
-        if pd.isna(string):
-            return np.nan
-        string = str(string)
-        if any(char.isdigit() for char in string) == False:
-            return np.nan
-        string = re.subn(r'\.[0-9]+',"",string)[0]
-        string = re.subn(r'\.',"",string)[0]
-        if string:
-            try:
-                return int(''.join(filter(str.isdigit, string)))
-            except:
-                print(string)
-        else:
-            return np.nan
-
-    data['year_wiki'] = data.date_wiki.apply(clean)
-    data.date_ia = data.date_ia.apply(clean)
-
-    year_res = []
-    for i in range(data.shape[0]):
-        val1 = data.date_ia.iloc[i]
-        val2 = data.year_wiki.iloc[i]
-        if val1 and val2:
-            year_res.append(float(val1) == float(val2))
-        else:
-            year_res.append(np.nan)
-
-    data['year_match'] = year_res
-
-    #year NA
-    data['year_NA'] = [np.where(pd.isna(data.year_wiki.iloc[i]) or pd.isna(data.date_ia.iloc[i]), 1, 0) for i in range(data.shape[0])]
-
-    #Author NA
-    data['author_NA'] = [np.where(pd.isna(data.author_ia.iloc[i]) or pd.isna(data.author_wiki.iloc[i]), 1, 0) for i in range(data.shape[0])]
-
-    #Publisher NA
-    data['publisher_NA'] = [np.where(pd.isna(data.publisher_ia.iloc[i]) or pd.isna(data.publisher_wiki.iloc[i]), 1, 0) for i in range(data.shape[0])]
-    
-    return data
-
@@ -1,106 +1,357 @@
-from utils import get_results, parse_cite_book, clean_data, create_features, pandas_row_to_dict
+from utils import direct_records, title_records, parse_cite_book, get_session, configure_logging
+from stats import citation, counting_responses, stage
+import math
+import os
 import time
 import logging
 import pickle
-import numpy as np
 
-def get_match(config, cite_string, cap = 500, log_level = "info", return_dataframe = False, all_results = False):
+KEYS_TO_KEEP = [
+    'title',
+    'last',
+    'first',
+    'first1',
+    'last1',
+    'first2',
+    'last2',
+    'date',
+    'publisher',
+    'url',
+    'isbn'
+]
+
+#columns the model was originally fit on
+MODEL_FEATURES = ['title_match','author_match', 'publisher_match', 'year_match', 'year_NA', 'author_NA', 'publisher_NA', 'title_match_partial', 'publisher_match_partial', 'author_sort']
+
+#the pickled model shipped next to this file
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'finalized_model.sav')
+
+#the trees of MODEL_PATH as NumPy arrays, written by trees.py
+TREES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'finalized_model_trees')
+
+_loaded_models = {}
+_model_versions = {}
+
+def load_model(filename = MODEL_PATH):
     '''
     description:
-        Function to return matched results of Internet Archive API for books given a wikipedia book citation.
+        Loads the model once per filename and keeps it in memory for later calls. MODEL_PATH is served
+        from the export in TREES_PATH when that was made from the same file, so neither pickle nor
+        scikit-learn is needed. Otherwise the pickle is loaded.
     inputs:
-        config: This is a dictionary as is setup in the Internet Archive API. This dictionary contains API keys.
-        cite_string: a string of the full wikipedia book citation. Brackets included.
-        return_dataframe: The default return is a dict of results, but can return pandas dataframe depending on use case
-        all_results: The default is to return only matches, but will return all queries -matched and unmatched- if set to True.
+        filename: path to a pickled model, or a directory written by trees.py.
     output:
-        python dictionary of either each match or of all api results given function parameters. Default returns matches only.
+        the fitted model, or a trees.TreeModel that predicts the same.
     '''
-    
-    start = time.time()
-    
+    if filename not in _loaded_models:
+        from trees import TreeModel, file_hash
+
+        model = None
+        if os.path.isdir(filename):
+            model = TreeModel(filename)
+        elif filename == MODEL_PATH and os.path.isdir(TREES_PATH):
+            model = TreeModel(TREES_PATH)
+            if model.source_sha256 != file_hash(filename):
+                logging.warning(f'{TREES_PATH} was exported from another {filename}, run trees.py again. Loading the pickle.')
+                model = None
+        if model is None:
+            with open(filename, 'rb') as f:
+                model = pickle.load(f)
+        _loaded_models[filename] = model
+    return _loaded_models[filename]
+
+def model_version(filename = MODEL_PATH):
+    '''
+    description:
+        Version of a model, the sha256 of its pickle. Kept per filename, like load_model.
+    inputs:
+        filename: path to a pickled model, or a directory written by trees.py, which has the version of the pickle it was exported from.
+    output:
+        the version as a hex string.
+    '''
+    if filename not in _model_versions:
+        from trees import TreeModel, file_hash
+        _model_versions[filename] = TreeModel(filename).source_sha256 if os.path.isdir(filename) else file_hash(filename)
+    return _model_versions[filename]
+
+def set_log_level(log_level):
     if log_level == "error":
-        logging.basicConfig(level=logging.ERROR)
         log = logging.ERROR
     elif log_level == "info":
-        logging.basicConfig(level=logging.INFO)
         log = logging.INFO
     elif log_level == "debug":
-        logging.basicConfig(level=logging.DEBUG)
         log = logging.DEBUG
     elif log_level == "warning":
-        logging.basicConfig(level=logging.WARNING)
         log = logging.WARNING
     elif log_level == "critical":
-        logging.basicConfig(level=logging.CRITICAL)
         log = logging.CRITICAL
     else:
         raise Exception("Please set the log level to an accepted value: [error, info, debug, warning, critical]")
-    
-    keys_to_keep = [
-        'title',
-        'last',
-        'first',
-        'first1',
-        'last1',
-        'first2',
-        'last2',
-        'date',
-        'publisher',
-        'url'
-    ]
-    cite_book_dict = parse_cite_book(cite_string, keys_to_keep)
-    
+    configure_logging(log)
+    return log
+
+def parse_citation(cite_string):
+    cite_book_dict = parse_cite_book(cite_string, KEYS_TO_KEEP)
+
     if 'date_wiki' not in cite_book_dict.keys():
-        cite_book_dict['date_wiki'] = np.nan
-    
+        cite_book_dict['date_wiki'] = math.nan
+
     if 'publisher_wiki' not in cite_book_dict.keys():
-        cite_book_dict['publisher_wiki'] = np.nan
-    
-    data = get_results(config, cite_book_dict, cap, log)
-    if data.empty:
-        logging.warn("No results. Returning None Object.")
-        return None
-    
-    data = clean_data(data)
-    
-    data.reset_index(inplace=True, drop=True)
-    ia_links = data['url_ia']
-    
-    data = create_features(data)
-    
-    #filter columns to those that were originally fit
-    to_predict = data[['title_match','author_match', 'publisher_match', 'year_match', 'year_NA', 'author_NA', 'publisher_NA', 'title_match_partial', 'publisher_match_partial', 'author_sort']].copy()
-    
-    filename = 'finalized_model.sav'
-    loaded_model = pickle.load(open(filename, 'rb'))
-    data['match'] = loaded_model.predict(to_predict)
-    data['match'] = data['match'].astype('bool')
-    data['url_ia'] = ia_links
-    
-    results = data
-    results['input_citation'] = cite_string
-    if not all_results:
-        results = results.query('match == True')
-    
-    results = results[['title_ia', 'author_ia', 'publisher_ia', 'date_ia', 'url_ia', 'input_citation', 'match']]
-    
-    there_are_matches = results.query('match == True').empty
-    num_matches = results.query('match == True').shape[0]
-    
-    if there_are_matches:
-        logging.info("There were no matches present.")
-        if not all_results:
-            return None
-    
+        cite_book_dict['publisher_wiki'] = math.nan
+
+    return cite_book_dict
+
+def stored_entry(candidates, features, fetched):
+    '''
+    description:
+        The store.ResultStore entry of one citation.
+    inputs:
+        candidates: the citation's scored core.Candidate records, empty when it has none.
+        features: their feature matrix, see core.score_citations.
+        fetched: time the candidates were looked up.
+    output:
+        dict of the candidate identifiers, output columns, feature vectors and predictions, and the model version.
+    '''
+    from store import STORED_COLUMNS
+
+    exp = {'candidates' : [], 'rows' : {}, 'feature_names' : MODEL_FEATURES, 'features' : [], 'match' : [], 'model_version' : model_version(), 'fetched' : fetched}
+    if candidates:
+        outputs = [candidate.to_dict(None, any(candidate.search_steps for candidate in candidates)) for candidate in candidates]
+        exp['candidates'] = [candidate.url.rsplit('/', 1)[-1] if isinstance(candidate.url, str) else None for candidate in candidates]
+        exp['rows'] = dict((column, [output[column] for output in outputs]) for column in STORED_COLUMNS if column in outputs[0])
+        exp['features'] = features.tolist()
+        exp['match'] = [candidate.match for candidate in candidates]
+    return exp
+
+def store_key(key, cap, retrieval, blocker, refine, refine_target, direct_lookup):
+    '''
+    description:
+        The store.ResultStore key of a citation: its canonical.citation_key followed by the get_matches settings that
+        change which candidates are found, so a run with other settings does not get an earlier run's results.
+    inputs:
+        key: canonical.citation_key of the citation.
+        cap, retrieval, blocker, refine, refine_target, direct_lookup: as for get_matches.
+    output:
+        string key.
+    '''
+    blocking = None if blocker is None else sorted(vars(blocker).items())
+    target = min(refine_target or cap, cap) if refine else None
+    return f'{key}|cap={cap}|retrieval={retrieval}|blocker={blocking}|refine_target={target}|direct_lookup={direct_lookup}'
+
+def restore_results(store, keys, cite_strings, all_results = False, return_dataframe = False, stats = None):
+    '''
+    description:
+        Looks citations up in a store.ResultStore. Entries of another model version are predicted again from
+        their stored features, in one pass, and written back.
+    inputs:
+        store: the store.ResultStore.
+        keys: dict of citation number to store_key, for the citations to look up.
+        cite_strings: the citations, numbered as in keys.
+    output:
+        dict of citation number to output, shaped like get_match's, for the citations with a fresh entry.
+    '''
+    import numpy as np
+    from core import Candidate, format_candidates, score
+
+    entries = {}
+    for i, key in keys.items():
+        entry = store.get(key)
+        if entry is not None and entry['feature_names'] == MODEL_FEATURES:
+            entries[i] = entry
+
+    version = model_version()
+    outdated = [i for i, entry in entries.items() if entry['model_version'] != version and entry['features']]
+    if outdated:
+        features = np.array([row for i in outdated for row in entries[i]['features']], dtype = float)
+        with stage(stats, 'model_load'):
+            loaded_model = load_model()
+        with stage(stats, 'predict'):
+            predicted = score(loaded_model, features)[1]
+        start = 0
+        for i in outdated:
+            entry = entries[i]
+            entry['match'] = predicted[start : start + len(entry['features'])].tolist()
+            entry['model_version'] = version
+            start += len(entry['features'])
+            store.update_prediction(entry['key'], entry)
+
     exp = {}
-    for i in range(results.shape[0]):
-        exp[f'match{i+1}'] = pandas_row_to_dict(i, results)
-    
-    logging.info(f"Success. {num_matches} total matches. Returning results.")
+    for i, entry in entries.items():
+        if not entry['candidates']:
+            exp[i] = None
+            continue
+        rows = entry['rows']
+        candidates = [Candidate.from_output(dict((column, values[n]) for column, values in rows.items()), match) for n, match in enumerate(entry['match'])]
+        exp[i] = format_candidates(candidates, cite_strings[i], all_results, return_dataframe)
+    return exp
+
+def get_matches(config, cite_strings, cap = 500, log_level = "info", return_dataframe = False, all_results = False, workers = 1, retrieval = 'item', cache = None, search_cache = None, session = None, direct_lookup = True, blocker = None, refine = True, refine_target = None, stats = None, predictor = None, dedupe = None, store = None):
+    '''
+    description:
+        Batch version of get_match. Opens one Internet Archive session and loads the model once, then
+        cleans, featurizes and predicts on the candidates of every citation in the batch together, see core.py.
+    inputs:
+        config: This is a dictionary as is setup in the Internet Archive API. This dictionary contains API keys.
+        cite_strings: a list or iterator of full wikipedia book citation strings. Brackets included.
+        return_dataframe: The default return is a dict of results per citation, but can return pandas dataframes.
+        all_results: The default is to return only matches, but will return all queries -matched and unmatched- if set to True.
+        workers: number of Internet Archive metadata requests to run concurrently for each citation.
+        retrieval: 'item' pulls full metadata for every search result, 'search' reads the candidate fields from the search results.
+        cache: optional item metadata cache, e.g. cache.DiskCache, checked before every metadata request.
+        search_cache: optional cache.SearchCache reused for citations whose cleaned titles give the same query.
+        session: optional open Internet Archive session to reuse across batches. The pooled session of
+            session.default_manager for config is used when None.
+        direct_lookup: first score only the item of an archive.org 'url' or the items of the 'isbn' of a citation,
+            and search by title only for citations where that finds no match.
+        blocker: optional blocking.Blocker that prunes title search results before their metadata is pulled and scored,
+            and pages through searches with cap results or more instead of skipping them.
+        refine: narrow title searches that find refine_target (cap when None) results or more with the author's surname,
+            the year and the publisher. The queries tried are returned as 'search_steps_ia' of every result.
+        stats: optional stats.MatchStats that collects stage timings and counters, and passes a record per citation to its callback.
+            Use one per concurrent caller.
+        predictor: optional function used in place of core.score_citations, given the core.CitationFields and
+            core.Candidate records of the citations to score, e.g. service.Batcher.predict.
+        dedupe: optional canonical.Deduplicator. Only the first citation of each canonical.citation_key is looked up,
+            the others, in this batch or in later ones the Deduplicator is passed to, get its result.
+        store: optional store.ResultStore. Citations with a fresh entry are answered from it without any request,
+            predicted again from their stored features when the model changed. The others are looked up and stored.
+            Entries are kept per citation and per cap, retrieval, blocker, refine target and direct_lookup, see store_key.
+    output:
+        list with one entry per citation, in input order, each shaped like the output of get_match.
+        A request that fails after its retries raises session.IAServiceError rather than returning None.
+    '''
+
+    from core import CitationFields, build_candidates, format_candidates, score_citations
+
+    start = time.time()
+
+    set_log_level(log_level)
+
+    cite_strings = list(cite_strings)
+    s = session if session is not None else get_session(config)
+    caches = [c for c in (cache, search_cache) if c is not None]
+
+    #per citation stats records, filled by lookup and handed to the callback once the batch is scored
+    records = {}
+    def lookup(i, find):
+        '''runs find() for citation i, with its time and counters going to the citation's record'''
+        with citation(stats, i, caches, records.get(i)) as record:
+            if record is not None:
+                records[i] = record
+            return find()
+
+    def parse(cite_string):
+        with stage(stats, 'parse'):
+            return parse_citation(cite_string)
+
+    exp = [None] * len(cite_strings)
+    #scored candidates and feature matrix of each looked up citation, for the store
+    scored = {}
+
+    def score_found(found):
+        '''scores found, citation number -> (query, metadata records[, search steps]), and fills exp. output : the citations with a match'''
+        if not found:
+            return set()
+        numbers = list(found)
+        with stage(stats, 'clean'):
+            fields = [CitationFields(cite_book_dicts[i]) for i in numbers]
+            groups = [build_candidates(*found[i]) for i in numbers]
+        matrices = (predictor or score_citations)(fields, groups, stats = stats)
+        matched = set()
+        for i, candidates, X in zip(numbers, groups, matrices):
+            if any(candidate.match for candidate in candidates):
+                matched.add(i)
+            if stats is not None:
+                stats.count('candidates_scored', len(candidates), records[i])
+            if store is not None:
+                scored[i] = (candidates, X)
+            exp[i] = format_candidates(candidates, cite_strings[i], all_results, return_dataframe)
+        return matched
+
+    #every response of the session while the batch runs counts as an API call of the citation being looked up
+    with counting_responses(stats, s):
+        cite_book_dicts = [lookup(i, lambda: parse(cite_string)) for i, cite_string in enumerate(cite_strings)]
+        to_search = list(range(len(cite_strings)))
+        if dedupe is not None or store is not None:
+            from canonical import citation_key
+            keys = [citation_key(cite_book_dict, direct_lookup) for cite_book_dict in cite_book_dicts]
+        if dedupe is not None:
+            to_search = dedupe.select(keys, cite_strings, exp)
+            looked_up = list(to_search)
+        if store is not None:
+            store_keys = dict((i, store_key(keys[i], cap, retrieval, blocker, refine, refine_target, direct_lookup)) for i in to_search)
+            restored = restore_results(store, store_keys, cite_strings, all_results, return_dataframe, stats)
+            for i, result in restored.items():
+                exp[i] = result
+            to_search = [i for i in to_search if i not in restored]
+            fetched = list(to_search)
+            fetch_time = time.time()
+
+        if direct_lookup:
+            found = {}
+            for i in to_search:
+                result = lookup(i, lambda: direct_records(s, cite_book_dicts[i], cap, workers, retrieval, cache, search_cache, stats))
+                if result is not None and result[1]:
+                    found[i] = result
+            matched = score_found(found)
+            logging.info(f"{len(matched)} of {len(cite_strings)} citations matched by archive.org url or ISBN.")
+            to_search = [i for i in to_search if i not in matched]
+
+        found = {}
+        for i in to_search:
+            exp[i] = None
+            scored.pop(i, None)
+            result = lookup(i, lambda: title_records(s, cite_book_dicts[i], cap, workers, retrieval, cache = cache, search_cache = search_cache, blocker = blocker, refine = refine, refine_target = refine_target, stats = stats))
+            if result is None or not result[1]:
+                logging.warning("No results. Returning None Object.")
+                continue
+            #query, metadata records and the refinement steps, None when the search was not refined
+            found[i] = (result[0], result[1], result[2] or None)
+        score_found(found)
+
+        if store is not None:
+            for i in fetched:
+                store.put(store_keys[i], stored_entry(*scored.get(i, ([], None)), fetch_time))
+        if dedupe is not None:
+            dedupe.fan_out(keys, cite_strings, exp, looked_up)
+            if stats is not None:
+                for i in set(range(len(cite_strings))) - set(looked_up):
+                    stats.count('deduplicated', 1, records[i])
+
+    if stats is not None:
+        for i in sorted(records):
+            stats.finish_citation(records[i])
+
     end = time.time()
-    logging.info(f"Process took {round((end - start)/60, 2)} minutes total.")
-    
-    if return_dataframe:
-        return results
+    logging.info(f"Batch of {len(cite_strings)} citations took {round((end - start)/60, 2)} minutes total.")
+
     return exp
+
+def get_match(config, cite_string, cap = 500, log_level = "info", return_dataframe = False, all_results = False, workers = 1, retrieval = 'item', cache = None, search_cache = None, direct_lookup = True, blocker = None, refine = True, refine_target = None, stats = None, stop_threshold = None, session = None):
+    '''
+    description:
+        Function to return matched results of Internet Archive API for books given a wikipedia book citation.
+        Runs on core.py, without pandas unless return_dataframe is True.
+    inputs:
+        config: This is a dictionary as is setup in the Internet Archive API. This dictionary contains API keys.
+        cite_string: a string of the full wikipedia book citation. Brackets included.
+        return_dataframe: The default return is a dict of results, but can return pandas dataframe depending on use case
+        all_results: The default is to return only matches, but will return all queries -matched and unmatched- if set to True.
+        workers: number of Internet Archive metadata requests to run concurrently. The default pulls them one at a time.
+        retrieval: 'item' pulls full metadata for every search result, 'search' reads the candidate fields from the search results.
+        cache: optional item metadata cache, e.g. cache.DiskCache, checked before every metadata request.
+        search_cache: optional cache.SearchCache reused for citations whose cleaned titles give the same query.
+        direct_lookup: try the archive.org 'url' or the 'isbn' of the citation before searching by title.
+        blocker: optional blocking.Blocker that prunes search results before scoring and pages through searches over cap.
+        refine: narrow title searches over refine_target (cap when None) results with the author, year and publisher.
+        stats: optional stats.MatchStats that collects stage timings and counters, see get_matches.
+        stop_threshold: stop pulling metadata for further candidates once one has a match probability over this, see core.iter_matches.
+        session: optional requests session to reuse, see get_matches.
+    output:
+        python dictionary of either each match or of all api results given function parameters. Default returns matches only.
+    '''
+    from core import match_citation
+
+    set_log_level(log_level)
+    return match_citation(config, cite_string, all_results, return_dataframe, session = session, stats = stats, cap = cap, workers = workers, retrieval = retrieval, cache = cache, search_cache = search_cache,
+        direct_lookup = direct_lookup, blocker = blocker, refine = refine, refine_target = refine_target, stop_threshold = stop_threshold)